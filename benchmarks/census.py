@@ -0,0 +1,72 @@
+"""Census engine against the per-month SQL it can stand in for.
+
+Loads a Census for a year once, then for every month compares the inventory
+rows of reports.infection_surveillance.infection_cohort with
+Census.inventory (same animals, stage dates, stages and intakes) and times
+both. Populations and stage counts on a weekly and a daily grid show the
+dates the census answers without another database hit, and the stage counts
+of every date must add up to its population. Last, the whole year of
+infection_cohort_range (SQL) against infection_cohort_census, the range mode
+the infection reports use with CENSUS_INVENTORY.
+
+Usage: python -m benchmarks.census [year]
+"""
+import sys
+import time
+from datetime import date
+import pandas as pd
+from reports.infection_surveillance import infection_cohort, infection_cohort_census, infection_cohort_range
+from utils.census import Census
+
+COLUMNS = ["animalid", "stagedate", "stage", "intakedate"]
+
+
+def same_rows(sql: pd.DataFrame, census: pd.DataFrame) -> bool:
+    left = sql[COLUMNS].sort_values("animalid").reset_index(drop=True).astype({"stage": str})
+    right = census[COLUMNS].sort_values("animalid").reset_index(drop=True).astype({"stage": str})
+    return left.equals(right)
+
+
+def main(year: int) -> None:
+    start = time.perf_counter()
+    census = Census.load(date(year, 1, 1), date(year, 12, 31))
+    print(f"Census load: {time.perf_counter() - start:.2f}s, {len(census.visits)} visits, "
+          f"{len(census.statuses)} stage transitions")
+    sql_total = census_total = 0.0
+    for month in range(1, 13):
+        start = time.perf_counter()
+        sql = infection_cohort(year, month)
+        sql_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        inventory = census.inventory(date(year, month, 1))
+        census_seconds = time.perf_counter() - start
+        sql_total += sql_seconds
+        census_total += census_seconds
+        match = same_rows(sql[sql["stage"] != "Intake"], inventory)
+        print(f"  {year}-{month:02}: SQL {sql_seconds:6.2f}s, census {census_seconds:6.2f}s, "
+              f"{len(inventory)} animals, {'same rows' if match else 'DIFFERENT'}")
+    print(f"Monthly inventory: SQL {sql_total:.2f}s, census {census_total:.2f}s")
+    for label, freq in (("weekly", "W-MON"), ("daily", "D")):
+        dates = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq=freq)
+        start = time.perf_counter()
+        population = census.population(dates, by="species")
+        stages = census.stages(dates)
+        seconds = time.perf_counter() - start
+        #Every animal in care is in exactly one stage
+        off = (stages.sum(axis=1) != population.sum(axis=1)).sum()
+        print(f"Population and stages, {label} ({len(dates)} dates): {seconds:.2f}s, "
+              f"{'stages add up to the population' if not off else f'stages differ from the population on {off} dates'}")
+    start = time.perf_counter()
+    sql = infection_cohort_range((year, 1), (year, 12))
+    sql_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    cohort = infection_cohort_census((year, 1), (year, 12))
+    census_seconds = time.perf_counter() - start
+    key = ["Referencedate", "animalid", "stage"]
+    match = sql.sort_values(key, ignore_index=True).equals(cohort.sort_values(key, ignore_index=True))
+    print(f"Cohort range: SQL {sql_seconds:.2f}s, census {census_seconds:.2f}s, {len(cohort)} rows, "
+          f"{'same rows' if match else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2024)
@@ -0,0 +1,89 @@
+"""Time per workbook of the report Excel output, COM autofit against widths set during the write.
+
+Writes a two-sheet workbook shaped like save_to_excel's (IDs, names, dates,
+low-cardinality strings) both ways: the old path writes with xlsxwriter and
+reopens the file in Excel to run Columns.AutoFit(), the new one sizes the
+columns from the DataFrame with utils.excel.write_sheet. The COM path needs
+Windows with Excel installed and is skipped elsewhere.
+
+Usage: python -m benchmarks.excel_autofit [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from utils.excel import column_widths, write_sheet
+
+
+def build_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    intake = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 525600, rows), unit="min")
+    return pd.DataFrame({
+        "animalid": np.arange(rows) + 50000000,
+        "name": np.char.add("Pet ", np.arange(rows).astype(str)),
+        "species": rng.choice(["Cat", "Dog"], rows),
+        "dateofbirth": (intake - pd.to_timedelta(rng.integers(30, 5000, rows), unit="D")).date,
+        "intakedate": intake,
+        "Intaketype": rng.choice(["TransferIn", "Stray", "OwnerSurrender", "[Return]"], rows),
+        "Condition": rng.choice(["Diarrhea", "Diarrhea, acute, nonspecific",
+                                 "Diarrhea and vomiting, acute, nonspecific"], rows),
+        "Agegroup": rng.choice(["Adult", "Kitten", "Puppy"], rows),
+    })
+
+
+def com_path(df: pd.DataFrame, path: str) -> None:
+    """save_to_excel before: plain write, then Excel opens the file to autofit"""
+    import win32com.client as win32
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        df.to_excel(writer, header=True, index=False, sheet_name="Denominator")
+        df.to_excel(writer, header=True, index=False, sheet_name="Numerator")
+    excel = win32.gencache.EnsureDispatch("Excel.Application")
+    wb = excel.Workbooks.Open(os.path.abspath(path))
+    wb.Worksheets("Denominator").Columns.AutoFit()
+    wb.Worksheets("Numerator").Columns.AutoFit()
+    wb.Save()
+    excel.Application.Quit()
+
+
+def write_path(df: pd.DataFrame, path: str) -> None:
+    """save_to_excel now: widths computed from the frame and set during the write"""
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        write_sheet(writer, df, "Denominator")
+        write_sheet(writer, df, "Numerator")
+
+
+def plain_path(df: pd.DataFrame, path: str) -> None:
+    """The write alone, to show what the width calculation adds"""
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        df.to_excel(writer, header=True, index=False, sheet_name="Denominator")
+        df.to_excel(writer, header=True, index=False, sheet_name="Numerator")
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(rows: int) -> None:
+    df = build_frame(rows)
+    print(f"rows per sheet: {rows}")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "report.xlsx")
+        print(f"column_widths only:         {timed(lambda: column_widths(df)):.3f}s")
+        print(f"write, no autofit:          {timed(lambda: plain_path(df, path)):.3f}s per workbook")
+        print(f"write_sheet (set_column):   {timed(lambda: write_path(df, path)):.3f}s per workbook")
+        try:
+            print(f"write + COM Columns.AutoFit: {timed(lambda: com_path(df, path)):.3f}s per workbook")
+        except ImportError:
+            print("write + COM Columns.AutoFit: skipped, needs Windows with Excel")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,56 @@
+"""Peak memory of writing a raw-data workbook, DataFrame.to_excel against stream_to_excel.
+
+Writes the same frame at growing row counts both ways and records the peak
+Python allocation with tracemalloc. stream_to_excel gets a generator of
+chunks, as it would from stream_query, so only one chunk exists at a time and
+its peak should stay flat while to_excel grows with the row count. Exits
+non-zero if the streaming peak at the largest size is more than 1.5x the
+peak at the smallest.
+
+Usage: python -m benchmarks.excel_streaming [rows]
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+import pandas as pd
+from benchmarks.excel_autofit import build_frame
+from utils.utils import stream_to_excel
+
+chunksize = 5000
+
+
+def chunks(rows: int):
+    """Frames of `chunksize` rows built on demand, like a fetch stream"""
+    for start in range(0, rows, chunksize):
+        df = build_frame(min(chunksize, rows - start))
+        df["animalid"] += start
+        yield df
+
+
+def peak_mib(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main(rows: int) -> int:
+    sizes = [rows // 4, rows // 2, rows]
+    streamed = []
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "raw_data.xlsx")
+        for size in sizes:
+            to_excel = peak_mib(lambda: pd.concat(chunks(size), ignore_index=True).to_excel(path, index=False))
+            stream = peak_mib(lambda: stream_to_excel(path, {"Sheet1": chunks(size)}))
+            streamed.append(stream)
+            print(f"{size:>8} rows  to_excel: {to_excel:7.1f} MiB  stream_to_excel: {stream:6.1f} MiB")
+    flat = streamed[-1] <= 1.5 * streamed[0]
+    print("stream_to_excel peak is flat" if flat else "stream_to_excel peak grows with the row count")
+    return 0 if flat else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 40000))
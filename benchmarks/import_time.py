@@ -0,0 +1,67 @@
+"""Import cost of starting a run, measured with python -X importtime.
+
+Each case runs in a fresh interpreter and reports the cumulative import time
+of its statement, the slowest modules it pulled in, and the wall time of the
+whole process. `import main` and `main.py --help` should stay in the tens of
+milliseconds: the reports, pandas and the settings only load once a run
+starts, and a one-report run only imports that report. The settings case is
+what every report pays to read .env (pydantic_settings, at import).
+
+Usage: python -m benchmarks.import_time [top]
+"""
+import os
+import subprocess
+import sys
+import time
+
+CASES = [
+    ("import main", ["-c", "import main"]),
+    ("main.py --help", ["main.py", "--help"]),
+    ("settings (.env)", ["-c", "import environment.settings"]),
+    ("one report (parvo)", ["-c", "import main, importlib; importlib.import_module(main.REPORTS['parvo'])"]),
+    ("every report", ["-c", "import main, importlib; [importlib.import_module(m) for m in main.REPORTS.values()]"]),
+]
+
+
+def importtime(args: list) -> tuple:
+    """(wall seconds, {module: cumulative microseconds}, raw report) of one fresh interpreter"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=root, env=env,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return wall, modules, result.stderr
+
+
+def top_level(stderr: str) -> int:
+    """Sum of the cumulative time of the imports made directly by the statement"""
+    total = 0
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            #Nested imports are indented by two spaces per level
+            if not name[1:].startswith(" "):
+                total += int(cumulative)
+    return total
+
+
+def main(top: int) -> None:
+    for label, args in CASES:
+        wall, modules, stderr = importtime(args)
+        print(f"{label:<20} imports {top_level(stderr) / 1000:7.1f} ms, process {wall * 1000:7.1f} ms")
+        slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+        for name, cumulative in slowest:
+            print(f"    {cumulative / 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
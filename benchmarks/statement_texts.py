@@ -0,0 +1,88 @@
+"""Counts the distinct statement texts the monthly extractors send to the database.
+
+Every extractor is run for each month of a year through a recording wrapper around
+the pooled connections. "before" is the number of distinct texts with the bound
+parameters inlined (what the old f-string queries sent), "after" is the number of
+distinct texts actually sent with `?` placeholders. Each distinct text is one plan
+the server has to compile. Runs offline against the stand-in with DB_BACKEND=duckdb
+(see database.standin).
+
+Usage: python -m benchmarks.statement_texts [year]
+"""
+import sys
+import threading
+from database import ms_sql_connection
+
+
+class RecordingCursor:
+    def __init__(self, cursor, log):
+        self._cursor = cursor
+        self._log = log
+
+    def execute(self, sql, params=()):
+        self._log.append((sql, tuple(params or ())))
+        return self._cursor.execute(sql, params or ())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordingConnection:
+    def __init__(self, conn, log):
+        self._conn = conn
+        self._log = log
+
+    def cursor(self):
+        return RecordingCursor(self._conn.cursor(), self._log)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def inline_params(sql: str, params: tuple) -> str:
+    """Rebuilds the text an f-string query would have produced"""
+    for value in params:
+        sql = sql.replace("?", f"'{value}'", 1)
+    return sql
+
+
+def extractors():
+    from reports import (infection_surveillance, kitten_report, dental_report, incidence_report,
+                         los_shelter_report, sx_wait_time)
+    return [
+        infection_surveillance.infection_numerator,
+        infection_surveillance.infection_cohort, infection_surveillance.early_onset,
+        kitten_report.extraction,
+        dental_report.numerator_extraction, dental_report.denominator_extraction,
+        incidence_report.numerator_extraction, incidence_report.denominator_extraction,
+        los_shelter_report.los_outcome_script, los_shelter_report.los_nonoutcome_script,
+        sx_wait_time.adult_extraction,
+    ]
+
+
+def main(year: int) -> None:
+    log = []
+    lock = threading.Lock()
+    pool = ms_sql_connection.get_pool()
+    connect_fn = pool.connect_fn
+
+    def recording_connect():
+        with lock:
+            return RecordingConnection(connect_fn(), log)
+
+    ms_sql_connection.configure_pool(recording_connect, max_size=pool.max_size)
+    for fetch_fn in extractors():
+        for month in range(1, 13):
+            fetch_fn(year, month)
+
+    #Health checks are not report statements
+    statements = [(sql, params) for sql, params in log if sql != pool.health_query]
+    before = {inline_params(sql, params) for sql, params in statements}
+    after = {sql for sql, _ in statements}
+    print(f"statements executed: {len(statements)}")
+    print(f"distinct texts before (inlined): {len(before)}")
+    print(f"distinct texts after (bound):    {len(after)}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2024)
@@ -0,0 +1,231 @@
+import re
+import threading
+from environment.settings import config
+
+
+def mssql_connect():
+    """Opens a new pyodbc connection to the reporting database"""
+    import pyodbc
+    return pyodbc.connect(
+        'Driver={ODBC Driver 17 for SQL Server};'
+        'Server=localhost;'
+        f'Database={config.MS_SQL_DB};'
+        'Trusted_Connection=yes;'
+    )
+
+
+#String literals, line comments and block comments, matched left to right so a
+#quote inside a comment (or -- inside a literal) is never taken for the other
+_TOKENS = re.compile(r"('(?:[^']|'')*')|(--[^\n]*)|(/\*.*?\*/)", re.S)
+_DECLARE = re.compile(r"DECLARE\s+@(\w+)\s+(\w+)\s*=\s*([^;]*);", re.I)
+_DATE_PARTS = {"d": "day", "dd": "day", "day": "day", "wk": "week", "ww": "week",
+               "week": "week", "m": "month", "mm": "month", "month": "month",
+               "yy": "year", "yyyy": "year", "year": "year"}
+_TYPES = {"datetime": "TIMESTAMP", "datetime2": "TIMESTAMP", "smalldatetime": "TIMESTAMP",
+          "int": "INTEGER", "bit": "BOOLEAN", "nvarchar": "VARCHAR"}
+
+#T-SQL functions the report queries use, as DuckDB macros
+_SHIMS = [
+    #T-SQL counts the weeks as Sundays crossed, DuckDB as whole weeks between
+    "CREATE OR REPLACE TEMP MACRO tsql_datediff(part, a, b) AS CASE part "
+    "WHEN 'week' THEN CAST(floor(date_diff('day', DATE '1970-01-04', CAST(b AS DATE)) / 7) "
+    "- floor(date_diff('day', DATE '1970-01-04', CAST(a AS DATE)) / 7) AS BIGINT) "
+    "ELSE date_diff(part, CAST(a AS TIMESTAMP), CAST(b AS TIMESTAMP)) END",
+    "CREATE OR REPLACE TEMP MACRO tsql_dateadd(part, n, d) AS CASE part "
+    "WHEN 'year' THEN CAST(d AS TIMESTAMP) + to_years(CAST(n AS INTEGER)) "
+    "WHEN 'month' THEN CAST(d AS TIMESTAMP) + to_months(CAST(n AS INTEGER)) "
+    "WHEN 'week' THEN CAST(d AS TIMESTAMP) + to_weeks(CAST(n AS INTEGER)) "
+    "ELSE CAST(d AS TIMESTAMP) + to_days(CAST(n AS INTEGER)) END",
+    "CREATE OR REPLACE TEMP MACRO eomonth(d) AS last_day(CAST(d AS DATE))",
+    "CREATE OR REPLACE TEMP MACRO getdate() AS CAST(now() AS TIMESTAMP)",
+]
+
+
+def _rewrite_code(sql: str, fn) -> str:
+    """Applies fn to the parts of sql outside string literals and drops comments"""
+    out, pos = [], 0
+    for match in _TOKENS.finditer(sql):
+        out.append(fn(sql[pos:match.start()]))
+        if match.group(1):
+            out.append(match.group(1))
+        pos = match.end()
+    out.append(fn(sql[pos:]))
+    return "".join(out)
+
+
+def _date_part(match) -> str:
+    part = _DATE_PARTS.get(match.group(2).lower(), match.group(2).lower())
+    return f"tsql_{match.group(1).lower()}('{part}',"
+
+
+def _tsql_to_duckdb(code: str) -> str:
+    code = re.sub(r"\bdbo\.", "", code, flags=re.I)
+    code = re.sub(r"\bmaster\.\.spt_values\b", "spt_values", code, flags=re.I)
+    code = re.sub(r"\[(\w+)\]", r'"\1"', code)
+    code = re.sub(r"\bTOP\s*\(\s*100\s*\)\s*PERCENT\b", "", code, flags=re.I)
+    return re.sub(r"\b(DATEDIFF|DATEADD)\s*\(\s*(\w+)\s*,", _date_part, code, flags=re.I)
+
+
+def _keep_column_case(sql: str) -> str:
+    """Aliases bare column references in select lists as written.
+
+    SQL Server names a result column the way the query spells it (Dateofbirth),
+    DuckDB the way the table or CTE defines it (DateOfBirth), and the reports
+    index their DataFrames by the spelling in the query.
+    """
+    #Blank out literals keeping their length so positions map back to sql
+    masked = _TOKENS.sub(lambda m: " " * len(m.group(0)), sql)
+    inserts = []
+    for select in re.finditer(r"\bSELECT\b(\s+DISTINCT\b)?", masked, re.I):
+        depth, start, pos = 0, select.end(), select.end()
+        items = []
+        while pos < len(masked):
+            char = masked[pos]
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth < 0:
+                    break
+            elif depth == 0 and char == ",":
+                items.append((start, pos))
+                start = pos + 1
+            elif depth == 0 and char == ";":
+                break
+            elif depth == 0 and re.match(r"FROM\b", masked[pos:pos + 5], re.I) and not re.match(r"\w", masked[pos - 1]):
+                break
+            pos += 1
+        items.append((start, pos))
+        for item_start, item_end in items:
+            column = re.fullmatch(r"\s*(?:\w+\.)*(\w+)\s*", masked[item_start:item_end])
+            if column and not column.group(1).isdigit():
+                inserts.append((item_start + column.end(1), f' AS "{column.group(1)}"'))
+    for position, alias in sorted(inserts, reverse=True):
+        sql = sql[:position] + alias + sql[position:]
+    return sql
+
+
+def _variables(code: str) -> str:
+    return re.sub(r"@(\w+)", r"getvariable('\1')", code)
+
+
+def translate_tsql(query: str, params=()) -> list:
+    """Rewrites a report query for DuckDB as a list of (statement, params) pairs.
+
+    `DECLARE @X TYPE = value;` headers become SET VARIABLE statements, each
+    taking its share of the `?` parameters in order, and @X references become
+    getvariable('X'). Table prefixes, [quoted] names, TOP (100) PERCENT and
+    N' ' string concatenation are rewritten, bare select-list columns keep
+    the spelling of the query, and DATEDIFF, DATEADD, EOMONTH and GETDATE
+    resolve to the shims installed on every stand-in connection.
+    """
+    query = re.sub(r"\+\s*N?'([^']*)'\s*\+", r"|| '\1' ||", query)
+    #SQL Server ignores trailing blanks in date literals such as '2017-01-01 '
+    query = re.sub(r"'(\d{4}-\d\d-\d\d(?:[ T][\d:.]+)?)\s+'", r"'\1'", query)
+    query = _rewrite_code(query, _tsql_to_duckdb)
+    statements = []
+    for name, kind, value in _DECLARE.findall(query):
+        kind = _TYPES.get(kind.lower(), kind.upper())
+        statements.append(f"SET VARIABLE {name} = CAST({value.strip()} AS {kind})")
+    statements.append(_keep_column_case(_DECLARE.sub("", query)))
+
+    params, pairs = list(params or ()), []
+    for statement in statements:
+        statement = _rewrite_code(statement, _variables)
+        placeholders = _TOKENS.sub("", statement).count("?")
+        pairs.append((statement, params[:placeholders]))
+        params = params[placeholders:]
+    return pairs
+
+
+class DuckDBCursor:
+    """DB-API cursor over a DuckDB connection that accepts the reports' T-SQL"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, query, params=()):
+        for statement, statement_params in translate_tsql(query, params):
+            self._conn.execute(statement, statement_params)
+        return self
+
+    @property
+    def description(self):
+        return self._conn.description
+
+    def fetchone(self):
+        return self._conn.fetchone()
+
+    def fetchmany(self, size: int):
+        return self._conn.fetchmany(size)
+
+    def fetchall(self):
+        return self._conn.fetchall()
+
+    def close(self) -> None:
+        pass
+
+
+class DuckDBConnection:
+    """Pool-facing wrapper of a DuckDB connection with the T-SQL shims installed"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        for shim in _SHIMS:
+            conn.execute(shim)
+
+    def cursor(self) -> DuckDBCursor:
+        #Pooled connections are only used by one thread at a time, so the
+        #connection itself serves as the cursor and keeps the SET VARIABLEs
+        return DuckDBCursor(self._conn)
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SqlServerBackend:
+    """The production reporting database"""
+    name = "mssql"
+
+    def connect(self):
+        return mssql_connect()
+
+
+class DuckDBBackend:
+    """Embedded stand-in database file, see database.standin for the schema.
+
+    The report queries are sent unchanged and translated per statement, so
+    the same extractors run against production and the stand-in.
+    """
+    name = "duckdb"
+
+    def __init__(self, path: str = None):
+        self.path = path or config.STANDIN_DB_PATH
+        self._lock = threading.Lock()
+
+    def connect(self) -> DuckDBConnection:
+        import duckdb
+        #Opening the same file from several threads at once races on the instance cache
+        with self._lock:
+            conn = duckdb.connect(self.path)
+        #DuckDB's TopNWindowElimination (1.5) fails with an InternalException on the
+        #ROW_NUMBER filters of sx_wait_time.adult_extraction; older releases lack the pass
+        optimizers = {name for name, in conn.execute("SELECT name FROM duckdb_optimizers()").fetchall()}
+        if "top_n_window_elimination" in optimizers:
+            conn.execute("SET disabled_optimizers = 'top_n_window_elimination'")
+        return DuckDBConnection(conn)
+
+
+BACKENDS = {backend.name: backend for backend in (SqlServerBackend, DuckDBBackend)}
+
+
+def get_backend(name: str = None, **kwargs):
+    """Returns the backend called `name`, by default the one set in DB_BACKEND"""
+    name = name or config.DB_BACKEND
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown database backend {name!r}, expected one of {sorted(BACKENDS)}") from None
@@ -1,14 +1,245 @@
-import pyodbc
+import queue
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+import numpy as np
 import pandas as pd
 from environment.settings import config
+from database.query_log import query_log
+from database.backends import get_backend, mssql_connect
 
-#Declare db connection 
-conn=pyodbc.connect(
-        'Driver={ODBC Driver 17 for SQL Server};'
-        'Server=localhost;'
-        f'Database={config.MS_SQL_DB};'
-        'Trusted_Connection=yes;'
-    )
 
-def fetch_query(query):
-    return pd.read_sql(query, conn)
\ No newline at end of file
+class ConnectionPool:
+    """Bounded, thread safe pool of database connections.
+
+    Connections are only opened when first borrowed and every idle connection
+    is health checked before it is handed out again. `connect_fn` is the driver:
+    any zero-argument callable returning a DB-API connection, normally the
+    `connect` of a backend from database.backends.
+    """
+
+    def __init__(self, connect_fn=mssql_connect, max_size: int = 4,
+                 health_query: str = "SELECT 1", timeout: float = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.connect_fn = connect_fn
+        self.max_size = max_size
+        self.health_query = health_query
+        self.timeout = timeout
+        #Idle connections, most recently used first so warm connections get reused
+        self._idle = queue.LifoQueue()
+        #One slot per connection that may exist at the same time
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Borrows a healthy connection, opening a new one if none are idle"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available after {self.timeout}s")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect_fn()
+                if self._is_healthy(conn):
+                    return conn
+                #Stale connection (server restart, network drop), replace it
+                self._close_quietly(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard: bool = False) -> None:
+        """Returns a borrowed connection to the pool, or closes it if discard is set"""
+        if discard:
+            self._close_quietly(conn)
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always gives it back"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        """Closes every idle connection. Borrowed connections are closed as they come back"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close_quietly(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the shared pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(connect_fn=get_backend().connect,
+                                       max_size=config.DB_POOL_SIZE)
+    return _pool
+
+
+def configure_pool(connect_fn=None, max_size: int = None, **kwargs) -> ConnectionPool:
+    """Replaces the shared pool, by default with one on the DB_BACKEND backend"""
+    global _pool
+    connect_fn = connect_fn or get_backend().connect
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(connect_fn=connect_fn,
+                               max_size=max_size or config.DB_POOL_SIZE, **kwargs)
+    return _pool
+
+
+def use_backend(name: str, **kwargs) -> ConnectionPool:
+    """Points every report at another backend, e.g. use_backend("duckdb", path="standin.duckdb")"""
+    return configure_pool(get_backend(name, **kwargs).connect)
+
+
+def fetch_query(query, params=None):
+    """Runs a query on a pooled connection and returns the result as a DataFrame.
+
+    Values that change between calls (report dates etc.) should be passed as `?`
+    placeholders in `params` rather than formatted into the text, so the server
+    sees one statement per extractor and reuses its cached plan. Every call is
+    recorded in database.query_log.
+    """
+    return reduce_query(query, params)
+
+
+def _typed_column(values: np.ndarray, kind):
+    """Converts one object column of a fetched batch to the array type named by `kind`"""
+    try:
+        if kind in ("date", "datetime"):
+            return pd.to_datetime(values).to_numpy()
+        if kind in ("int32", "int64"):
+            if pd.isna(values).any():
+                #Nullable integers keep the narrow type instead of falling back to float
+                return pd.array(values, dtype=kind.capitalize())
+            return values.astype(kind)
+        if kind == "float":
+            return values.astype("float64")
+        if kind == "category":
+            return pd.Categorical(values)
+    except (TypeError, ValueError):
+        pass
+    #No hint (or the hint did not fit the data), let pandas infer it like read_sql does
+    series = pd.Series(values, copy=False).infer_objects()
+    if series.dtype == object:
+        first = series.first_valid_index()
+        #read_sql coerces DECIMAL/NUMERIC columns to float, keep doing the same
+        if first is not None and isinstance(series[first], Decimal):
+            return series.astype("float64").to_numpy()
+    return series.to_numpy()
+
+
+def _frame_from_rows(rows, columns, schema=None) -> pd.DataFrame:
+    """Builds a DataFrame column by column from a batch of cursor rows"""
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    kinds = {name.lower(): kind for name, kind in (schema or {}).items()}
+    #One C-level transpose of the batch instead of a Python loop per cell
+    block = np.empty((len(rows), len(columns)), dtype=object)
+    block[:] = rows
+    data = {}
+    for position, name in enumerate(columns):
+        data[name] = _typed_column(block[:, position], kinds.get(name.lower()))
+    return pd.DataFrame(data, copy=False)
+
+
+def stream_query(query, params=None, chunksize: int = None, schema: dict = None):
+    """Yields the result of a query as DataFrames of at most `chunksize` rows.
+
+    Rows are pulled with cursor.fetchmany so only one chunk of raw rows is held
+    at a time. The pooled connection stays borrowed until the generator is
+    exhausted or closed. `schema` maps column names to a type hint, see fetch_typed.
+    """
+    chunksize = chunksize or config.FETCH_CHUNK_SIZE
+    record = query_log.start(query)
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params or ())
+            #DECLARE/SET statements ahead of the SELECT produce no result set
+            while cursor.description is None:
+                if not hasattr(cursor, "nextset") or not cursor.nextset():
+                    return
+            columns = [column[0] for column in cursor.description]
+            #The first row on its own, so first_row is stamped when it arrives rather
+            #than once the first chunk is complete
+            first = cursor.fetchone()
+            query_log.first_row(record)
+            if first is None:
+                #Callers still get the column layout when nothing matched
+                yield pd.DataFrame(columns=columns)
+                return
+            rows = [first] + (list(cursor.fetchmany(chunksize - 1)) if chunksize > 1 else [])
+            while rows:
+                chunk = _frame_from_rows(rows, columns, schema)
+                query_log.add_chunk(record, chunk)
+                yield chunk
+                rows = cursor.fetchmany(chunksize)
+        finally:
+            cursor.close()
+            query_log.finish(record, query, params)
+
+
+def reduce_query(query, params=None, transform=None, chunksize: int = None,
+                 schema: dict = None) -> pd.DataFrame:
+    """Streams a query and concatenates the chunks into one DataFrame.
+
+    `transform` is applied to every chunk as it arrives (e.g. filtering rows out),
+    so the full unfiltered result is never held in memory at once.
+    """
+    frames = []
+    for chunk in stream_query(query, params, chunksize, schema):
+        frames.append(chunk if transform is None else transform(chunk))
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    #Chunks with different categories concatenate to object, restore the categorical
+    kinds = {name.lower(): kind for name, kind in (schema or {}).items()}
+    for name in df.columns:
+        if kinds.get(name.lower()) == "category" and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype("category")
+    return df
+
+
+def fetch_typed(query, params=None, schema: dict = None, chunksize: int = None) -> pd.DataFrame:
+    """Fetches a query straight into typed column arrays instead of going through read_sql.
+
+    `schema` maps result column names (case insensitive) to one of "date",
+    "datetime", "int32", "int64", "float" or "category". Dates land as
+    datetime64, IDs as (nullable) integers and low-cardinality strings such as
+    Species or Agegroup as categoricals. Columns without a hint are inferred.
+    """
+    return reduce_query(query, params, chunksize=chunksize, schema=schema)
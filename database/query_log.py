@@ -0,0 +1,157 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from environment.settings import config
+
+
+def query_fingerprint(query: str) -> str:
+    """Short hash of a statement with whitespace normalised"""
+    return hashlib.sha1(re.sub(r"\s+", " ", query).strip().encode()).hexdigest()[:12]
+
+
+@dataclass
+class QueryRecord:
+    """Timing and size of one fetch_query call. year/month to end_year/end_month is the
+    span of months the query fetched, one month for a monthly extractor.
+    first_row_seconds is the time until the first row arrived."""
+    fingerprint: str
+    report: str
+    function: str
+    year: int = None
+    month: int = None
+    end_year: int = None
+    end_month: int = None
+    started_at: str = ""
+    wall_seconds: float = None
+    first_row_seconds: float = None
+    rows: int = 0
+    memory_bytes: int = 0
+    _start: float = field(default=0.0, repr=False)
+
+
+#(start, end) months of the fetch in progress on this thread, see QueryLog.months
+_months = ContextVar("query_log_months", default=None)
+
+
+def _caller():
+    """Finds the first frame outside the database package, i.e. the extractor"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith("database.") and module != "contextlib":
+            return frame
+        frame = frame.f_back
+    return None
+
+
+class QueryLog:
+    """In-process registry of every query run, with a slow-query log on disk.
+
+    Records can be written out at the end of a run with `write` as JSON or CSV.
+    Statements slower than `slow_seconds` are appended with their parameters to
+    `slow_log_path`.
+    """
+
+    def __init__(self, slow_seconds: float, slow_log_path: str):
+        self.slow_seconds = slow_seconds
+        self.slow_log_path = slow_log_path
+        self.records = []
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Drops the records of earlier runs of the process, so summary() and write()
+        cover one run"""
+        with self._lock:
+            self.records = []
+
+    @contextmanager
+    def months(self, start: tuple, end: tuple):
+        """Records the queries run inside the block as fetching the months start to end
+        (year, month), e.g. around an extractor's range mode"""
+        token = _months.set((start, end))
+        try:
+            yield
+        finally:
+            _months.reset(token)
+
+    def start(self, query: str) -> QueryRecord:
+        frame = _caller()
+        report, function, year, month = "", "", None, None
+        if frame is not None:
+            report = frame.f_globals.get("__name__", "")
+            function = frame.f_code.co_name
+            year = frame.f_locals.get("year")
+            month = frame.f_locals.get("month")
+        span = _months.get()
+        #The span passed by the caller wins, the extractor's locals are for direct calls
+        (year, month), (end_year, end_month) = span if span is not None else ((year, month), (year, month))
+        return QueryRecord(
+            fingerprint=query_fingerprint(query), report=report, function=function,
+            year=year, month=month, end_year=end_year, end_month=end_month,
+            started_at=datetime.now().isoformat(timespec="seconds"), _start=time.perf_counter(),
+        )
+
+    def first_row(self, record: QueryRecord) -> None:
+        if record.first_row_seconds is None:
+            record.first_row_seconds = round(time.perf_counter() - record._start, 4)
+
+    def add_chunk(self, record: QueryRecord, df) -> None:
+        record.rows += len(df)
+        record.memory_bytes += int(df.memory_usage(deep=True).sum())
+
+    def finish(self, record: QueryRecord, query: str, params=None) -> None:
+        record.wall_seconds = round(time.perf_counter() - record._start, 4)
+        with self._lock:
+            self.records.append(record)
+        if self.slow_seconds is not None and record.wall_seconds >= self.slow_seconds:
+            self._log_slow(record, query, params)
+
+    def _log_slow(self, record: QueryRecord, query: str, params) -> None:
+        os.makedirs(os.path.dirname(self.slow_log_path), exist_ok=True)
+        with self._lock, open(self.slow_log_path, "a", encoding="utf-8") as f:
+            f.write(f"-- {record.started_at} {record.report}.{record.function} "
+                    f"year={record.year} month={record.month} end_year={record.end_year} "
+                    f"end_month={record.end_month} fingerprint={record.fingerprint} "
+                    f"wall={record.wall_seconds}s rows={record.rows}\n")
+            f.write(f"-- params: {params!r}\n{query.strip()}\n\n")
+
+    def as_dicts(self) -> list:
+        with self._lock:
+            return [{k: v for k, v in asdict(r).items() if not k.startswith("_")} for r in self.records]
+
+    def write(self, path: str) -> None:
+        """Writes every record to path, as CSV if it ends in .csv and JSON otherwise"""
+        rows = self.as_dicts()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=[k for k in QueryRecord.__dataclass_fields__ if not k.startswith("_")])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2, default=str)
+
+    def summary(self, top: int = 5) -> str:
+        """Total query time and the slowest report functions"""
+        totals = {}
+        for r in self.as_dicts():
+            key = f"{r['report']}.{r['function']}"
+            totals[key] = totals.get(key, 0.0) + (r["wall_seconds"] or 0.0)
+        slowest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+        lines = [f"Queries: {len(self.records)}, total {sum(totals.values()):.1f}s"]
+        lines += [f"  {seconds:8.1f}s  {name}" for name, seconds in slowest]
+        return "\n".join(lines)
+
+
+query_log = QueryLog(slow_seconds=config.SLOW_QUERY_SECONDS,
+                     slow_log_path=f"{config.SERVER_PATH}/logs/slow_queries.log")
@@ -0,0 +1,110 @@
+"""Offline stand-in for the reporting database.
+
+Creates the tables the report queries touch, with the columns they use, in an
+embedded DuckDB file, and loads the lookup tables (species, stages, conditions,
+locations, sites, operation statuses). Point the reports at it with
+DB_BACKEND=duckdb or database.ms_sql_connection.use_backend("duckdb").
+
+Usage: python -m database.standin [path]
+"""
+import sys
+from environment.settings import config
+
+TABLES = {
+    "Animal": "AnimalID INTEGER PRIMARY KEY, Name VARCHAR, SpeciesID INTEGER, Sex VARCHAR",
+    "AnimalDetails": "AnimalID INTEGER, DateOfBirth DATE",
+    "refSpecies": "SpeciesID INTEGER PRIMARY KEY, Species VARCHAR",
+    "txnVisit": ("AnimalID INTEGER, InPrimaryKey INTEGER, IntakeType VARCHAR, IntakeSubType VARCHAR, "
+                 "IntakeSubTypeID INTEGER, tin_DateCreated TIMESTAMP, tOut_DateCreated TIMESTAMP, "
+                 "OutComeType VARCHAR"),
+    "IntakeStatusHistory": "OperationRecordID INTEGER, StatusID INTEGER, StatusDateTime TIMESTAMP",
+    "refOperationStatus": "OperationStatusID INTEGER PRIMARY KEY, OperationStatus VARCHAR",
+    "Stray": "AnimalID INTEGER, IntakeSubTypeID INTEGER",
+    "TransferIn": "AnimalID INTEGER, IntakeSubTypeID INTEGER",
+    "OwnerSurrender": "AnimalID INTEGER, IntakeSubTypeID INTEGER",
+    "Return": "AnimalID INTEGER, IntakeSubTypeID INTEGER",
+    "HistoryStatus": ("AnimalID INTEGER, OperationPrimaryID INTEGER, StageID INTEGER, Status VARCHAR, "
+                      "LastUpdated TIMESTAMP"),
+    "refAnimalStage": "StageID INTEGER PRIMARY KEY, Stage VARCHAR",
+    "HistoryLocation": "AnimalID INTEGER, LocationID INTEGER, LastUpdated TIMESTAMP",
+    "refLocations": "LocationID INTEGER PRIMARY KEY, Location VARCHAR",
+    "ExamCondition": ("ExamConditionID INTEGER, ExamID INTEGER, AnimalID INTEGER, ConditionID INTEGER, "
+                      "DateCreated TIMESTAMP, DateTimeDiagnosed TIMESTAMP"),
+    "refCondition": "ConditionID INTEGER PRIMARY KEY, Condition VARCHAR",
+    "ExamTreatment": ("ExamTreatmentID INTEGER, ExamID INTEGER, AnimalID INTEGER, TreatmentID INTEGER, "
+                      "Medication VARCHAR, StatusDateTime TIMESTAMP, DateCreated TIMESTAMP, "
+                      "PerformedBy INTEGER, AssistantID INTEGER, SiteID INTEGER"),
+    "Euthanasia": "AnimalID INTEGER, DateCreated TIMESTAMP",
+    "Person": "PersonID INTEGER PRIMARY KEY, NameFirst VARCHAR, NameLast VARCHAR",
+    "Site": "SiteID INTEGER PRIMARY KEY, SiteName VARCHAR",
+    #Stands in for master..spt_values, only the 'P' number sequence is used
+    "spt_values": "number INTEGER, type VARCHAR",
+}
+
+SPECIES = ["Cat", "Dog", "Rabbit", "Guinea Pig", "Bird"]
+
+STAGES = [
+    "Released", "Pre-Euthanasia", "Foster Program", "Evaluate", "Stray Holding - Feline",
+    "Stray Holding - Canine", "Pre-Intake", "Surgery Needed", "Pending Behavior Assessment",
+    "Bite Quarantine", "Medical Observation", "Foster Needed", "Medical Treatment",
+    "Behavior Observation", "Post -Op", "Available", "Adopted", "Transferred", "Deceased",
+]
+
+CONDITIONS = [
+    "Diarrhea", "Diarrhea, acute, nonspecific", "Diarrhea and vomiting, acute, nonspecific",
+    "Kennel cough", "URI, feline",
+    "Parvovirus, canine", "Parvovirus, feline, suspected", "Parvovirus, feline, confirmed",
+    "Ringworm, confirmed",
+    "Dehiscence, dental", "Ranula", "Incision complications", "Surgical complication",
+    "Otitis externa", "Dermatitis", "Conjunctivitis",
+]
+
+LOCATIONS = ["Fosters", "Off Site Clinic", "Cat Adoption", "Dog Kennels", "Medical Ward", "Isolation"]
+
+OPERATION_STATUSES = ["Completed", "Pending", "Cancelled"]
+
+SITES = [
+    "Toronto Humane Society", "Toronto Humane Society Adoption Centre",
+    "Toronto Humane Society Public Veterinary Services",
+    "Toronto Humane Society Spay Neuter Services",
+    "Toronto Humane Society Spay Neuter Services - (HSDR)",
+]
+
+LOOKUPS = {
+    "refSpecies": SPECIES,
+    "refAnimalStage": STAGES,
+    "refCondition": CONDITIONS,
+    "refLocations": LOCATIONS,
+    "refOperationStatus": OPERATION_STATUSES,
+    "Site": SITES,
+}
+
+
+def create_schema(conn) -> None:
+    """Creates any missing stand-in table on a DuckDB connection and fills the lookups"""
+    for table, columns in TABLES.items():
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+    for table, values in LOOKUPS.items():
+        if conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] == 0:
+            conn.executemany(f'INSERT INTO "{table}" VALUES (?, ?)',
+                             [(i, value) for i, value in enumerate(values, start=1)])
+    if conn.execute("SELECT COUNT(*) FROM spt_values").fetchone()[0] == 0:
+        conn.execute("INSERT INTO spt_values SELECT range, 'P' FROM range(2048)")
+
+
+def lookup_id(table: str, value: str) -> int:
+    """ID a lookup value gets in the stand-in, e.g. lookup_id("refSpecies", "Cat")"""
+    return LOOKUPS[table].index(value) + 1
+
+
+def create_standin(path: str = None) -> str:
+    """Creates (or completes) the stand-in database file and returns its path"""
+    import duckdb
+    path = path or config.STANDIN_DB_PATH
+    with duckdb.connect(path) as conn:
+        create_schema(conn)
+    return path
+
+
+if __name__ == "__main__":
+    print(f"Stand-in schema ready in {create_standin(sys.argv[1] if len(sys.argv) > 1 else None)}")
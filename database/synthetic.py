@@ -0,0 +1,454 @@
+"""Seeded synthetic shelter data for scale testing the reports offline.
+
+Fills the stand-in database (see database.standin) with animals, intake visits,
+stage and location history, diagnoses, surgeries and euthanasia events at a
+multiple of the shelter's volume, and writes ezyVet-style Animals.csv and
+Invoice.csv exports for reports/ezyvet.py. The same seed and scale always
+produce the same data.
+
+Usage: python -m database.synthetic [--scale 1|10|100] [--seed N] [--start YYYY-MM-DD]
+                                    [--end YYYY-MM-DD] [--path standin.duckdb] [--ezyvet-dir DIR]
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from environment.settings import config
+from database.standin import TABLES, LOOKUPS, create_schema, lookup_id
+
+#Shelter intakes and ezyVet clinic patients per year at scale 1
+INTAKES_PER_YEAR = 6000
+EZYVET_PATIENTS_PER_YEAR = 4000
+
+SPECIES = {"Cat": 0.55, "Dog": 0.35, "Rabbit": 0.05, "Guinea Pig": 0.03, "Bird": 0.02}
+#Share of intakes under 20 weeks old
+YOUNG = {"Cat": 0.40, "Dog": 0.20, "Rabbit": 0.10, "Guinea Pig": 0.10, "Bird": 0.05}
+INTAKE_TYPES = {"TransferIn": 0.30, "Stray": 0.35, "OwnerSurrender": 0.30, "[Return]": 0.05}
+INTAKE_SUBTYPES = {
+    "TransferIn": ["Partner Shelter", "Municipal Transfer"],
+    "Stray": ["Public", "Animal Services"],
+    "OwnerSurrender": ["Owner Request", "Landlord Issue"],
+    "[Return]": ["Adoption Return"],
+}
+#Subtype tables joined by the denominators, keyed by IntakeType
+SUBTYPE_TABLES = {"TransferIn": "TransferIn", "Stray": "Stray",
+                  "OwnerSurrender": "OwnerSurrender", "[Return]": "Return"}
+OUTCOMES = ["Adoption", "TransferOut", "ReturnToOwner", "PreEuthanasia", "Died"]
+OUTCOME_P = {"adult": [0.68, 0.12, 0.10, 0.06, 0.04], "young": [0.75, 0.07, 0.02, 0.06, 0.10]}
+#Leaving care closes the record: stage Released with status I(nactive), whatever the outcome
+OUTCOME_STAGE = "Released"
+#Median length of stay in days before outcome
+LOS_MEDIAN = {"Cat": 21, "Dog": 14, "Rabbit": 30, "Guinea Pig": 25, "Bird": 20}
+
+#(conditions, {species: (adult rate, young rate)}) per infection the reports track
+INFECTIONS = [
+    (["Diarrhea", "Diarrhea, acute, nonspecific", "Diarrhea and vomiting, acute, nonspecific"],
+     {"Cat": (0.08, 0.15), "Dog": (0.10, 0.18)}),
+    (["URI, feline"], {"Cat": (0.15, 0.25)}),
+    (["Kennel cough"], {"Dog": (0.08, 0.10)}),
+    (["Parvovirus, canine"], {"Dog": (0.005, 0.05)}),
+    (["Parvovirus, feline, suspected", "Parvovirus, feline, confirmed"], {"Cat": (0.002, 0.01)}),
+    (["Ringworm, confirmed"], {"Cat": (0.01, 0.04), "Dog": (0.002, 0.005)}),
+]
+BACKGROUND_CONDITIONS = ["Otitis externa", "Dermatitis", "Conjunctivitis"]
+STERILIZATION = {"F": ["Ovariohysterectomy"],
+                 "M": ["Orchidectomy", "Orchidectomy, cryptorchid", "Orchidectomy Inguinal",
+                       "Orchidectomy Intra-Ab Crytorch"]}
+NEUTER_P = [0.94, 0.03, 0.02, 0.01]
+DENTALS = ["Dental COHAT (Lv 1-3)", "Dental COHAT (Lv 4-5)", "Dental Extraction",
+           "Dental Extraction, Difficult", "COHAT"]
+DENTAL_P = [0.40, 0.15, 0.25, 0.10, 0.10]
+OTHER_SURGERIES = ["Mass Removal", "Amputation, Digit", "Amputation, Hind Leg", "Enucleation",
+                   "Cherry eye repair", "Hernia repair", "Cystotomy", "Biopsy", "Laceration (minor)",
+                   "Entropion Correction", "Femoral head ostectomy", "Fracture repair"]
+COMPLICATIONS = {"sterilization": ["Surgical complication", "Incision complications"],
+                 "dental": ["Dehiscence, dental", "Ranula", "Surgical complication"]}
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery",
+               "Quinn", "Priya", "Wei", "Amara", "Luis", "Noor", "Kofi", "Mei", "Omar", "Sofia", "Ivan"]
+LAST_NAMES = ["Smith", "Chen", "Patel", "Nguyen", "Brown", "Singh", "Garcia", "Okafor", "Kim",
+              "Martin", "Wilson", "Ali", "Lopez", "Taylor", "Boateng", "Khan", "Rossi", "Cohen"]
+PET_NAMES = ["Luna", "Milo", "Bella", "Oliver", "Charlie", "Max", "Daisy", "Simba", "Nala", "Leo",
+             "Coco", "Rocky", "Pepper", "Ginger", "Shadow", "Biscuit", "Mochi", "Olive", "Tiger", "Ziggy"]
+VETS, TECHS = 12, 20
+MIDDLE_STAGES = ["Medical Observation", "Medical Treatment", "Behavior Observation",
+                 "Pending Behavior Assessment", "Bite Quarantine"]
+MIDDLE_STAGE_P = [0.35, 0.3, 0.15, 0.12, 0.08]
+
+EZYVET_SPECIES = {"Feline": 0.58, "Canine": 0.38, "Special Species": 0.04}
+EZYVET_SURGERIES = {"Feline": ["Spay - Feline", "Neuter - Feline", "COHAT - Feline"],
+                    "Canine": ["Spay - Canine", "Neuter - Canine", "COHAT - Canine"],
+                    "Special Species": ["Spay - Rabbit", "Neuter - Rabbit", "Spay - Rabbit"]}
+EZYVET_EXTRAS = ["Exam Fee", "Pre-Anesthetic Bloodwork", "Rabies Vaccine", "Pain Medication", "Microchip"]
+MASTER_PROBLEMS = ["Surgical complication", "Incision complications", "Anesthetic complication",
+                   "Otitis externa", "Dermatitis",
+                   "Surgical complication,Pyometra,Dehiscence, dental,COHAT 1-2",
+                   "Vomiting,Surgical complication,Arrest, anesthetic,Anemia"]
+MASTER_PROBLEM_P = [0.3, 0.25, 0.1, 0.15, 0.14, 0.03, 0.03]
+
+
+def _pick(rng, options, p, size) -> np.ndarray:
+    return np.asarray(options, dtype=object)[rng.choice(len(options), size=size, p=p)]
+
+
+def _at(base, days) -> np.ndarray:
+    """Shifts datetime64 values by a (fractional) number of days"""
+    return np.asarray(base, dtype="datetime64[s]") + (np.asarray(days, dtype="float64") * 86400).astype("timedelta64[s]")
+
+
+def _ids(table: str, values) -> np.ndarray:
+    """Maps lookup values to their stand-in IDs"""
+    ids = {value: lookup_id(table, value) for value in LOOKUPS[table]}
+    return pd.Series(values).map(ids).to_numpy(dtype="int64")
+
+
+def _columns(table: str) -> list:
+    """Column names of a stand-in table in DDL order"""
+    return [column.split()[0] for column in TABLES[table].split(",")]
+
+
+def _people(rng) -> pd.DataFrame:
+    count = VETS + TECHS
+    return pd.DataFrame({"PersonID": np.arange(1, count + 1),
+                         "NameFirst": _pick(rng, FIRST_NAMES, None, count),
+                         "NameLast": _pick(rng, LAST_NAMES, None, count)})
+
+
+def _events(frames: list, columns: list) -> pd.DataFrame:
+    return pd.concat([pd.DataFrame(dict(zip(columns, frame))) for frame in frames], ignore_index=True)
+
+
+def _stage_history(rng, animals: pd.DataFrame, surgeries: pd.DataFrame) -> pd.DataFrame:
+    """HistoryStatus rows: intake stage, evaluation, care stages, surgery and outcome"""
+    a = animals
+    n = len(a)
+    cat = a["Species"].to_numpy() == "Cat"
+    stray = a["IntakeType"].to_numpy() == "Stray"
+    intake, los = a["Intake"].to_numpy(), a["LOS"].to_numpy()
+    first_stage = np.where(stray, np.where(cat, "Stray Holding - Feline", "Stray Holding - Canine"), "Pre-Intake")
+    rows = [(a.index, first_stage, intake, "A"),
+            (a.index, "Evaluate", _at(intake, np.maximum(los * 0.05, 0.1)), "A")]
+    middle = np.flatnonzero(rng.random(n) < 0.5)
+    rows.append((middle, _pick(rng, MIDDLE_STAGES, MIDDLE_STAGE_P, len(middle)),
+                 _at(intake[middle], los[middle] * 0.25), "A"))
+    fostered = np.flatnonzero(a["Fostered"].to_numpy())
+    rows.append((fostered, "Foster Needed", _at(intake[fostered], los[fostered] * 0.12), "A"))
+    rows.append((fostered, "Foster Program", _at(intake[fostered], los[fostered] * 0.15), "A"))
+    #Every surgery is preceded by Surgery Needed and followed by Post -Op
+    patient = surgeries["AnimalID"].to_numpy() - 1
+    when = surgeries["StatusDateTime"].to_numpy()
+    needed = np.maximum(_at(when, -rng.uniform(0.5, 3, len(when))), _at(intake[patient], 0.05))
+    rows.append((patient, "Surgery Needed", needed, "A"))
+    rows.append((patient, "Post -Op", _at(when, 0.1), "A"))
+    outcome = a["Outcome"].to_numpy()
+    available = np.flatnonzero(rng.random(n) < np.where(outcome == "Adoption", 0.8, 0.3))
+    rows.append((available, "Available", _at(intake[available], los[available] * 0.7), "A"))
+    out_time = a["OutTime"].to_numpy()
+    euthanised = np.flatnonzero(outcome == "PreEuthanasia")
+    rows.append((euthanised, "Pre-Euthanasia", _at(out_time[euthanised], -0.5), "A"))
+    rows.append((a.index, OUTCOME_STAGE, out_time, "I"))
+
+    history = _events(rows, ["Row", "Stage", "LastUpdated", "Status"])
+    row = history["Row"].to_numpy()
+    #Nothing after the outcome (or after the end of the data for animals still in care)
+    history = history[history["LastUpdated"].to_numpy() <= a["Horizon"].to_numpy()[row]]
+    row = history["Row"].to_numpy()
+    history = pd.DataFrame({
+        "AnimalID": a["AnimalID"].to_numpy()[row], "OperationPrimaryID": a["VisitID"].to_numpy()[row],
+        "StageID": _ids("refAnimalStage", history["Stage"]), "Status": history["Status"].to_numpy(),
+        "LastUpdated": history["LastUpdated"].to_numpy(),
+    })
+    return history.sort_values(["AnimalID", "LastUpdated"], kind="stable").reset_index(drop=True)
+
+
+def _location_history(rng, animals: pd.DataFrame) -> pd.DataFrame:
+    """HistoryLocation rows: housing at intake, medical moves, foster periods and clinic trips"""
+    a = animals
+    n = len(a)
+    species = a["Species"].to_numpy()
+    intake, los = a["Intake"].to_numpy(), a["LOS"].to_numpy()
+    home = np.where(species == "Cat", _pick(rng, ["Cat Adoption", "Isolation", "Medical Ward"], [0.8, 0.1, 0.1], n),
+                    np.where(species == "Dog", _pick(rng, ["Dog Kennels", "Isolation", "Medical Ward"], [0.85, 0.05, 0.1], n),
+                             "Medical Ward"))
+    rows = [(a.index, home, intake)]
+    medical = np.flatnonzero(rng.random(n) < 0.2)
+    rows.append((medical, "Medical Ward", _at(intake[medical], los[medical] * 0.3)))
+    rows.append((medical, home[medical], _at(intake[medical], los[medical] * 0.4)))
+    fostered = np.flatnonzero(a["Fostered"].to_numpy())
+    rows.append((fostered, "Fosters", _at(intake[fostered], los[fostered] * 0.15)))
+    returned = fostered[rng.random(len(fostered)) < 0.8]
+    rows.append((returned, home[returned], _at(intake[returned], los[returned] * 0.8)))
+    clinic = np.flatnonzero(rng.random(n) < 0.03)
+    rows.append((clinic, "Off Site Clinic", _at(intake[clinic], los[clinic] * 0.5)))
+    rows.append((clinic, home[clinic], _at(intake[clinic], los[clinic] * 0.55)))
+
+    history = _events(rows, ["Row", "Location", "LastUpdated"])
+    history = history[history["LastUpdated"].to_numpy() < a["Horizon"].to_numpy()[history["Row"].to_numpy()]]
+    history = pd.DataFrame({
+        "AnimalID": a["AnimalID"].to_numpy()[history["Row"].to_numpy()],
+        "LocationID": _ids("refLocations", history["Location"]),
+        "LastUpdated": history["LastUpdated"].to_numpy(),
+    })
+    return history.sort_values(["AnimalID", "LastUpdated"], kind="stable").reset_index(drop=True)
+
+
+def _surgeries(rng, animals: pd.DataFrame) -> tuple:
+    """ExamTreatment rows and the post-surgical complications they lead to"""
+    a = animals
+    n = len(a)
+    species, sex, young = a["Species"].to_numpy(), a["Sex"].to_numpy(), a["Young"].to_numpy()
+    intake, los = a["Intake"].to_numpy(), a["LOS"].to_numpy()
+    eligible = (np.isin(species, ["Cat", "Dog", "Rabbit"]) & (a["AgeDays"].to_numpy() + los * 0.4 >= 56)
+                & (a["Outcome"].to_numpy() != "Died"))
+    surgery_sex = np.where(sex == "U", _pick(rng, ["M", "F"], None, n), sex)
+    kinds = [
+        ("sterilization", eligible & (rng.random(n) < 0.6),
+         np.where(surgery_sex == "F", "Ovariohysterectomy", _pick(rng, STERILIZATION["M"], NEUTER_P, n))),
+        ("dental", eligible & ~young & np.isin(species, ["Cat", "Dog"]) & (rng.random(n) < 0.08),
+         _pick(rng, DENTALS, DENTAL_P, n)),
+        ("other", eligible & (rng.random(n) < 0.03), _pick(rng, OTHER_SURGERIES, None, n)),
+    ]
+    treatments, complications = [], []
+    midnight = intake.astype("datetime64[D]").astype("datetime64[s]")
+    for kind, mask, medication in kinds:
+        rows = np.flatnonzero(mask)
+        #Booked between a fifth and two thirds into the stay, during the working day
+        day = np.maximum(np.floor(los[rows] * rng.uniform(0.2, 0.67, len(rows))), 1)
+        when = _at(midnight[rows], day + rng.uniform(8, 16, len(rows)) / 24)
+        keep = when < a["Horizon"].to_numpy()[rows]
+        rows, when = rows[keep], when[keep]
+        count = len(rows)
+        treatments.append(pd.DataFrame({
+            "AnimalID": a["AnimalID"].to_numpy()[rows], "Medication": medication[rows],
+            "StatusDateTime": when, "DateCreated": _at(when, -rng.uniform(0, 0.25, count)),
+            "PerformedBy": rng.integers(1, VETS + 1, count),
+            "AssistantID": pd.array(np.where(rng.random(count) < 0.9,
+                                             rng.integers(VETS + 1, VETS + TECHS + 1, count), -1), dtype="Int64"),
+            "SiteID": _ids("Site", _pick(rng, LOOKUPS["Site"], [0.55, 0.2, 0.1, 0.1, 0.05], count)),
+        }))
+        if kind in COMPLICATIONS:
+            hit = rng.random(count) < (0.05 if kind == "sterilization" else 0.08)
+            complications.append(pd.DataFrame({
+                "AnimalID": a["AnimalID"].to_numpy()[rows[hit]],
+                "Condition": _pick(rng, COMPLICATIONS[kind], None, int(hit.sum())),
+                "DateCreated": _at(when[hit], rng.uniform(0.5, 10, int(hit.sum()))),
+            }))
+    treatment = pd.concat(treatments, ignore_index=True)
+    treatment.loc[treatment["AssistantID"] == -1, "AssistantID"] = pd.NA
+    treatment = treatment.sort_values("StatusDateTime", kind="stable").reset_index(drop=True)
+    treatment["ExamTreatmentID"] = np.arange(1, len(treatment) + 1)
+    treatment["ExamID"] = 500000 + treatment["ExamTreatmentID"]
+    medications = sorted(treatment["Medication"].unique())
+    treatment["TreatmentID"] = treatment["Medication"].map({m: i + 1 for i, m in enumerate(medications)})
+    return treatment[_columns("ExamTreatment")], complications
+
+
+def _diagnoses(rng, animals: pd.DataFrame, complications: list) -> pd.DataFrame:
+    """ExamCondition rows: tracked infections, surgical complications and background conditions"""
+    a = animals
+    n = len(a)
+    species, young = a["Species"].to_numpy(), a["Young"].to_numpy()
+    intake, los = a["Intake"].to_numpy(), a["LOS"].to_numpy()
+    frames = list(complications)
+    for conditions, rates in INFECTIONS:
+        rate = np.zeros(n)
+        for kind, (adult_rate, young_rate) in rates.items():
+            rate = np.where(species == kind, np.where(young, young_rate, adult_rate), rate)
+        rows = np.flatnonzero(rng.random(n) < rate)
+        #About a third arrive sick (the reports exclude those), the rest fall ill in care
+        onset = np.where(rng.random(len(rows)) < 0.3, rng.uniform(0, 2, len(rows)),
+                         rng.uniform(1, 4, len(rows)) + rng.exponential(10, len(rows)))
+        frames.append(pd.DataFrame({"AnimalID": a["AnimalID"].to_numpy()[rows],
+                                    "Condition": _pick(rng, conditions, None, len(rows)),
+                                    "DateCreated": _at(intake[rows], onset)}))
+    rows = np.flatnonzero(rng.random(n) < 0.25)
+    frames.append(pd.DataFrame({"AnimalID": a["AnimalID"].to_numpy()[rows],
+                                "Condition": _pick(rng, BACKGROUND_CONDITIONS, None, len(rows)),
+                                "DateCreated": _at(intake[rows], rng.random(len(rows)) * los[rows])}))
+    condition = pd.concat(frames, ignore_index=True)
+    horizon = a["Horizon"].to_numpy()[condition["AnimalID"].to_numpy() - 1]
+    condition = condition[condition["DateCreated"].to_numpy() < horizon]
+    condition = condition.sort_values("DateCreated", kind="stable").reset_index(drop=True)
+    condition["ExamConditionID"] = np.arange(1, len(condition) + 1)
+    condition["ExamID"] = 900000 + condition["ExamConditionID"]
+    condition["ConditionID"] = _ids("refCondition", condition["Condition"])
+    condition["DateTimeDiagnosed"] = _at(condition["DateCreated"].to_numpy(), rng.uniform(0, 0.05, len(condition)))
+    return condition[_columns("ExamCondition")]
+
+
+def _span(start: str, end: str) -> tuple:
+    start = np.datetime64(start, "s")
+    end = np.datetime64(end or datetime.today().strftime("%Y-%m-%d"), "s")
+    return start, end, (end - start) / np.timedelta64(int(365.25 * 86400), "s")
+
+
+def generate(scale: float = 1, seed: int = 0, start: str = "2023-01-01", end: str = None) -> dict:
+    """Builds every generated stand-in table as a DataFrame, keyed by table name.
+
+    Intakes are spread uniformly over [start, end) at INTAKES_PER_YEAR * scale
+    a year, one visit per animal. Animals still in care at `end` have no
+    outcome yet and no event is dated after `end`.
+    """
+    rng = np.random.default_rng(seed)
+    start, end, years = _span(start, end)
+    n = max(int(INTAKES_PER_YEAR * scale * years), 1)
+
+    animal_id = np.arange(1, n + 1)
+    species = _pick(rng, list(SPECIES), list(SPECIES.values()), n)
+    young = rng.random(n) < pd.Series(species).map(YOUNG).to_numpy()
+    #AnimalIDs increase with intake time like the production identity column
+    intake = np.sort(start + (rng.random(n) * ((end - start) / np.timedelta64(1, "s"))).astype("timedelta64[s]"))
+    age_days = np.where(young, rng.uniform(1, 140, n), np.minimum(180 + rng.exponential(4 * 365, n), 18 * 365))
+    dob = pd.Series(_at(intake, -age_days).astype("datetime64[D]")).where(rng.random(n) >= 0.02)
+    sex = _pick(rng, ["M", "F", "U"], [0.48, 0.48, 0.04], n)
+    intake_type = _pick(rng, list(INTAKE_TYPES), list(INTAKE_TYPES.values()), n)
+    subtype = np.empty(n, dtype=object)
+    for kind, names in INTAKE_SUBTYPES.items():
+        mask = intake_type == kind
+        subtype[mask] = _pick(rng, names, None, int(mask.sum()))
+    visit_id = 100000 + animal_id
+
+    outcome = np.where(young, _pick(rng, OUTCOMES, OUTCOME_P["young"], n), _pick(rng, OUTCOMES, OUTCOME_P["adult"], n))
+    median = pd.Series(species).map(LOS_MEDIAN).to_numpy() * np.where(young, 1.5, 1.0)
+    median = median * np.where(np.isin(outcome, ["PreEuthanasia", "Died"]), 0.5, 1.0)
+    los = np.clip(rng.lognormal(np.log(median), 0.8), 0.5, 365)
+    out_time = _at(intake, los)
+    outcomed = out_time < end
+    animals = pd.DataFrame({
+        "AnimalID": animal_id, "VisitID": visit_id, "Species": species, "Sex": sex, "Young": young,
+        "AgeDays": age_days, "IntakeType": intake_type, "Intake": intake, "LOS": los,
+        "Outcome": outcome, "OutTime": out_time,
+        #Events of animals still in care stop at the end of the data
+        "Horizon": np.where(outcomed, out_time, end),
+        "Fostered": rng.random(n) < np.where(young, 0.35, 0.06),
+    })
+
+    tables = {
+        "Animal": pd.DataFrame({"AnimalID": animal_id, "Name": _pick(rng, PET_NAMES, None, n),
+                                "SpeciesID": _ids("refSpecies", species), "Sex": sex}),
+        "AnimalDetails": pd.DataFrame({"AnimalID": animal_id, "DateOfBirth": dob}),
+        "txnVisit": pd.DataFrame({
+            "AnimalID": animal_id, "InPrimaryKey": visit_id, "IntakeType": intake_type,
+            "IntakeSubType": subtype, "IntakeSubTypeID": visit_id, "tin_DateCreated": intake,
+            "tOut_DateCreated": pd.Series(out_time).where(outcomed),
+            "OutComeType": pd.Series(outcome).where(outcomed),
+        }),
+        "IntakeStatusHistory": pd.DataFrame({
+            "OperationRecordID": visit_id,
+            "StatusID": np.where(rng.random(n) < 0.97, lookup_id("refOperationStatus", "Completed"),
+                                 lookup_id("refOperationStatus", "Cancelled")),
+            "StatusDateTime": intake,
+        }),
+        "Person": _people(rng),
+    }
+    for kind, table in SUBTYPE_TABLES.items():
+        mask = intake_type == kind
+        tables[table] = pd.DataFrame({"AnimalID": animal_id[mask], "IntakeSubTypeID": visit_id[mask]})
+    tables["ExamTreatment"], complications = _surgeries(rng, animals)
+    tables["ExamCondition"] = _diagnoses(rng, animals, complications)
+    tables["HistoryStatus"] = _stage_history(rng, animals, tables["ExamTreatment"])
+    tables["HistoryLocation"] = _location_history(rng, animals)
+    euthanised = np.flatnonzero(outcomed & (outcome == "PreEuthanasia"))
+    tables["Euthanasia"] = pd.DataFrame({"AnimalID": animal_id[euthanised], "DateCreated": out_time[euthanised]})
+    return tables
+
+
+def generate_ezyvet(scale: float = 1, seed: int = 0, start: str = "2023-01-01", end: str = None) -> tuple:
+    """Builds the ezyVet Animals and Invoice Lines exports of the public clinic.
+
+    Includes the rows reports/ezyvet.py filters out: TNR and Queensville
+    patients, non-surgical products, support staff and missing staff members.
+    """
+    rng = np.random.default_rng(seed + 1)
+    start, end, years = _span(start, end)
+    n = max(int(EZYVET_PATIENTS_PER_YEAR * scale * years), 1)
+    code = 300000 + np.arange(n)
+    species = _pick(rng, list(EZYVET_SPECIES), list(EZYVET_SPECIES.values()), n)
+    name = _pick(rng, PET_NAMES, None, n)
+    prefix = _pick(rng, ["", "TNR ", "Queensville "], [0.96, 0.03, 0.01], n)
+    name = prefix + name
+    first, last = _pick(rng, FIRST_NAMES, None, n), _pick(rng, LAST_NAMES, None, n)
+    visit = start + (rng.random(n) * ((end - start) / np.timedelta64(1, "s"))).astype("timedelta64[s]")
+    problems = pd.Series(_pick(rng, MASTER_PROBLEMS, MASTER_PROBLEM_P, n)).where(rng.random(n) < 0.12)
+    animals = pd.DataFrame({
+        "Animal Code": code, "Animal Name": name, "Species": species, "Sex": _pick(rng, ["Male", "Female"], None, n),
+        "Owner First Name": first, "Owner Last Name": last, "Master Problems": problems,
+        "Last Visit": pd.Series(visit).dt.strftime("%Y-%m-%d"),
+    })
+    #Records migrated from the old system keep alphanumeric codes and have no invoices,
+    #which is why the export's Animal Code column does not parse as a number
+    legacy = animals.sample(n=max(n // 100, 1), random_state=seed).copy()
+    legacy["Animal Code"] = [f"L{value}" for value in range(1, len(legacy) + 1)]
+    animals = pd.concat([animals, legacy], ignore_index=True)
+
+    #One surgery line per patient (a few booked twice), plus the other lines on the same invoice
+    product = np.empty(n, dtype=object)
+    for kind in EZYVET_SPECIES:
+        mask = species == kind
+        product[mask] = _pick(rng, EZYVET_SURGERIES[kind], [0.45, 0.45, 0.10], int(mask.sum()))
+    repeat = np.flatnonzero(rng.random(n) < 0.05)
+    extras = np.repeat(np.arange(n), rng.poisson(1.5, n))
+    line = np.concatenate([np.arange(n), repeat, extras])
+    products = np.concatenate([product, product[repeat], _pick(rng, EZYVET_EXTRAS, None, len(extras))])
+    count = len(line)
+    vets = np.array([f"Dr. {f} {l}" for f, l in zip(_pick(rng, FIRST_NAMES, None, VETS), _pick(rng, LAST_NAMES, None, VETS))],
+                    dtype=object)
+    case_owner = pd.Series(_pick(rng, vets, None, count))
+    staff = pd.Series(_pick(rng, vets, None, count))
+    draw = rng.random(count)
+    staff = staff.where(draw >= 0.06)
+    case_owner = case_owner.where(~(draw < 0.01))
+    staff[(draw >= 0.06) & (draw < 0.063)] = "Ezy Support"
+    business = pd.Series(first[line] + " " + last[line])
+    business[rng.random(count) < 0.002] = "ezyVet Software Support"
+    invoice = pd.DataFrame({
+        "Invoice Date": pd.Series(_at(visit[line], rng.uniform(0, 0.3, count))).dt.strftime("%Y-%m-%d %H:%M"),
+        "Invoice #": 700000 + line,
+        "Department": _pick(rng, ["Spay Neuter Services", "Public Veterinary Services"], [0.7, 0.3], count),
+        "Business Name": business, "Animal Code": code[line], "Patient Name": name[line],
+        "Species": species[line], "Product Name": products, "Quantity": 1,
+        "Staff Member": staff, "Case Owner": case_owner,
+    })
+    return animals, invoice.sort_values(["Invoice Date", "Invoice #"], kind="stable").reset_index(drop=True)
+
+
+def load(tables: dict, path: str = None) -> None:
+    """Replaces the generated tables of the stand-in database with `tables`"""
+    import duckdb
+    with duckdb.connect(path or config.STANDIN_DB_PATH) as conn:
+        create_schema(conn)
+        for table, df in tables.items():
+            conn.execute(f'DELETE FROM "{table}"')
+            conn.register("generated", df[_columns(table)])
+            conn.execute(f'INSERT INTO "{table}" SELECT * FROM generated')
+            conn.unregister("generated")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic shelter data for the stand-in database")
+    parser.add_argument("--scale", type=float, default=1, help="multiple of the shelter's yearly volume, e.g. 1, 10, 100")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2023-01-01", help="first intake date")
+    parser.add_argument("--end", default=None, help="data cut-off, today by default")
+    parser.add_argument("--path", default=config.STANDIN_DB_PATH, help="stand-in database file")
+    parser.add_argument("--ezyvet-dir", default=f"{config.SERVER_PATH}/ezyvet",
+                        help="folder for Animals.csv and Invoice.csv")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tables = generate(args.scale, args.seed, args.start, args.end)
+    load(tables, args.path)
+    for table, df in tables.items():
+        print(f"{table:20} {len(df):>12,} rows")
+    animals, invoice = generate_ezyvet(args.scale, args.seed, args.start, args.end)
+    os.makedirs(args.ezyvet_dir, exist_ok=True)
+    animals.to_csv(os.path.join(args.ezyvet_dir, "Animals.csv"), index=False)
+    invoice.to_csv(os.path.join(args.ezyvet_dir, "Invoice.csv"), index=False)
+    print(f"{'Animals.csv':20} {len(animals):>12,} rows")
+    print(f"{'Invoice.csv':20} {len(invoice):>12,} rows")
+    print(f"Scale {args.scale:g} written to {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
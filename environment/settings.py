@@ -1,13 +1,52 @@
+from datetime import date
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     MS_SQL_DB: str 
     SERVER_PATH: str
     REMOTE_PATH:str
+    #Maximum number of open database connections shared by the reports
+    DB_POOL_SIZE: int = 4
+    #Rows pulled per cursor.fetchmany call by the streaming fetch
+    FETCH_CHUNK_SIZE: int = 50000
+    #Month-partitioned extract store under SERVER_PATH/extracts, closed months are
+    #reused until SQL has not confirmed them for CACHE_TTL_DAYS
+    CACHE_ENABLED: bool = True
+    CACHE_TTL_DAYS: int = 90
+    #Statements slower than this are written to SERVER_PATH/logs/slow_queries.log
+    SLOW_QUERY_SECONDS: float = 30.0
+    #"mssql" for the production server, "duckdb" for the offline stand-in file
+    DB_BACKEND: str = "mssql"
+    STANDIN_DB_PATH: str = "standin.duckdb"
+    #Months a single report fetches at once in combined_df, lower on weekdays
+    #between BUSINESS_HOURS_START and BUSINESS_HOURS_END to spare the server
+    REPORT_MAX_WORKERS: int = 4
+    BUSINESS_HOURS_MAX_WORKERS: int = 2
+    BUSINESS_HOURS_START: int = 8
+    BUSINESS_HOURS_END: int = 18
+    #run_all: threads for the extract steps, processes for the pandas steps
+    #(0 runs those on threads), the Excel steps always run one at a time
+    RUNNER_SQL_WORKERS: int = 4
+    RUNNER_CPU_WORKERS: int = 2
+    #Date the reports are run as of, set by main.py --year/--month to re-run a past period
+    RUN_DATE: Optional[date] = None
+    #Skip rewriting output files (and refreshing dashboards) whose data did not change
+    OUTPUT_SKIP_UNCHANGED: bool = True
+    #Also have Excel refresh each dashboard (Power Query connections) at the end of
+    #the run, through one shared Excel session. Only done on Windows, where Excel is
+    EXCEL_REFRESH: bool = True
+    #Build the infection cohort's inventory rows from utils.census.Census when the
+    #months are fetched as a range, instead of the inventory SQL
+    CENSUS_INVENTORY: bool = True
+    #Also write every Power BI feed as typed Parquet next to its xlsx
+    BI_PARQUET: bool = True
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         
+#Read once at import: the reports build their output paths from it at module level and
+#run_all reads it first thing, so loading it lazily would not shorten a run
 config=Settings()
     
@@ -1,30 +1,194 @@
-from reports.diarrhea_report import run_diarrhea_report
-from reports.kitten_report import run_kitten_report
-from reports.parvo_report import run_parvo_report
-from reports.incidence_report import run_incidence_report
-from reports.dental_report import run_dental_report
-from reports.ringworm_report import run_ringworm_report
-from reports.uri_report import run_uri_report
-from reports.sx_wait_time import run_sx_wait_time_report
-from reports.delayed_euthanasia import run_euthanasia_report
-from reports.los_shelter_report import run_los_report
-from reports.ezyvet import get_ezyvet_report
-from datetime import datetime
-
-report_year= datetime.today().year
-report_month=datetime.today().month
-def run_all():
-    run_diarrhea_report(report_year)
-    run_kitten_report(report_year)
-    run_parvo_report(report_year)
-    run_dental_report(report_year)
-    run_incidence_report(report_year)
-    run_ringworm_report(report_year)
-    run_uri_report(report_year)
-    run_los_report(report_year)
-    run_sx_wait_time_report(report_year)
-    run_euthanasia_report(report_month, report_year)
-    return 
-
-run_all()
+"""Runs the reports.
 
+    python main.py                              every report, as of today
+    python main.py uri parvo                    only those reports
+    python main.py --year 2025                  as the reports stood at the end of 2025
+    python main.py --year 2026 --month 5        as of the end of May 2026
+    python main.py --from 2026-01 --to 2026-05  one run per month, e.g. to backfill
+    python main.py --jobs 2 --cache refresh     fewer workers, refetch every month from SQL
+    python main.py --dry-run                    print the queries and files a run would touch
+
+A --from/--to range runs the reports once per month, oldest first. The report
+files have one path per report, so each month overwrites the last and only the
+final month's files remain; what the earlier months leave behind is their
+extract store partitions (and query logs).
+
+Importing this module runs nothing and imports next to nothing: the report
+modules, pandas and the settings load when a run starts, and only the selected
+reports are imported. run_all is the entry point for embedding.
+"""
+import argparse
+import importlib
+import os
+import sys
+from calendar import monthrange
+from datetime import date, datetime
+
+#Command line name -> report module, each declares steps(report_year) and output_paths()
+REPORTS={'diarrhea': 'reports.diarrhea_report', 'kitten': 'reports.kitten_report', 'parvo': 'reports.parvo_report',
+         'dental': 'reports.dental_report', 'incidence': 'reports.incidence_report',
+         'ringworm': 'reports.ringworm_report', 'uri': 'reports.uri_report', 'los': 'reports.los_shelter_report',
+         'sx': 'reports.sx_wait_time', 'euthanasia': 'reports.delayed_euthanasia', 'ezyvet': 'reports.ezyvet'}
+#ezyvet reads CSV exports dropped by hand, it only runs when asked for
+DEFAULT_REPORTS=[name for name in REPORTS if name != 'ezyvet']
+CACHE_POLICIES=('use', 'refresh', 'off')
+
+
+def run_all(names: list = None, cache: str = 'use', jobs: int = None, dry_run: bool = False) -> bool:
+    """Runs the named reports (DEFAULT_REPORTS when None) as of as_of(), returns whether every step succeeded"""
+    from utils.extract_store import store
+    from utils.month_planner import MonthPlan, as_of
+    from utils.utils import run_plan
+    from utils.excel_session import excel_session
+    from utils.output_manifest import outputs
+    from utils.runner import DagRunner
+    from database.query_log import query_log
+    from environment.settings import config
+    modules=[importlib.import_module(REPORTS[name]) for name in (names or DEFAULT_REPORTS)]
+    report_year=as_of().year
+    #A --from/--to range runs once per month in this process, each run reports only itself
+    store.reset()
+    outputs.reset()
+    query_log.reset()
+    #refresh refetches every month from SQL, rewrites the partitions that changed and
+    #rewrites every output even when its data did not change; off bypasses the store
+    store.enabled=config.CACHE_ENABLED and cache != 'off'
+    store.refresh=cache == 'refresh'
+    outputs.force=cache == 'refresh'
+    #Every extractor month the reports need, fetched once before they run
+    plan=MonthPlan()
+    for report in modules:
+        if hasattr(report, 'month_needs'):
+            plan.add_report(report, report_year)
+    if dry_run:
+        print_plan(plan, modules)
+        return True
+    store.evict()
+    run_plan(plan, max_workers=jobs)
+    #Every report as a graph of steps, independent ones run side by side
+    if jobs is None:
+        runner=DagRunner()
+    else:
+        runner=DagRunner(sql_workers=jobs, cpu_workers=0 if jobs == 1 else min(jobs, os.cpu_count() or 1))
+    for report in modules:
+        runner.add(report.__name__.rsplit('.', 1)[-1], report.steps(report_year))
+    failed=runner.run()
+    #Excel starts once, if at all, for the workbook operations the reports queued.
+    #A workbook it fails on fails the run, but never skips the summaries and the query log
+    try:
+        excel_session.close()
+        excel_ok=True
+    except Exception as e:
+        print(f"Excel session failed: {e}")
+        excel_ok=False
+    print(runner.summary())
+    print(store.summary())
+    print(outputs.summary())
+    #Per query timings for the run, to see which extractors dominate the window
+    print(query_log.summary())
+    query_log.write(f"{config.SERVER_PATH}/logs/query_log_{datetime.today():%Y%m%d_%H%M%S}.json")
+    return not failed and excel_ok
+
+
+def print_plan(plan, modules: list) -> None:
+    """What run_all would query and write, without touching SQL or any file"""
+    from utils.extract_store import store
+    print(plan.summary())
+    for fetch_fn, months in plan.by_extractor():
+        from_sql=[month for month in months if not store.has(fetch_fn, *month)]
+        print(f"  {fetch_fn.__module__}.{fetch_fn.__name__}: {months[0][0]}-{months[0][1]:02} to "
+              f"{months[-1][0]}-{months[-1][1]:02}, {len(from_sql)} of {len(months)} months from SQL")
+    for report in modules:
+        if not hasattr(report, 'month_needs'):
+            print(f"  {report.__name__}: queries its source directly")
+    print("Outputs:")
+    for report in modules:
+        for path in report.output_paths():
+            print(f"  {path}")
+
+
+def run_date_for(year: int, month: int = None):
+    """The date a run for year (and month) is as of: the last day of that month, or of
+    the year when no month is given. None, meaning today, for the current month."""
+    today=date.today()
+    if month is None:
+        month=12 if year < today.year else today.month
+    if (year, month) > (today.year, today.month):
+        raise ValueError(f"{year}-{month:02} has not started yet")
+    if (year, month) == (today.year, today.month):
+        return None
+    return date(year, month, monthrange(year, month)[1])
+
+
+def month_arg(value: str) -> tuple:
+    try:
+        parsed=datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {value!r}")
+    return parsed.year, parsed.month
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser=argparse.ArgumentParser(description="Runs the shelter medicine reports.")
+    parser.add_argument('reports', nargs='*', metavar='report',
+                        help=f"reports to run, any of {', '.join(REPORTS)} (default: all but ezyvet)")
+    parser.add_argument('--year', type=int, help="run as of the end of this year, or of --month in it")
+    parser.add_argument('--month', type=int, choices=range(1, 13), metavar='1-12',
+                        help="run as of the end of this month (default year: the current one)")
+    parser.add_argument('--from', dest='start', type=month_arg, metavar='YYYY-MM',
+                        help="first month of a range, one run as of each month")
+    parser.add_argument('--to', dest='end', type=month_arg, metavar='YYYY-MM',
+                        help="last month of the range (default: the --from month)")
+    parser.add_argument('--jobs', type=int, help="extract threads and pandas processes (default: from settings)")
+    parser.add_argument('--cache', choices=CACHE_POLICIES, default='use',
+                        help="use the extract store, refresh it from SQL, or leave it off (default: use)")
+    parser.add_argument('--refresh', action='store_true', help="same as --cache refresh")
+    parser.add_argument('--dry-run', action='store_true', help="print the planned queries and outputs and stop")
+    args=parser.parse_args(argv)
+    #Checked here, argparse rejects an empty list when nargs='*' has choices
+    unknown=[name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown report(s) {', '.join(unknown)}, choose from {', '.join(REPORTS)}")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.start is None and args.end is not None:
+        parser.error("--to needs --from")
+    if args.start is not None and args.end is not None and args.end < args.start:
+        parser.error(f"--to {args.end[0]}-{args.end[1]:02} is before --from {args.start[0]}-{args.start[1]:02}")
+    if args.start is not None and (args.year is not None or args.month is not None):
+        parser.error("--from/--to cannot be combined with --year/--month")
+    if args.refresh:
+        args.cache='refresh'
+    return args
+
+
+def main(argv: list = None) -> int:
+    args=parse_args(argv)
+    from utils.month_planner import as_of, months_between, set_run_date
+    today=date.today()
+    if args.start is not None:
+        months=months_between(args.start, args.end or args.start)
+    elif args.year is not None or args.month is not None:
+        months=[(args.year or today.year, args.month)]
+    else:
+        months=[(today.year, today.month)]
+    ok=True
+    try:
+        for year, month in months:
+            try:
+                run_date=run_date_for(year, month)
+            except ValueError as e:
+                print(f"Skipping the run: {e}")
+                ok=False
+                continue
+            set_run_date(run_date)
+            if len(months) > 1:
+                print(f"Running as of {as_of():%Y-%m-%d}")
+            ok=run_all(args.reports, cache=args.cache, jobs=args.jobs, dry_run=args.dry_run) and ok
+    finally:
+        set_run_date(None)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
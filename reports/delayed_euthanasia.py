@@ -2,10 +2,18 @@ from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
 from database.ms_sql_connection import fetch_query
-from openpyxl import load_workbook
+from utils.excel import write_sheet
 from dateutil.relativedelta import relativedelta
+from functools import partial
+from utils.month_planner import as_of
+from utils.runner import Step
 from environment.settings import config
-from win32com.client import Dispatch
+
+
+def report_path(month, year) -> str:
+    """The workbook a run for month/year writes, named after the month"""
+    output_file_name = f"{datetime(year, month, 1).strftime('%b')}-delayedeuthanasia.xlsx"
+    return f"{config.SERVER_PATH}/delayed_euthanasia/monthly/{output_file_name}"
 
 
 def run_euthanasia_report(month, year):
@@ -16,7 +24,7 @@ def run_euthanasia_report(month, year):
     prev_month_date = current_date - relativedelta(months=1)
     first_day_prev_month = prev_month_date.replace(day=1)
 
-    query = f'''
+    query = '''
     SELECT TOP (100) PERCENT 
         dbo.Animal.AnimalID, dbo.Animal.Name, 
         dbo.refSpecies.Species, dbo.AnimalDetails.DateOfBirth, 
@@ -33,8 +41,8 @@ def run_euthanasia_report(month, year):
         AND (dbo.txnVisit.IntakeType IN ('TransferIn', 'OwnerSurrender', 'Stray', '[Return]')) 
         AND (DATEDIFF(day, dbo.txnVisit.tin_DateCreated, dbo.Euthanasia.DateCreated) >= 4
         AND DATEDIFF(day, dbo.txnVisit.tin_DateCreated, dbo.Euthanasia.DateCreated) <= 21) AND 
-        dbo.Euthanasia.DateCreated>= '{first_day_prev_month}'
-        AND dbo.Euthanasia.DateCreated < '{current_date}'
+        dbo.Euthanasia.DateCreated>= ?
+        AND dbo.Euthanasia.DateCreated < ?
     ORDER BY dbo.Animal.AnimalID, IntakeDate, EuthanizedDate
     '''
 
@@ -42,7 +50,7 @@ def run_euthanasia_report(month, year):
     # In[4]:
 
 
-    df1 = fetch_query(query)
+    df1 = fetch_query(query, (first_day_prev_month, current_date))
     df1['IntakeDate'] = pd.to_datetime(df1['IntakeDate'])
     df1['EuthanizedDate'] = pd.to_datetime(df1['EuthanizedDate'])
 
@@ -93,34 +101,27 @@ def run_euthanasia_report(month, year):
 
 
    # File output
-    output_file_name = f"{(current_date).strftime('%b')}-delayedeuthanasia.xlsx"
-    output_path = f"{config.SERVER_PATH}/delayed_euthanasia/monthly/{output_file_name}"
-
-    # Write to Excel
-    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-        final.to_excel(writer, sheet_name='monthly', startrow=3, index=False)
-
-    # Add headers and merge cells
-    wb = load_workbook(output_path)
-    ws = wb['monthly']
-    ws['A1'] = f'Records for {current_date.strftime("%b-%Y")}'
-    ws['A2'] = 'Intake to Euthanasia: 4-21 days inclusive'
-    ws.merge_cells('A1:C1')
-    ws.merge_cells('A2:D2')
-    wb.save(output_path)
+    output_path = report_path(month, year)
 
-    # Auto-fit columns with Excel COM
-    excel = Dispatch('Excel.Application')
-    wb_com = excel.Workbooks.Open(output_path)
-    for i in range(1, len(excel.Worksheets) + 1):
-        excel.Worksheets(i).Activate()
-        excel.ActiveSheet.Columns.AutoFit()
-    wb_com.Close(True)
+    # Write to Excel with fitted columns, then add headers in merged cells
+    with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
+        write_sheet(writer, final, 'monthly', startrow=3)
+        ws = writer.sheets['monthly']
+        ws.merge_range('A1:C1', f'Records for {current_date.strftime("%b-%Y")}')
+        ws.merge_range('A2:D2', 'Intake to Euthanasia: 4-21 days inclusive')
 
 
-    return 
-    
+    return
 
 
+def steps(report_year) -> list:
+    """The report as steps for utils.runner: one query and one small workbook for the
+    month before the run date's month"""
+    run_date = as_of()
+    return [Step("report", "sql", partial(run_euthanasia_report, run_date.month, run_date.year))]
 
 
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    run_date = as_of()
+    return [report_path(run_date.month, run_date.year)]
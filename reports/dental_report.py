@@ -1,9 +1,13 @@
 import pandas as pd
 from datetime import datetime
 import calendar
+from functools import partial
 import numpy as np
-from utils.utils import save_to_excel, update_dashboard, combined_df
-from database.ms_sql_connection import fetch_query
+from utils.utils import save_to_excel, update_dashboard, combined_df, save_frame
+from utils.dashboard import rate_summary
+from utils.month_planner import report_months
+from utils.runner import Step, run_steps
+from database.ms_sql_connection import fetch_query, reduce_query
 from environment.settings import config
 
 def denominator_extraction(year: int, month: int) -> pd.DataFrame:
@@ -14,7 +18,9 @@ def denominator_extraction(year: int, month: int) -> pd.DataFrame:
     #Reference date
     reference_date=f'{year}-{month:02}-01'
     
-    query=f'''
+    query='''
+            DECLARE @ReferenceDate DATE = ?;
+            DECLARE @LastDate DATETIME = ?;
 
             SELECT TOP (100) PERCENT 
             dbo.Animal.AnimalID, dbo.Animal.Name, dbo.refSpecies.Species, 
@@ -51,13 +57,13 @@ def denominator_extraction(year: int, month: int) -> pd.DataFrame:
         WHERE 
             (dbo.ExamTreatment.Medication IN (N'Dental Dehiscence Repair', N'Dental Extraction', 
             N'Dental COHAT (Lv 1-3)', N'Dental COHAT (Lv 4-5)', N'Dental Extraction, Difficult', 'COHAT')) 
-            AND dbo.ExamTreatment.StatusDateTime BETWEEN '{reference_date}' AND '{last_date}'
+            AND dbo.ExamTreatment.StatusDateTime BETWEEN @ReferenceDate AND @LastDate
 
     '''
-    df1 = fetch_query(query)
+    #Remove Off Site Animals while streaming so they are never held in memory
+    df1 = reduce_query(query, (reference_date, last_date),
+                       transform=lambda chunk: chunk[chunk['Location']!='Off Site Clinic'])
     print(df1.shape)
-    #Remove Off Site Animals
-    df1=df1[df1['Location']!='Off Site Clinic']
     #Remove Dehiscense
     df1=df1[df1['SurgeryType']!='Dental Dehiscence Repair']
     #Sort animals, keep first record and remove duplicates
@@ -97,7 +103,10 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
     reference_date=f'{year}-{month:02}-01'
 
     # numerator
-    query = f"""
+    query = """
+    DECLARE @ReferenceDate DATE = ?;
+    DECLARE @LastDate DATETIME = ?;
+
     SELECT TOP (100) PERCENT 
         dbo.Animal.AnimalID, dbo.Animal.Name, dbo.refSpecies.Species, dbo.Animal.Sex, 
         dbo.AnimalDetails.DateOfBirth, dbo.ExamTreatment.ExamID AS SurgeryID, 
@@ -140,11 +149,11 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
         (dbo.refCondition.Condition IN ('Dehiscence, dental', 'Ranula', 'Incision complications', 'Surgical complication')) 
         AND (dbo.ExamTreatment.Medication IN (N'Dental Dehiscence Repair', N'Dental Extraction', 
         N'Dental COHAT (Lv 1-3)', N'Dental COHAT (Lv 4-5)', N'Dental Extraction, Difficult', 'COHAT'))
-        AND dbo.ExamTreatment.StatusDateTime BETWEEN '{reference_date}' AND '{last_date}'
-        AND dbo.ExamCondition.DateTimeDiagnosed BETWEEN '{reference_date}' AND '{last_date}'
+        AND dbo.ExamTreatment.StatusDateTime BETWEEN @ReferenceDate AND @LastDate
+        AND dbo.ExamCondition.DateTimeDiagnosed BETWEEN @ReferenceDate AND @LastDate
         AND (DATEDIFF(d, dbo.ExamTreatment.DateCreated, dbo.ExamCondition.DateCreated) >= - 2)
     """
-    df2 = fetch_query(query)
+    df2 = fetch_query(query, (reference_date, last_date))
     #Remove Off Site Animals
     df2=df2[df2['Location']!='Off Site Clinic']
     #Remove Dehiscense so we associate compliacations with COHAT
@@ -187,8 +196,6 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
 
 def create_dashboard_data(numerator, denominator, path: str) -> None :
     '''Saves dataframe to Server and autofits columns'''
-    #Saves Sheets to Excel
-    writer = pd.ExcelWriter(path, engine = 'xlsxwriter')
     numerator=numerator[['AnimalID', 'Name', 'Species', 'Sex','SurgeryType', 'SurgeryCategory',
        'SurgeryDate', 'SurgeryCategory_refined', 'SurgeonName']]
     denominator=denominator[['AnimalID', 'Name', 'Species', 'Sex','SurgeryType', 'SurgeryCategory',
@@ -203,27 +210,59 @@ def create_dashboard_data(numerator, denominator, path: str) -> None :
     # Remove duplicates, prioritizing 'Comp' rows over 'NoComp' for each 'AnimalID' and 'SurgeryMonth'
     merged_data = merged_data.sort_values(by=['AnimalID', 'SurgeryMonth','SurgeryCategory', 'Type'], ascending=[True, True, True, False])
     merged_data = merged_data.drop_duplicates(subset=['AnimalID', 'SurgeryMonth', 'SurgeryCategory'], keep='last')
-    merged_data.to_excel(writer, header=True, index=False, sheet_name = 'Denominator')
-    writer.close()  
-    print("Report file saved to server.")
-    return
+    #No path when the runner saves it as a separate step
+    if path:
+        save_frame(merged_data, path, header=True, index=False, sheet_name = 'Denominator')
+        print("Report file saved to server.")
+    return merged_data
+
+
+
+
 
+def month_needs(report_year) -> list:
+    """(extractor, months) pairs the report reads, see utils.month_planner"""
+    months=report_months(report_year, years=report_years)
+    return [(numerator_extraction, months), (denominator_extraction, months)]
 
 
+def complication_summary(dashboard_data) -> pd.DataFrame:
+    """Complication rate per month, species and surgery category"""
+    return rate_summary(dashboard_data[dashboard_data['Type']=='Comp'], dashboard_data,
+                        ['SurgeryMonth', 'Species', 'SurgeryCategory_refined'], 'AnimalID')
+
+
+def update_report_dashboard(numerator, dashboard_data, summary) -> None:
+    #The dashboard is shared with the incidence report, each report writes its own sheets
+    update_dashboard(dashboard_path, {'Dental Numerator': numerator, 'Dental Denominator': dashboard_data,
+                                      'Dental Summary': summary})
+
+
+def steps(report_year) -> list:
+    """The report as steps for utils.runner"""
+    months=report_months(report_year, years=report_years)
+    return [
+        Step("numerator", "sql", partial(combined_df, numerator_extraction, months)),
+        Step("denominator", "sql", partial(combined_df, denominator_extraction, months)),
+        Step("dashboard_data", "cpu", partial(create_dashboard_data, path=None), needs=("numerator", "denominator")),
+        Step("save_dashboard_data", "excel",
+             partial(save_frame, path=dashboard_data_path, header=True, index=False, sheet_name='Denominator'),
+             needs={"df": "dashboard_data"}),
+        Step("save", "excel", partial(save_to_excel, path=report_path), needs=("numerator", "denominator")),
+        Step("summary", "cpu", complication_summary, needs=("dashboard_data",)),
+        Step("dashboard", "excel", update_report_dashboard, needs=("numerator", "dashboard_data", "summary")),
+    ]
 
 
 def run_dental_report(report_year):
     """Function to run all scripts"""
-    numerator=combined_df(numerator_extraction, report_year-1,report_year)
-    denominator=combined_df(denominator_extraction, report_year-1,report_year)
-    create_dashboard_data(numerator, denominator, dashboard_data_path)
-    save_to_excel(numerator, denominator, report_path)
-    update_dashboard(dashboard_path)
-
+    run_steps(steps(report_year))
     return
 
 
 
+#Calendar years of history the report covers, ending with the report month
+report_years=2
 #Path to report on local server
 report_filename="dental_complication.xlsx"
 report_path=f"{config.SERVER_PATH}/sxcomp/{report_filename}"
@@ -231,4 +270,9 @@ report_path=f"{config.SERVER_PATH}/sxcomp/{report_filename}"
 dashboard_filename="SurgicalComplicationsDashboard.xlsx"
 dashboard_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_filename}"
 dashboard_data_file="dental_complication_data.xlsx"
-dashboard_data_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_data_file}"
\ No newline at end of file
+dashboard_data_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_data_file}"
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [report_path, dashboard_data_path, dashboard_path]
@@ -1,14 +1,14 @@
 import pandas as pd
-import win32com.client as win32
-from dotenv import load_dotenv
 import os
-import pythoncom
 import os
 import glob
 from dateutil.relativedelta import relativedelta
 from itertools import product
 import numpy as np
-from utils.utils import update_dashboard
+from utils.utils import update_dashboard, save_bi_data
+from utils.excel import write_sheet
+from utils.month_planner import as_of
+from utils.runner import Step
 from environment.settings import config
 
 
@@ -118,27 +118,14 @@ def extraction(animal_path, invoice_path) -> pd.DataFrame:
 
 
 def save_to_excel(df: pd.DataFrame, local_path: str) -> None :
-    '''Saves dataframe to Server and autofits columns'''
+    '''Saves dataframe to Server with the columns fitted to their contents'''
     #Extracts Numerator from df
     df_num=df[df['Master Problems']!='No Complications']
-    #Saves Sheets to Excel
-    writer = pd.ExcelWriter(local_path, engine = 'xlsxwriter')
-    df.to_excel(writer, header=True, index=False, sheet_name = 'Denominator')
-    df_num.to_excel(writer, header=True, index=False, sheet_name = 'Numerator')
-    writer.close()  
-    
-    #Autofit Column width
-    pythoncom.CoInitialize()
-    excel = win32.gencache.EnsureDispatch('Excel.Application')
-    wb = excel.Workbooks.Open(local_path)
-    denom = wb.Worksheets("Denominator")
-    num= wb.Worksheets("Numerator")
-    denom.Columns.AutoFit()
-    num.Columns.AutoFit()
-    wb.Save()
-    excel.Application.Quit()
-    pythoncom.CoUninitialize()
-    
+    #Saves Sheets to Excel, column widths are set during the write
+    with pd.ExcelWriter(local_path, engine = 'xlsxwriter') as writer:
+        write_sheet(writer, df, 'Denominator')
+        write_sheet(writer, df_num, 'Numerator')
+
     return
 
 def filter_last_12_months(df):
@@ -155,7 +142,7 @@ def filter_last_12_months(df):
     # Ensure ReferenceDate is in datetime format
     df["Date"] = pd.to_datetime(df["Date"])
     # Get today's date normalized to midnight
-    today = pd.Timestamp.today().normalize()
+    today = pd.Timestamp(as_of()).normalize()
 
     # First day of the current month
     max_date = today.replace(day=1)
@@ -232,6 +219,11 @@ def process_bi_data(df):
     return final_df
 
 
+def steps(report_year) -> list:
+    """The report as steps for utils.runner, it reads the ezyVet CSV exports rather than SQL"""
+    return [Step("report", "excel", get_ezyvet_report)]
+
+
 def get_ezyvet_report():
     """Function to run all scripts"""
     #rename_files()
@@ -239,10 +231,11 @@ def get_ezyvet_report():
     save_to_excel(df, report_path)
     bi_raw_data=filter_last_12_months(df)
     bi_data=process_bi_data(bi_raw_data)
-    bi_data.to_excel(bi_path,index=False)
+    save_bi_data(bi_path, bi_data)
     #os.remove(animal_path)
     #os.remove(invoice_path)
-    update_dashboard(dashboard_path)
+    update_dashboard(dashboard_path, {'Denominator': df, 'Numerator': df[df['Master Problems']!='No Complications'],
+                                      'Summary': bi_data})
     #upload raw data to sharepoint
     #sharepoint_upload(report_path, remote_path)
     #upload dashboard to sharepoint
@@ -261,4 +254,8 @@ bi_path=f"{config.SERVER_PATH}/power_bi/{bi_report_filename}"
 #dashboard_path
 dashboard_filename="ezyvet_DashBoard.xlsx"
 dashboard_path=f"{config.SERVER_PATH}/ezyvet/{dashboard_filename}"
-    
\ No newline at end of file
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [report_path, bi_path, dashboard_path]
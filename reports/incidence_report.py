@@ -1,12 +1,15 @@
 import pandas as pd
 from datetime import datetime
 import calendar
-import os
+from functools import partial
 import numpy as np
 from itertools import product
 from dateutil.relativedelta import relativedelta
-from database.ms_sql_connection import fetch_query
-from utils.utils import save_to_excel, update_dashboard, combined_df
+from database.ms_sql_connection import fetch_query, reduce_query
+from utils.utils import save_to_excel, update_dashboard, combined_df, save_bi_data, save_frame
+from utils.dashboard import rate_summary
+from utils.month_planner import report_months, as_of
+from utils.runner import Step, run_steps
 from environment.settings import config
 
 def denominator_extraction(year: int, month: int) -> pd.DataFrame:
@@ -17,7 +20,10 @@ def denominator_extraction(year: int, month: int) -> pd.DataFrame:
     #Reference date
     reference_date=f'{year}-{month:02}-01'
     
-    query = f'''
+    query = '''
+    DECLARE @ReferenceDate DATE = ?;
+    DECLARE @LastDate DATETIME = ?;
+
     SELECT TOP (100) PERCENT 
         dbo.Animal.AnimalID, dbo.Animal.Name, 
         CASE WHEN dbo.refSpecies.Species = 'Cat' THEN 'Cat' 
@@ -68,13 +74,13 @@ def denominator_extraction(year: int, month: int) -> pd.DataFrame:
         N'Femoral head ostectomy', N'Fracture repair', N'Hernia repair', N'Incision repair', 
         N'Mass Removal', N'Orchidectomy', N'Orchidectomy, cryptorchid', N'Ovariohysterectomy', 
         N'Patella Luxation Surgery', N'Total ear canal ablation', N'Total hip replacement', N'TPLO')) 
-        AND dbo.ExamTreatment.StatusDateTime BETWEEN '{reference_date}' AND '{last_date}'
+        AND dbo.ExamTreatment.StatusDateTime BETWEEN @ReferenceDate AND @LastDate
     '''
-    df1 = fetch_query(query)
+    #Remove Off Site Animals while streaming so they are never held in memory
+    df1 = reduce_query(query, (reference_date, last_date),
+                       transform=lambda chunk: chunk[chunk['Location']!='Off Site Clinic'])
     #denominator_refined
     print(df1.shape)
-    #Remove Off Site Animals
-    df1=df1[df1['Location']!='Off Site Clinic']
     #Sort animals, keep first record and remove duplicates
     df1=df1.sort_values(['AnimalID', 'SurgeryDate', 'UniqueSurgeryID', 'SurgeryType', 'LocationDate']).reset_index(drop=True)
     df1=df1.drop_duplicates(subset=['AnimalID', 'UniqueSurgeryID'])
@@ -101,7 +107,10 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
     reference_date=f'{year}-{month:02}-01'
 
     # numerator
-    query=f'''
+    query='''
+    DECLARE @ReferenceDate DATE = ?;
+    DECLARE @LastDate DATETIME = ?;
+
     SELECT TOP (100) PERCENT 
         dbo.Animal.AnimalID, dbo.Animal.Name, 
         CASE WHEN dbo.refSpecies.Species = 'Cat' THEN 'Cat' 
@@ -158,11 +167,11 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
         N'Orchidectomy, cryptorchid', N'Ovariohysterectomy', N'Patella Luxation Surgery', 
         N'Total ear canal ablation', N'Total hip replacement', N'TPLO')) AND 
         (DATEDIFF(d, dbo.ExamTreatment.DateCreated, dbo.ExamCondition.DateCreated) >= - 2) 
-        AND dbo.ExamTreatment.StatusDateTime BETWEEN '{reference_date}' AND '{last_date}'
-        AND dbo.ExamCondition.DateTimeDiagnosed BETWEEN '{reference_date}' AND '{last_date}'
+        AND dbo.ExamTreatment.StatusDateTime BETWEEN @ReferenceDate AND @LastDate
+        AND dbo.ExamCondition.DateTimeDiagnosed BETWEEN @ReferenceDate AND @LastDate
          
     '''
-    df2 = fetch_query(query)
+    df2 = fetch_query(query, (reference_date, last_date))
     #Remove Off Site Animals
     df2=df2[df2['Location']!='Off Site Clinic']
     #df2=df2[df2['SurgeryType']!='Dental Dehiscence Repair']
@@ -194,8 +203,6 @@ def numerator_extraction(year: int, month: int) -> pd.DataFrame:
 
 def create_dashboard_data(numerator, denominator, path: str) -> None :
     '''Saves dataframe to Server and autofits columns'''
-    #Saves Sheets to Excel
-    writer = pd.ExcelWriter(path, engine = 'xlsxwriter')
     numerator=numerator[['AnimalID', 'Name', 'Species', 'Sex','SurgeryType', 'SurgeryCategory',
        'SurgeryDate', 'SurgeryCategory_refined', 'SurgeonName']]
     denominator=denominator[['AnimalID', 'Name', 'Species', 'Sex','SurgeryType', 'SurgeryCategory',
@@ -210,9 +217,10 @@ def create_dashboard_data(numerator, denominator, path: str) -> None :
     # Remove duplicates, prioritizing 'Comp' rows over 'NoComp' for each 'AnimalID' and 'SurgeryMonth'
     merged_data = merged_data.sort_values(by=['AnimalID', 'SurgeryMonth','SurgeryCategory', 'Type'], ascending=[True, True, True, False])
     merged_data = merged_data.drop_duplicates(subset=['AnimalID', 'SurgeryMonth', 'SurgeryCategory'], keep='last')
-    merged_data.to_excel(writer, header=True, index=False, sheet_name = 'Denominator')
-    writer.close()  
-    print("Report file saved to server.")
+    #No path when the runner saves it as a separate step
+    if path:
+        save_frame(merged_data, path, header=True, index=False, sheet_name = 'Denominator')
+        print("Report file saved to server.")
     return merged_data
 
 
@@ -232,7 +240,7 @@ def filter_last_12_months(df):
     df["SurgeryDate"] = pd.to_datetime(df["SurgeryDate"])
 
     # Get today's date normalized to midnight
-    today = pd.Timestamp.today().normalize()
+    today = pd.Timestamp(as_of()).normalize()
 
     # First day of the current month
     max_date = today.replace(day=1)
@@ -307,25 +315,58 @@ def process_bi_data(df):
 
 
 
+def month_needs(report_year) -> list:
+    """(extractor, months) pairs the report reads, see utils.month_planner"""
+    months=report_months(report_year, years=report_years)
+    return [(numerator_extraction, months), (denominator_extraction, months)]
+
+
+def incidence_bi_data(dashboard_data) -> pd.DataFrame:
+    """Spay and neuter complication percentages over the last 12 closed months"""
+    return process_bi_data(filter_last_12_months(dashboard_data))
+
+
+def complication_summary(dashboard_data) -> pd.DataFrame:
+    """Complication rate per month, species and surgery category"""
+    return rate_summary(dashboard_data[dashboard_data['Type']=='Comp'], dashboard_data,
+                        ['SurgeryMonth', 'Species', 'SurgeryCategory_refined'], 'AnimalID')
+
+
+def update_report_dashboard(numerator, dashboard_data, summary) -> None:
+    #The dashboard is shared with the dental report, each report writes its own sheets
+    update_dashboard(dashboard_path, {'Incidence Numerator': numerator, 'Incidence Denominator': dashboard_data,
+                                      'Incidence Summary': summary})
+
+
+def steps(report_year) -> list:
+    """The report as steps for utils.runner"""
+    months=report_months(report_year, years=report_years)
+    return [
+        Step("numerator", "sql", partial(combined_df, numerator_extraction, months)),
+        Step("denominator", "sql", partial(combined_df, denominator_extraction, months)),
+        Step("dashboard_data", "cpu", partial(create_dashboard_data, path=None), needs=("numerator", "denominator")),
+        Step("save_dashboard_data", "excel",
+             partial(save_frame, path=dashboard_data_path, header=True, index=False, sheet_name='Denominator'),
+             needs={"df": "dashboard_data"}),
+        Step("bi_data", "cpu", incidence_bi_data, needs=("dashboard_data",)),
+        Step("save_bi", "excel", partial(save_bi_data, bi_report_path), needs={"sheets": "bi_data"}),
+        Step("save", "excel", partial(save_to_excel, path=report_path), needs=("numerator", "denominator")),
+        Step("summary", "cpu", complication_summary, needs=("dashboard_data",)),
+        #The dental report fills the same dashboard, this one has always been written last
+        Step("dashboard", "excel", update_report_dashboard, needs=("numerator", "dashboard_data", "summary"),
+             after=("dental_report.dashboard",)),
+    ]
+
+
 def run_incidence_report(report_year):
     """Function to run all scripts"""
-    numerator=combined_df(numerator_extraction, report_year-1,report_year)
-    denominator=combined_df(denominator_extraction, report_year-1,report_year)
-    dashboard_data=create_dashboard_data(numerator, denominator, dashboard_data_path)
-    bi_data=filter_last_12_months(dashboard_data)
-    bi_data=process_bi_data(bi_data)
-    bi_data.to_excel(bi_report_path,index=False)
-    save_to_excel(numerator, denominator, report_path)  
-    update_dashboard(dashboard_path)
-
+    run_steps(steps(report_year))
     return
 
 
-#start year
-start_year=datetime.today().year -1
-#Year report should end.
-end_year=datetime.today().year
                 
+#Calendar years of history the report covers, ending with the report month
+report_years=2
 #Path to report on local server
 report_filename="incidence_complication.xlsx"
 report_path=f"{config.SERVER_PATH}/sxcomp/{report_filename}"
@@ -337,4 +378,9 @@ bi_report_path=f"{config.SERVER_PATH}/power_bi/{bi_report_filename}"
 dashboard_filename="SurgicalComplicationsDashboard.xlsx"
 dashboard_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_filename}"
 dashboard_file_data="incidence_complication_data.xlsx"
-dashboard_data_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_file_data}"
\ No newline at end of file
+dashboard_data_path=f"{config.SERVER_PATH}/sxcomp/{dashboard_file_data}"
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [report_path, dashboard_data_path, bi_report_path, dashboard_path]
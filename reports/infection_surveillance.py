@@ -0,0 +1,786 @@
+"""Shared extracts of the infection reports (diarrhea, URI, parvo and ringworm).
+
+They count the same exams, each for its own conditions, and their denominators
+are one population: every pet in the shelter at the start of
+the month plus every pet that came in during it. They only differ in which
+intakes they leave out, pets that showed the report's conditions within a few
+days of coming in and so most likely brought the infection with them. Each
+report used to run the whole inventory and intake query for every month with
+its own exclusion. Now infection_cohort fetches the population once per month
+for all of them, early_onset fetches the small set of early exams for every
+tracked condition, and each report's denominator is built from the two in
+pandas. infection_numerator pulls the exams of every tracked condition in one
+pass, tagged with their condition group, and each report takes its slice.
+
+With CENSUS_INVENTORY the range mode of infection_cohort takes the inventory
+rows from a utils.census.Census loaded once for the span and only queries
+the intake rows, see infection_cohort_census.
+
+CONDITION_GROUPS is the config table of the tracked conditions: a new
+surveillance report adds its group here instead of writing its own SQL.
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from database.ms_sql_connection import fetch_typed, reduce_query
+from environment.settings import config
+from utils.census import Census
+from utils.month_planner import months_between
+from utils.utils import combined_df, read_months
+
+
+#Condition group -> the refCondition.Condition values it tracks, and the days after
+#intake within which a case counts as brought in: excluded from the denominator,
+#and only later exams (up to a year after intake) count in the numerator
+CONDITION_GROUPS={
+    'diarrhea': {'conditions': ('Diarrhea', 'Diarrhea, acute, nonspecific',
+                                'Diarrhea and vomiting, acute, nonspecific'),
+                 'early_onset_days': 1},
+    'uri': {'conditions': ('Kennel cough', 'URI, feline'), 'early_onset_days': 3},
+    'parvo': {'conditions': ('Parvovirus, canine', 'Parvovirus, feline, suspected',
+                             'Parvovirus, feline, confirmed'),
+              'early_onset_days': 3},
+    'ringworm': {'conditions': ('Ringworm, confirmed',), 'early_onset_days': 7},
+}
+
+#Column type hints for the typed fetch, dates arrive as datetime64 instead of strings
+cohort_schema={"animalid": "int64", "dateofbirth": "date", "stagedate": "datetime",
+               "intakedate": "datetime", "Referencedate": "date"}
+numerator_schema={"animalid": "int64", "dateofbirth": "date", "intakedate": "datetime",
+                  "examdate": "datetime", "Referencedate": "date"}
+early_onset_schema={"animalid": "int64", "DaysAfterIntake": "int32", "Referencedate": "date"}
+
+
+def tracked_conditions() -> list:
+    """Every condition of CONDITION_GROUPS, each once"""
+    return list(dict.fromkeys(condition for group in CONDITION_GROUPS.values()
+                              for condition in group['conditions']))
+
+
+def condition_rows() -> list:
+    """(condition, group, early onset days) rows of CONDITION_GROUPS"""
+    return [(condition, group, spec['early_onset_days'])
+            for group, spec in CONDITION_GROUPS.items() for condition in spec['conditions']]
+
+
+def infection_numerator(year, month):
+    """Reads query and performs calculation based on year and month values.
+    Pets with an exam of a tracked condition in the month, acquired in the shelter,
+    one row per pet and condition tagged with its condition_group"""
+    return infection_numerator_range((year, month), (year, month))
+
+
+def infection_numerator_range(start: tuple, end: tuple):
+    """infection_numerator for every month from start to end, e.g. ((2024, 1), (2025, 12)),
+    in one query. The months are a calendar built on the server, each row carries
+    the month it belongs to as Referencedate."""
+    rows=condition_rows()
+    query=f"""DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+    --One row per reporting month, first of the month from @StartDate to @EndDate
+    WITH months
+    AS (SELECT
+      DATEADD(MONTH, number, @StartDate) AS ReferenceDate
+    FROM master..spt_values
+    WHERE type = 'P'
+    AND number <= DATEDIFF(MONTH, @StartDate, @EndDate)),
+    --condition_groups is CONDITION_GROUPS, passed as parameters
+    condition_groups
+    AS (SELECT
+      Condition,
+      ConditionGroup,
+      EarlyOnsetDays
+    FROM (VALUES {', '.join(['(?, ?, ?)'] * len(rows))}) AS config (Condition, ConditionGroup, EarlyOnsetDays)),
+    numerator
+    AS (SELECT DISTINCT
+      months.ReferenceDate,
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      txnVisit.tin_DateCreated AS IntakeDate,
+      refCondition.Condition,
+      condition_groups.ConditionGroup,
+      ExamCondition.ExamID,
+      ExamCondition.DateCreated AS ExamDate,
+      DATEDIFF(DAY, txnVisit.tin_DateCreated, ExamCondition.DateCreated) AS DaysAfterIntake
+    FROM Animal
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON Animal.AnimalID = AnimalDetails.AnimalID
+    INNER JOIN ExamCondition
+    INNER JOIN txnVisit
+      ON ExamCondition.DateCreated > txnVisit.tin_DateCreated
+      ON Animal.AnimalID = txnVisit.AnimalID
+      AND Animal.AnimalID = ExamCondition.AnimalID
+    INNER JOIN refCondition
+      ON ExamCondition.ConditionID = refCondition.ConditionID
+    INNER JOIN condition_groups
+      ON refCondition.Condition = condition_groups.Condition
+    --Each exam falls in the month of its examdate
+    INNER JOIN months
+      ON ExamCondition.DateCreated >= months.ReferenceDate
+      AND ExamCondition.DateCreated <= EOMONTH(months.ReferenceDate)
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
+    --A condition only counts as 'occured within shelter' after its early onset window
+    AND DATEDIFF(DAY, txnVisit.tin_DateCreated, ExamCondition.DateCreated)
+      BETWEEN condition_groups.EarlyOnsetDays + 1 AND 365
+    AND ExamCondition.DateCreated >= @StartDate
+    AND ExamCondition.DateCreated <= EOMONTH(@EndDate)
+    )
+    SELECT
+      numerator.animalid,
+      name,
+      species,
+      dateofbirth,
+      MAX(intaketype) as Intaketype,
+      condition,
+      MAX(intakedate) AS intakedate,
+      MIN(examdate) AS examdate,
+      CAST(numerator.ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, numerator.dateofbirth, numerator.ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, numerator.dateofbirth, numerator.ReferenceDate) < 20 AND
+          numerator.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup,
+      numerator.ConditionGroup AS condition_group
+    FROM numerator
+    WHERE DateOfBirth IS NOT NULL
+    GROUP BY numerator.ReferenceDate,
+             numerator.animalid,
+             name,
+             species,
+             condition,
+             numerator.ConditionGroup,
+             dateofbirth"""
+    params=(f'{start[0]}-{start[1]:02}-01', f'{end[0]}-{end[1]:02}-01', *(value for row in rows for value in row))
+    return fetch_typed(query, params, schema=numerator_schema)
+
+
+def infection_cohort(year, month):
+    """Pets in the shelter at the start of the month and pets that came in during it,
+    the intake rows have stage 'Intake'"""
+    #Constructs date value for first of every month
+    reference_date=f'{year}-{month:02}-01'
+    query= """
+
+    /*The cohort compiles information on all pets present in the shelter at the beginning of the month, 
+    as well as pets that arrived during that month. It is the denominator of every infection report
+    before their early onset exclusions. 
+    It merges data from both inventory records and intake records using a UNION operation.*/
+
+    /*Beginning of CTEs for inventory table cleaning */
+    --Inventory table contains history records of all animals present in the shelter.
+    DECLARE @ReferenceDate DATE = ?;
+
+    WITH inventory_table
+    AS (SELECT DISTINCT
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      refAnimalStage.Stage,
+      HistoryStatus.LastUpdated AS StageDate,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      txnVisit.tin_DateCreated AS intakedate,
+      HistoryStatus.Status
+    FROM HistoryStatus
+    INNER JOIN Animal
+      ON HistoryStatus.AnimalID = Animal.AnimalID
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON Animal.AnimalID = AnimalDetails.AnimalID
+    LEFT OUTER JOIN txnVisit
+      ON txnVisit.AnimalID = HistoryStatus.AnimalID
+      AND txnVisit.InPrimaryKey = HistoryStatus.OperationPrimaryID
+    LEFT OUTER JOIN refAnimalStage
+      ON HistoryStatus.StageID = refAnimalStage.StageID
+    LEFT OUTER JOIN Stray
+      ON txnVisit.IntakeSubTypeID = Stray.IntakeSubTypeID
+      AND txnVisit.AnimalID = Stray.AnimalID
+    LEFT OUTER JOIN TransferIn
+      ON txnVisit.IntakeSubTypeID = TransferIn.IntakeSubTypeID
+      AND txnVisit.AnimalID = TransferIn.AnimalID
+    LEFT OUTER JOIN OwnerSurrender
+      ON txnVisit.IntakeSubTypeID = OwnerSurrender.IntakeSubTypeID
+      AND txnVisit.AnimalID = OwnerSurrender.AnimalID
+    LEFT OUTER JOIN [Return]
+      ON txnVisit.IntakeSubTypeID = [Return].IntakeSubTypeID
+      AND txnVisit.AnimalID = [Return].AnimalID
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (refAnimalStage.Stage IN (N'Released', N'Pre-Euthanasia', N'Foster Program',
+    N'Evaluate', N'Stray Holding - Feline',
+    N'Stray Holding - Canine', N'Pre-Intake',
+    N'Surgery Needed', N'Pending Behavior Assessment', N'Bite Quarantine', N'Medical Observation',
+    N'Foster Needed', N'Medical Treatment', N'Behavior Observation'))
+    AND (txnVisit.IntakeType IN ('TransferIn',
+    'OwnerSurrender', '[Return]', 'Stray')
+    OR txnVisit.IntakeType IS NULL)
+    --Fetches data from one year ago.
+    AND (txnVisit.tin_DateCreated >= DATEADD(YEAR, -1, @ReferenceDate)
+    OR txnVisit.tin_DateCreated IS NULL)
+    AND (HistoryStatus.LastUpdated >= DATEADD(YEAR, -1, @ReferenceDate))),
+
+    --latest_stage_date is a CTE of most recent stage dates for each pet between a year back and current report month
+    latest_stagedate
+    AS (SELECT
+      animalid,
+      name,
+      MAX(stagedate) AS stagedate
+    FROM inventory_table
+    WHERE stagedate > DATEADD(YEAR, -1, @ReferenceDate)
+    AND StageDate <= @ReferenceDate
+    GROUP BY animalid,
+            name),
+
+    --Past_intakes is a CTE of records in inventory table where intakedate is less than current month date
+    Past_Intakes
+    AS (SELECT
+      animalid,
+      MAX(intakedate) AS intakedate
+    FROM inventory_table
+    WHERE intakedate IS NOT NULL
+    AND intakedate < @ReferenceDate
+    GROUP BY animalid),
+    /*End of CTEs for inventory table cleaning */
+
+
+    /* Beginning of CTEs for intake records data cleaning*/
+    --Total_Intake table generates records of all animals that came in during the month.
+    Total_Intake
+    AS (SELECT DISTINCT
+      txnVisit.tin_DateCreated AS IntakeDate,
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      refOperationStatus.OperationStatus
+    FROM refSpecies
+    INNER JOIN Animal
+    INNER JOIN txnVisit
+      ON Animal.AnimalID = txnVisit.AnimalID
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON AnimalDetails.AnimalID = Animal.AnimalID
+    LEFT OUTER JOIN IntakeStatusHistory
+    INNER JOIN refOperationStatus
+      ON IntakeStatusHistory.StatusID = refOperationStatus.OperationStatusID
+      ON txnVisit.tin_DateCreated = IntakeStatusHistory.StatusDateTime
+      AND txnVisit.InPrimaryKey = IntakeStatusHistory.OperationRecordID
+    LEFT OUTER JOIN refCondition
+    INNER JOIN ExamCondition
+      ON refCondition.ConditionID = ExamCondition.ConditionID
+      ON txnVisit.AnimalID = ExamCondition.AnimalID
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
+    AND (refOperationStatus.OperationStatus = 'Completed')
+    AND txnVisit.tin_DateCreated >= @ReferenceDate
+    AND txnVisit.tin_DateCreated < EOMONTH(@ReferenceDate))
+    /* End of CTEs for intake records data cleaning*/
+
+
+    /*Beginning of data cleaning for inventory dataset*/
+
+    --Obtains corresponding status and intakedate for most recent stagedate from latest_stagedate table
+    --max(inventory_table.status) was used to obtain only one entry in situations where there was more than one status for same date.
+    --Thus it assigns the maximum status(I=Inactive) of such occurences since such pets are to be ignored.
+    --Min(inventory_table.stage) selects the first stage entry in cases where there are 2 stages for the same stagedate/status
+
+    SELECT
+      latest_stagedate.animalid,
+      latest_stagedate.name,
+      inventory_table.species,
+      inventory_table.dateofbirth,
+      latest_stagedate.stagedate,
+      MAX(inventory_table.status) AS status,
+      MIN(inventory_table.stage) AS stage,
+      Past_Intakes.intakedate,
+      CAST(@ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, inventory_table.dateofbirth, @ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, inventory_table.dateofbirth, @ReferenceDate) < 20 AND
+          inventory_table.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup
+    FROM latest_stagedate
+    INNER JOIN inventory_table
+      ON latest_stagedate.stagedate = inventory_table.stagedate
+      AND latest_stagedate.animalid = inventory_table.animalid
+    INNER JOIN Past_Intakes
+      ON latest_stagedate.animalid = Past_Intakes.animalid
+    WHERE inventory_table.status = 'A'
+    AND dateofbirth IS NOT NULL
+
+    GROUP BY latest_stagedate.animalid,
+            inventory_table.species,
+            latest_stagedate.stagedate,
+            Past_Intakes.intakedate,
+            latest_stagedate.name,
+            inventory_table.dateofbirth
+    /*End of data cleaning for inventory dataset*/
+
+    UNION ALL
+
+    /*Beginning of data cleaning for intake dataset.
+    Generates dataset of all pets who came into the shelter during the month. Pets who showed
+    a condition soon after coming into the shelter are dropped per condition group in pandas.*/
+
+    SELECT
+      total_intake.animalid,
+      total_intake.name,
+      total_intake.species,
+      total_intake.dateofbirth,
+      CAST(@ReferenceDate AS date) AS Stagedate,
+      'A' AS status,
+      'Intake' AS stage,
+      MAX(Total_Intake.intakedate),
+      CAST(@ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, @ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, @ReferenceDate) < 20 AND
+          total_intake.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup
+    FROM Total_Intake
+    WHERE dateofbirth IS NOT NULL
+    GROUP BY total_intake.animalid,
+            total_intake.name,
+            total_intake.species,
+            total_intake.dateofbirth
+    ORDER BY animalid
+    """
+    #Inventory history is the largest pull of the reports, stream it in chunks
+    return reduce_query(query, (reference_date,), schema=cohort_schema)
+
+
+def infection_cohort_range(start: tuple, end: tuple):
+    """infection_cohort for every month from start to end in one query, row for row.
+    HistoryStatus is scanned once for the whole span plus its year of look-back
+    instead of once per month. Every status row is paired with the months whose
+    look-back it falls in, and window functions over each month find the
+    latest stage and the last past intake at the start of that month."""
+    query= """DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+
+    --One row per reporting month, first of the month from @StartDate to @EndDate
+    WITH months
+    AS (SELECT
+      DATEADD(MONTH, number, @StartDate) AS ReferenceDate
+    FROM master..spt_values
+    WHERE type = 'P'
+    AND number <= DATEDIFF(MONTH, @StartDate, @EndDate)),
+
+    /*Beginning of CTEs for inventory table cleaning */
+    --Inventory table contains history records of all animals present in the shelter,
+    --from one year before the first month.
+    inventory_table
+    AS (SELECT DISTINCT
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      refAnimalStage.Stage,
+      HistoryStatus.LastUpdated AS StageDate,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      txnVisit.tin_DateCreated AS intakedate,
+      HistoryStatus.Status
+    FROM HistoryStatus
+    INNER JOIN Animal
+      ON HistoryStatus.AnimalID = Animal.AnimalID
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON Animal.AnimalID = AnimalDetails.AnimalID
+    LEFT OUTER JOIN txnVisit
+      ON txnVisit.AnimalID = HistoryStatus.AnimalID
+      AND txnVisit.InPrimaryKey = HistoryStatus.OperationPrimaryID
+    LEFT OUTER JOIN refAnimalStage
+      ON HistoryStatus.StageID = refAnimalStage.StageID
+    LEFT OUTER JOIN Stray
+      ON txnVisit.IntakeSubTypeID = Stray.IntakeSubTypeID
+      AND txnVisit.AnimalID = Stray.AnimalID
+    LEFT OUTER JOIN TransferIn
+      ON txnVisit.IntakeSubTypeID = TransferIn.IntakeSubTypeID
+      AND txnVisit.AnimalID = TransferIn.AnimalID
+    LEFT OUTER JOIN OwnerSurrender
+      ON txnVisit.IntakeSubTypeID = OwnerSurrender.IntakeSubTypeID
+      AND txnVisit.AnimalID = OwnerSurrender.AnimalID
+    LEFT OUTER JOIN [Return]
+      ON txnVisit.IntakeSubTypeID = [Return].IntakeSubTypeID
+      AND txnVisit.AnimalID = [Return].AnimalID
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (refAnimalStage.Stage IN (N'Released', N'Pre-Euthanasia', N'Foster Program',
+    N'Evaluate', N'Stray Holding - Feline',
+    N'Stray Holding - Canine', N'Pre-Intake',
+    N'Surgery Needed', N'Pending Behavior Assessment', N'Bite Quarantine', N'Medical Observation',
+    N'Foster Needed', N'Medical Treatment', N'Behavior Observation'))
+    AND (txnVisit.IntakeType IN ('TransferIn',
+    'OwnerSurrender', '[Return]', 'Stray')
+    OR txnVisit.IntakeType IS NULL)
+    AND (txnVisit.tin_DateCreated >= DATEADD(YEAR, -1, @StartDate)
+    OR txnVisit.tin_DateCreated IS NULL)
+    AND (HistoryStatus.LastUpdated >= DATEADD(YEAR, -1, @StartDate))),
+
+    --inventory_months pairs every inventory record with the months whose one year look-back it is in.
+    --A record after the start of a month only counts there for its intakedate, so it is
+    --only paired with the months it is a past intake of
+    inventory_months
+    AS (SELECT
+      months.ReferenceDate,
+      inventory_table.*
+    FROM inventory_table
+    INNER JOIN months
+      ON inventory_table.StageDate >= DATEADD(YEAR, -1, months.ReferenceDate)
+      AND (inventory_table.intakedate >= DATEADD(YEAR, -1, months.ReferenceDate)
+      OR inventory_table.intakedate IS NULL)
+      AND (inventory_table.StageDate <= months.ReferenceDate
+      OR inventory_table.intakedate < months.ReferenceDate)),
+
+    --latest_stagedate is the most recent stage date of each pet between a year back and the month,
+    --past_intakedate its most recent intake before the month
+    inventory_snapshot
+    AS (SELECT
+      inventory_months.*,
+      MAX(CASE
+        WHEN StageDate > DATEADD(YEAR, -1, ReferenceDate) AND StageDate <= ReferenceDate THEN StageDate
+      END) OVER (PARTITION BY ReferenceDate, AnimalID) AS latest_stagedate,
+      MAX(CASE
+        WHEN intakedate < ReferenceDate THEN intakedate
+      END) OVER (PARTITION BY ReferenceDate, AnimalID) AS past_intakedate
+    FROM inventory_months),
+    /*End of CTEs for inventory table cleaning */
+
+
+    /* Beginning of CTEs for intake records data cleaning*/
+    --Total_Intake table generates records of all animals that came in during each month.
+    Total_Intake
+    AS (SELECT DISTINCT
+      months.ReferenceDate,
+      txnVisit.tin_DateCreated AS IntakeDate,
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      refOperationStatus.OperationStatus
+    FROM refSpecies
+    INNER JOIN Animal
+    INNER JOIN txnVisit
+      ON Animal.AnimalID = txnVisit.AnimalID
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON AnimalDetails.AnimalID = Animal.AnimalID
+    LEFT OUTER JOIN IntakeStatusHistory
+    INNER JOIN refOperationStatus
+      ON IntakeStatusHistory.StatusID = refOperationStatus.OperationStatusID
+      ON txnVisit.tin_DateCreated = IntakeStatusHistory.StatusDateTime
+      AND txnVisit.InPrimaryKey = IntakeStatusHistory.OperationRecordID
+    LEFT OUTER JOIN refCondition
+    INNER JOIN ExamCondition
+      ON refCondition.ConditionID = ExamCondition.ConditionID
+      ON txnVisit.AnimalID = ExamCondition.AnimalID
+    INNER JOIN months
+      ON txnVisit.tin_DateCreated >= months.ReferenceDate
+      AND txnVisit.tin_DateCreated < EOMONTH(months.ReferenceDate)
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
+    AND (refOperationStatus.OperationStatus = 'Completed')
+    AND txnVisit.tin_DateCreated >= @StartDate
+    AND txnVisit.tin_DateCreated < EOMONTH(@EndDate))
+    /* End of CTEs for intake records data cleaning*/
+
+
+    /*Beginning of data cleaning for inventory dataset*/
+
+    --Keeps the records of each month's latest stagedate with an active status, see infection_cohort.
+    --Min(stage) selects the first stage entry in cases where there are 2 stages for the same stagedate/status
+
+    SELECT
+      inventory_snapshot.animalid,
+      inventory_snapshot.name,
+      inventory_snapshot.species,
+      inventory_snapshot.dateofbirth,
+      inventory_snapshot.latest_stagedate AS stagedate,
+      MAX(inventory_snapshot.status) AS status,
+      MIN(inventory_snapshot.stage) AS stage,
+      inventory_snapshot.past_intakedate AS intakedate,
+      CAST(inventory_snapshot.ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, inventory_snapshot.dateofbirth, inventory_snapshot.ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, inventory_snapshot.dateofbirth, inventory_snapshot.ReferenceDate) < 20 AND
+          inventory_snapshot.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup
+    FROM inventory_snapshot
+    WHERE inventory_snapshot.StageDate = inventory_snapshot.latest_stagedate
+    AND inventory_snapshot.past_intakedate IS NOT NULL
+    AND inventory_snapshot.status = 'A'
+    AND dateofbirth IS NOT NULL
+
+    GROUP BY inventory_snapshot.ReferenceDate,
+            inventory_snapshot.animalid,
+            inventory_snapshot.species,
+            inventory_snapshot.latest_stagedate,
+            inventory_snapshot.past_intakedate,
+            inventory_snapshot.name,
+            inventory_snapshot.dateofbirth
+    /*End of data cleaning for inventory dataset*/
+
+    UNION ALL
+
+    /*Beginning of data cleaning for intake dataset.
+    Generates dataset of all pets who came into the shelter during each month.*/
+
+    SELECT
+      total_intake.animalid,
+      total_intake.name,
+      total_intake.species,
+      total_intake.dateofbirth,
+      CAST(total_intake.ReferenceDate AS date) AS Stagedate,
+      'A' AS status,
+      'Intake' AS stage,
+      MAX(Total_Intake.intakedate),
+      CAST(total_intake.ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, total_intake.ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, total_intake.ReferenceDate) < 20 AND
+          total_intake.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup
+    FROM Total_Intake
+    WHERE dateofbirth IS NOT NULL
+    GROUP BY total_intake.ReferenceDate,
+            total_intake.animalid,
+            total_intake.name,
+            total_intake.species,
+            total_intake.dateofbirth
+    ORDER BY Referencedate,
+            animalid
+    """
+    params=(f'{start[0]}-{start[1]:02}-01', f'{end[0]}-{end[1]:02}-01')
+    #Inventory history is the largest pull of the reports, stream it in chunks
+    return reduce_query(query, params, schema=cohort_schema)
+
+
+def infection_intake_range(start: tuple, end: tuple):
+    """The intake rows of infection_cohort_range alone, pets that came in during each
+    month from start to end"""
+    query= """DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+
+    --One row per reporting month, first of the month from @StartDate to @EndDate
+    WITH months
+    AS (SELECT
+      DATEADD(MONTH, number, @StartDate) AS ReferenceDate
+    FROM master..spt_values
+    WHERE type = 'P'
+    AND number <= DATEDIFF(MONTH, @StartDate, @EndDate)),
+
+    --Total_Intake table generates records of all animals that came in during each month.
+    Total_Intake
+    AS (SELECT DISTINCT
+      months.ReferenceDate,
+      txnVisit.tin_DateCreated AS IntakeDate,
+      Animal.AnimalID,
+      Animal.Name,
+      refSpecies.Species,
+      AnimalDetails.DateOfBirth,
+      txnVisit.IntakeType,
+      txnVisit.IntakeSubType,
+      refOperationStatus.OperationStatus
+    FROM refSpecies
+    INNER JOIN Animal
+    INNER JOIN txnVisit
+      ON Animal.AnimalID = txnVisit.AnimalID
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON AnimalDetails.AnimalID = Animal.AnimalID
+    LEFT OUTER JOIN IntakeStatusHistory
+    INNER JOIN refOperationStatus
+      ON IntakeStatusHistory.StatusID = refOperationStatus.OperationStatusID
+      ON txnVisit.tin_DateCreated = IntakeStatusHistory.StatusDateTime
+      AND txnVisit.InPrimaryKey = IntakeStatusHistory.OperationRecordID
+    LEFT OUTER JOIN refCondition
+    INNER JOIN ExamCondition
+      ON refCondition.ConditionID = ExamCondition.ConditionID
+      ON txnVisit.AnimalID = ExamCondition.AnimalID
+    INNER JOIN months
+      ON txnVisit.tin_DateCreated >= months.ReferenceDate
+      AND txnVisit.tin_DateCreated < EOMONTH(months.ReferenceDate)
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
+    AND (refOperationStatus.OperationStatus = 'Completed')
+    AND txnVisit.tin_DateCreated >= @StartDate
+    AND txnVisit.tin_DateCreated < EOMONTH(@EndDate))
+
+    SELECT
+      total_intake.animalid,
+      total_intake.name,
+      total_intake.species,
+      total_intake.dateofbirth,
+      CAST(total_intake.ReferenceDate AS date) AS stagedate,
+      'A' AS status,
+      'Intake' AS stage,
+      MAX(Total_Intake.intakedate) AS intakedate,
+      CAST(total_intake.ReferenceDate AS date) AS Referencedate,
+      CASE
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, total_intake.ReferenceDate) >= 20 THEN 'Adult'
+        WHEN DATEDIFF(WEEK, total_intake.dateofbirth, total_intake.ReferenceDate) < 20 AND
+          total_intake.species = 'Cat' THEN 'Kitten'
+        ELSE 'Puppy'
+      END AS Agegroup
+    FROM Total_Intake
+    WHERE dateofbirth IS NOT NULL
+    GROUP BY total_intake.ReferenceDate,
+            total_intake.animalid,
+            total_intake.name,
+            total_intake.species,
+            total_intake.dateofbirth
+    """
+    params=(f'{start[0]}-{start[1]:02}-01', f'{end[0]}-{end[1]:02}-01')
+    return fetch_typed(query, params, schema=cohort_schema)
+
+
+def age_group(df: pd.DataFrame) -> pd.Series:
+    """The Agegroup CASE of the cohort queries. DATEDIFF(WEEK) counts the week
+    boundaries (Sundays) between dateofbirth and Referencedate, not whole weeks"""
+    #Days since 1970-01-01, a Thursday, shifted so every week starts on a Sunday
+    sundays=lambda column: (pd.to_datetime(df[column]).to_numpy(dtype="datetime64[D]").astype("int64") + 4) // 7
+    weeks=sundays('Referencedate') - sundays('dateofbirth')
+    return pd.Series(np.select([weeks >= 20, df['species'] == 'Cat'], ['Adult', 'Kitten'], 'Puppy'),
+                     index=df.index)
+
+
+def infection_cohort_census(start: tuple, end: tuple):
+    """infection_cohort_range with the inventory rows taken from a utils.census.Census
+    loaded once for the span, row for row. Only the intake rows still come from SQL,
+    see infection_intake_range."""
+    census=Census.load(date(*start, 1), date(*end, 1))
+    inventory=pd.concat([census.inventory(date(year, month, 1)) for year, month in months_between(start, end)],
+                        ignore_index=True)
+    #Plain strings like the inventory SQL returns, not the census' categories
+    inventory=inventory.astype({'species': object, 'status': object})
+    inventory['Agegroup']=age_group(inventory)
+    df=pd.concat([inventory, infection_intake_range(start, end)], ignore_index=True)
+    return df.sort_values(['Referencedate', 'animalid'], kind='stable', ignore_index=True)
+
+
+def early_onset(year, month):
+    """Exams of the month with a tracked condition within the longest early onset
+    window of intake, the earliest one per pet and condition"""
+    return early_onset_range((year, month), (year, month))
+
+
+def early_onset_range(start: tuple, end: tuple):
+    """early_onset for every month from start to end in one query"""
+    conditions=tracked_conditions()
+    query=f"""DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+    --One row per reporting month, first of the month from @StartDate to @EndDate
+    WITH months
+    AS (SELECT
+      DATEADD(MONTH, number, @StartDate) AS ReferenceDate
+    FROM master..spt_values
+    WHERE type = 'P'
+    AND number <= DATEDIFF(MONTH, @StartDate, @EndDate))
+    SELECT
+      Animal.AnimalID AS animalid,
+      refCondition.Condition AS condition,
+      MIN(DATEDIFF(DAY, txnVisit.tin_DateCreated, ExamCondition.DateCreated)) AS DaysAfterIntake,
+      CAST(months.ReferenceDate AS date) AS Referencedate
+    FROM Animal
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON Animal.AnimalID = AnimalDetails.AnimalID
+    INNER JOIN ExamCondition
+    INNER JOIN txnVisit
+      ON ExamCondition.DateCreated > txnVisit.tin_DateCreated
+      ON Animal.AnimalID = txnVisit.AnimalID
+      AND Animal.AnimalID = ExamCondition.AnimalID
+    INNER JOIN refCondition
+      ON ExamCondition.ConditionID = refCondition.ConditionID
+    --Each exam falls in the month of its examdate
+    INNER JOIN months
+      ON ExamCondition.DateCreated >= months.ReferenceDate
+      AND ExamCondition.DateCreated <= EOMONTH(months.ReferenceDate)
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND (txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
+    AND (refCondition.Condition IN ({', '.join('?' * len(conditions))}))
+    AND DATEDIFF(DAY, txnVisit.tin_DateCreated, ExamCondition.DateCreated) BETWEEN 0 AND ?
+    AND ExamCondition.DateCreated >= @StartDate
+    AND ExamCondition.DateCreated <= EOMONTH(@EndDate)
+    GROUP BY months.ReferenceDate,
+             Animal.AnimalID,
+             refCondition.Condition"""
+    longest=max(group['early_onset_days'] for group in CONDITION_GROUPS.values())
+    params=(f'{start[0]}-{start[1]:02}-01', f'{end[0]}-{end[1]:02}-01', *conditions, longest)
+    return fetch_typed(query, params, schema=early_onset_schema)
+
+
+#combined_df and read_months fetch the months they lack in one range query
+infection_numerator.fetch_range=infection_numerator_range
+infection_cohort.fetch_range=infection_cohort_census if config.CENSUS_INVENTORY else infection_cohort_range
+early_onset.fetch_range=early_onset_range
+#The query texts are built from the table, so the table is part of the extracts' fingerprints
+infection_numerator.query_config=CONDITION_GROUPS
+early_onset.query_config=CONDITION_GROUPS
+
+
+def group_rows(group: str, numerator: pd.DataFrame) -> pd.DataFrame:
+    """The group's numerator, its rows of infection_numerator without the condition_group column"""
+    rows=numerator[numerator['condition_group'] == group]
+    return rows.drop(columns='condition_group').reset_index(drop=True)
+
+
+def combined_numerator(group: str, months: list) -> pd.DataFrame:
+    """The group's numerator over the months, like combined_df for a per report extractor"""
+    return group_rows(group, combined_df(infection_numerator, months))
+
+
+def read_numerator(group: str, start: tuple, end: tuple, columns: list = None) -> pd.DataFrame:
+    """The group's numerator for the months start..end from the extract store, see read_months"""
+    numerator_columns=None if columns is None else list(dict.fromkeys([*columns, 'condition_group']))
+    df=group_rows(group, read_months(infection_numerator, start, end, columns=numerator_columns))
+    return df if columns is None else df[columns]
+
+
+def exclude_early_onset(group: str, cohort: pd.DataFrame, onset: pd.DataFrame) -> pd.DataFrame:
+    """The group's denominator: the cohort without the intake rows of pets that showed one of
+    its conditions within its early onset window in that month"""
+    spec=CONDITION_GROUPS[group]
+    onset=onset[onset['condition'].isin(spec['conditions'])
+                & (onset['DaysAfterIntake'] <= spec['early_onset_days'])]
+    excluded=pd.MultiIndex.from_frame(onset[['animalid', 'Referencedate']])
+    keys=pd.MultiIndex.from_frame(cohort[['animalid', 'Referencedate']])
+    drop=(cohort['stage'] == 'Intake') & keys.isin(excluded)
+    return cohort.loc[~drop].reset_index(drop=True)
+
+
+def combined_denominator(group: str, months: list) -> pd.DataFrame:
+    """The group's denominator over the months, like combined_df for a per report extractor"""
+    return exclude_early_onset(group, combined_df(infection_cohort, months), combined_df(early_onset, months))
+
+
+def read_denominator(group: str, start: tuple, end: tuple, columns: list = None) -> pd.DataFrame:
+    """The group's denominator for the months start..end from the extract store, see read_months"""
+    cohort_columns=None if columns is None else list(dict.fromkeys([*columns, 'animalid', 'stage', 'Referencedate']))
+    cohort=read_months(infection_cohort, start, end, columns=cohort_columns)
+    df=exclude_early_onset(group, cohort, read_months(early_onset, start, end))
+    return df if columns is None else df[columns]
+
+
+def infection_needs(months: list) -> list:
+    """(extractor, months) pairs behind a report's numerator and denominator, for its month_needs"""
+    return [(infection_numerator, months), (infection_cohort, months), (early_onset, months)]
@@ -1,14 +1,22 @@
 import pandas as pd
 from datetime import datetime
+from functools import partial
 import calendar
 import os
 import numpy as np
 from dateutil.relativedelta import relativedelta
-from utils.utils import save_to_excel, update_dashboard, combined_df
-from database.ms_sql_connection import fetch_query
+from utils.utils import save_to_excel, update_dashboard, combined_df, save_bi_data
+from utils.month_planner import report_months, as_of
+from utils.runner import Step, run_steps
+from database.ms_sql_connection import fetch_typed
 from environment.settings import config
 
 
+#Column type hints for the typed fetch
+extraction_schema={"Animalid": "int64", "Dateofbirth": "date", "Intakedate": "date",
+                   "ReferenceDate": "date", "IntakeAge": "int32", "IntakeType": "category",
+                   "Outcometype": "category", "Agegroup": "category"}
+
 def extraction(year: int, month: int) -> pd.DataFrame:
     """Extraction and Transformation script from SQL"""
     #Returns Last day of the month
@@ -17,7 +25,9 @@ def extraction(year: int, month: int) -> pd.DataFrame:
     #Reference date
     reference_date=f'{year}-{month:02}-01'
     
-    query=f'''WITH Denom AS (SELECT  
+    query='''DECLARE @ReferenceDate DATE = ?;
+    DECLARE @LastDate DATETIME = ?;
+    WITH Denom AS (SELECT  
     dbo.Animal.AnimalID, 
     dbo.Animal.Name, 
     dbo.txnVisit.IntakeType as IntakeType,
@@ -32,14 +42,14 @@ def extraction(year: int, month: int) -> pd.DataFrame:
            dbo.txnVisit ON dbo.Animal.AnimalID = dbo.txnVisit.AnimalID
     WHERE dbo.refSpecies.Species = 'Cat'
     --Using last_date to include Cats that had intake date in specified month
-    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND '{last_date}'
+    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND @LastDate
     AND dbo.txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender')
     --Excludes animals that had outcome before first day
-    AND dbo.txnVisit.tOut_DateCreated >= '{reference_date}'),
+    AND dbo.txnVisit.tOut_DateCreated >= @ReferenceDate),
     
     --Weeks Table from inbuilt table in SQL Server for Crossjoin 
     Weeks AS (
-    SELECT DATEADD(DAY, number,'{reference_date}') AS week_start
+    SELECT DATEADD(DAY, number,@ReferenceDate) AS week_start
     FROM master..spt_values
     WHERE type = 'P' AND number in(0,7,14,21,27)
     ),
@@ -69,7 +79,7 @@ def extraction(year: int, month: int) -> pd.DataFrame:
     AND (dbo.txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender'))
     AND dbo.AnimalDetails.DateOfBirth IS NOT NULL
     AND (dbo.txnVisit.OutComeType IN ('Died', 'PreEuthanasia'))
-    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND '{last_date}'
+    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND @LastDate
     
     UNION
     
@@ -110,7 +120,7 @@ def extraction(year: int, month: int) -> pd.DataFrame:
     WHERE dbo.refSpecies.Species = 'Cat'
     AND dbo.txnVisit.IntakeType IN ('TransferIn', 'Stray', '[Return]', 'OwnerSurrender')
     AND dbo.txnVisit.OutComeType IN ('Died', 'PreEuthanasia')
-    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND '{last_date}'))
+    AND dbo.txnVisit.tin_DateCreated Between '2017-01-01' AND @LastDate))
 
 
     SELECT DISTINCT
@@ -120,7 +130,7 @@ def extraction(year: int, month: int) -> pd.DataFrame:
       Dateofbirth,
       Intakedate,
       DATEDIFF(WEEK, dateofbirth, intakedate) AS IntakeAge,
-      Cast('{reference_date}' as Date) as ReferenceDate,
+      Cast(@ReferenceDate as Date) as ReferenceDate,
       'Alive' AS Outcometype,
       CASE
         WHEN DATEDIFF(WEEK, DAteOfBirth, week_start) BETWEEN 0 AND 2 THEN '0-2 wks'
@@ -167,15 +177,12 @@ def extraction(year: int, month: int) -> pd.DataFrame:
 
     FROM numerator
     WHERE DATEDIFF(WEEK, DateOfBirth, OutcomeDate) <= 20
-    AND outcomedate BETWEEN '{reference_date}' AND '{last_date}'
+    AND outcomedate BETWEEN @ReferenceDate AND @LastDate
     
     '''
     
     #converts query to dataframe
-    df=fetch_query(query)
-    #changes strings to datetime dtypes
-    df[["Dateofbirth", "Intakedate", "ReferenceDate"]] = df[["Dateofbirth", "Intakedate", "ReferenceDate"]].apply(
-        lambda x: pd.to_datetime(x).dt.date)
+    df=fetch_typed(query, (reference_date, last_date), schema=extraction_schema)
     #Remove occurences where there are 2 same agegroups for outcome type
     #E.g same agegroup for a kitten died and alive thus causing duplicate
     #Deletes Alive row for such occurences
@@ -185,9 +192,9 @@ def extraction(year: int, month: int) -> pd.DataFrame:
 
     
     
-def parse_combined_df(function_name:str, start_year:int, end_year:int) -> pd.DataFrame:
+def parse_combined_df(function_name:str, report_year:int) -> pd.DataFrame:
     """Combines the dataframes for each year and months into a single dataframe"""
-    df=combined_df(function_name, start_year, end_year)
+    df=combined_df(function_name, report_months(report_year))
     # Creating a referencedate range with the missing months
     min_referencedate = df['ReferenceDate'].min()
     max_referencedate = df['ReferenceDate'].max()
@@ -227,7 +234,7 @@ def filter_last_12_months(df):
     df["ReferenceDate"] = pd.to_datetime(df["ReferenceDate"])
 
     # Get today's date normalized to midnight
-    today = pd.Timestamp.today().normalize()
+    today = pd.Timestamp(as_of()).normalize()
 
     # First day of the current month
     max_date = today.replace(day=1)
@@ -289,18 +296,37 @@ def process_bi_data(df):
 
     return final_result
 
+def month_needs(report_year) -> list:
+    """(extractor, months) pairs the report reads, see utils.month_planner"""
+    return [(extraction, report_months(report_year))]
+
+def mortality_numerator(df):
+    """Kittens that died or were euthanised"""
+    return df[df['Outcometype'].isin(['Died', 'Euthanised'])]
+
+def save_kitten_bi_data(bi_data, bi_summary) -> None:
+    save_bi_data(bi_report_path, {'Sheet2': bi_data, 'Sheet1': bi_summary})
+
+def update_report_dashboard(numerator, denominator, summary) -> None:
+    update_dashboard(dashboard_path, {'Numerator': numerator, 'Denominator': denominator, 'Summary': summary})
+
+def steps(report_year) -> list:
+    """The report as steps for utils.runner"""
+    return [
+        Step("data", "sql", partial(parse_combined_df, extraction, report_year)),
+        Step("bi_data", "cpu", filter_last_12_months, needs={"df": "data"}),
+        Step("bi_summary", "cpu", process_bi_data, needs={"df": "bi_data"}),
+        Step("save_bi", "excel", save_kitten_bi_data, needs=("bi_data", "bi_summary")),
+        Step("numerator", "cpu", mortality_numerator, needs={"df": "data"}),
+        Step("save", "excel", partial(save_to_excel, path=report_path),
+             needs={"numerator": "numerator", "denominator": "data"}),
+        Step("dashboard", "excel", update_report_dashboard,
+             needs={"numerator": "numerator", "denominator": "data", "summary": "bi_summary"}),
+    ]
+
 def run_kitten_report(report_year):
     """Function to run all scripts"""
-    df=parse_combined_df(extraction, report_year, report_year)
-    power_bi_df=filter_last_12_months(df)
-    power_bi_df_summary=process_bi_data(power_bi_df)
-    with pd.ExcelWriter(bi_report_path, engine='openpyxl') as writer:
-      power_bi_df.to_excel(writer, sheet_name='Sheet2', index=False)
-      power_bi_df_summary.to_excel(writer, sheet_name='Sheet1', index=False)
-    df_num=df[df['Outcometype'].isin(['Died', 'Euthanised'])]
-    save_to_excel(df_num, df, report_path)
-    update_dashboard(dashboard_path)
-
+    run_steps(steps(report_year))
     return
 
 
@@ -316,4 +342,9 @@ bi_remote_path=os.environ.get("BI_REMOTE_PATH")
 #dashboard_path
 dashboard_filename="Kitten_Mortality_DashBoard.xlsx"
 dashboard_path=f"{config.SERVER_PATH}/kitten_mortality/{dashboard_filename}"
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [report_path, bi_report_path, dashboard_path]
 #Year report should start from
@@ -1,19 +1,28 @@
 import pandas as pd
-from database.ms_sql_connection import fetch_query
-from utils.utils import update_dashboard, combined_df
+from functools import partial
+from database.ms_sql_connection import fetch_typed
+from utils.utils import update_dashboard, combined_df, save_frame
+from utils.month_planner import report_months
+from utils.runner import Step, run_steps
 from environment.settings import config
 
+#Column type hints for the typed fetch, shared by the outcome and non outcome scripts
+los_schema={"AnimalID": "int64", "Species": "category", "IntakeDate": "date",
+            "OutcomeDate": "date", "DaysInFoster": "int32", "TotalLOS": "int32",
+            "DaysInShelter": "int32", "OutcomeType": "category", "ReportDate": "date",
+            "Type": "category"}
+
 
 def los_outcome_script(year: int, month: int) -> pd.DataFrame:
     #Generates report date as previous
     reference_date=f'{year}-{month:02}-01'
     
-    query=f"""
+    query="""
         -- ========================================
         -- REPORT: Total Pets that Came in Previous Month
         -- ========================================
 
-        DECLARE @ReportDate DATE = '{reference_date}';
+        DECLARE @ReportDate DATE = ?;
         DECLARE @PrevMonthStart DATE = DATEADD(MONTH, -1, @ReportDate);
         DECLARE @PrevMonthEnd DATE = @ReportDate;
 
@@ -153,20 +162,20 @@ def los_outcome_script(year: int, month: int) -> pd.DataFrame:
         order by AnimalID;
         """
 
-    df=fetch_query(query)
+    df=fetch_typed(query, (reference_date,), schema=los_schema)
     return df
     
 
 def los_nonoutcome_script(year: int, month: int) -> pd.DataFrame:
     #fetches current date
     reference_date=f'{year}-{month:02}-01'
-    query=f"""
+    query="""
 
     -- ========================================
     -- REPORT: Total Pets that Came in Previous Month
     -- ========================================
 
-    DECLARE @ReportDate DATE = '{reference_date}';
+    DECLARE @ReportDate DATE = ?;
     DECLARE @PrevMonthStart DATE = DATEADD(MONTH, -1, @ReportDate);
     DECLARE @PrevMonthEnd DATE = @ReportDate;
 
@@ -305,14 +314,15 @@ def los_nonoutcome_script(year: int, month: int) -> pd.DataFrame:
     order by AnimalID;
 	
     """
-    df=fetch_query(query)
+    df=fetch_typed(query, (reference_date,), schema=los_schema)
     return df
 
-def parse_combined_df(los_function, start_year, end_year) -> pd.DataFrame:
+def parse_combined_df(los_function, report_year) -> pd.DataFrame:
   """Combines the dataframes for each year and months into a single dataframe"""
-  df=combined_df(los_function, start_year, end_year)
-  df["ReportDate"]=df["ReportDate"].apply(pd.to_datetime)
-  df["IntakeDate"]=df["IntakeDate"].apply(pd.to_datetime)
+  df=combined_df(los_function, report_months(report_year))
+  #Vectorised, and a no-op when the typed fetch already returned datetime64
+  df["ReportDate"]=pd.to_datetime(df["ReportDate"])
+  df["IntakeDate"]=pd.to_datetime(df["IntakeDate"])
 
   return df    
 
@@ -333,13 +343,29 @@ def normalize_excel_data_columns(df: pd.DataFrame):
 })
     return df
   
+def month_needs(report_year) -> list:
+    """(extractor, months) pairs the report reads, see utils.month_planner"""
+    months=report_months(report_year)
+    return [(los_outcome_script, months), (los_nonoutcome_script, months)]
+
+def update_report_dashboard(outcome, nonoutcome) -> None:
+    update_dashboard(dashboard_path, {'Outcome': outcome, 'NonOutcome': nonoutcome})
+
+def steps(report_year) -> list:
+    """The report as steps for utils.runner"""
+    return [
+        Step("outcome_raw", "sql", partial(parse_combined_df, los_outcome_script, report_year)),
+        Step("nonoutcome_raw", "sql", partial(parse_combined_df, los_nonoutcome_script, report_year)),
+        Step("outcome", "cpu", normalize_excel_data_columns, needs={"df": "outcome_raw"}),
+        Step("nonoutcome", "cpu", normalize_excel_data_columns, needs={"df": "nonoutcome_raw"}),
+        Step("save_outcome", "excel", partial(save_frame, path=outcome_path, index=False), needs={"df": "outcome"}),
+        Step("save_nonoutcome", "excel", partial(save_frame, path=non_outcome_path), needs={"df": "nonoutcome"}),
+        Step("dashboard", "excel", update_report_dashboard, needs=("outcome", "nonoutcome")),
+    ]
+
 def run_los_report(report_year):
     """Function to run all scripts"""
-    los_outcome_data=parse_combined_df(los_outcome_script,report_year,report_year)
-    los_nonoutcome_data=parse_combined_df(los_nonoutcome_script,report_year,report_year)
-    normalize_excel_data_columns(los_outcome_data).to_excel(outcome_path, index=False)
-    normalize_excel_data_columns(los_nonoutcome_data).to_excel(non_outcome_path)
-    update_dashboard(dashboard_path)
+    run_steps(steps(report_year))
     return
 
 outcome_filename="los_outcome_data.xlsx"
@@ -347,4 +373,9 @@ outcome_path=f"{config.SERVER_PATH}/los_in_shelter/{outcome_filename}"
 non_outcome_filename="los_nonoutcome_data.xlsx"
 non_outcome_path=f"{config.SERVER_PATH}/los_in_shelter/{non_outcome_filename}"
 dashboard_filename="los_shelter_dashboard.xlsx"
-dashboard_path=f"{config.SERVER_PATH}/los_in_shelter/{dashboard_filename}"
\ No newline at end of file
+dashboard_path=f"{config.SERVER_PATH}/los_in_shelter/{dashboard_filename}"
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [outcome_path, non_outcome_path, dashboard_path]
@@ -1,18 +1,26 @@
 import pandas as pd
 import numpy as np
 from dateutil.relativedelta import relativedelta
-from database.ms_sql_connection import fetch_query
-from utils.utils import update_dashboard
+from functools import partial
+from database.ms_sql_connection import reduce_query
 from environment.settings import config
-from utils.utils import update_dashboard, combined_df
-from datetime import datetime
+from utils.utils import update_dashboard, combined_df, stream_to_excel, save_bi_data, save_frame
+from utils.month_planner import report_months, as_of
+from utils.runner import Step, run_steps
+
+#Column type hints for the typed fetch
+adult_schema={"AnimalID": "int64", "DateofBirth": "date", "IntakeDate": "datetime",
+              "SurgeryDate": "datetime", "StageDate": "datetime", "IntakeAge": "int32",
+              "SurgeryWait": "int32", "Sx_goal": "int32", "Species": "category",
+              "IntakeType": "category", "Medication": "category", "Surgerycategory": "category",
+              "Stage": "category", "Agegroup": "category"}
 
 
 def adult_extraction(year: int, month: int):
   reference_date=f'{year}-{month:02}-01'
   print(reference_date)
   
-  adult_query= f"""DECLARE @ReportDate DATE = '{reference_date}';
+  adult_query= """DECLARE @ReportDate DATE = ?;
 DECLARE @PrevMonthStart DATE = DATEADD(MONTH, -1, @ReportDate);
 DECLARE @PrevMonthEnd DATE = @ReportDate;
 WITH SurgeryMap AS (
@@ -187,19 +195,20 @@ WHERE
   AND species = 'Rabbit'
   """
 
-  df = fetch_query(adult_query)
+  #History back to 2019 is pulled every month, stream it in chunks
+  df = reduce_query(adult_query, (reference_date,), schema=adult_schema)
 
   
   return df
 
-def parse_combined_df(adult_extract_function, start_year, end_year) -> pd.DataFrame:
+def parse_combined_df(adult_extract_function, report_year) -> pd.DataFrame:
   """Combines the dataframes for each year and months into a single dataframe"""
-  df=combined_df(adult_extract_function, start_year, end_year)
+  df=combined_df(adult_extract_function, report_months(report_year, years=report_years))
   df['SurgeryDate'] = pd.to_datetime(df['SurgeryDate']).dt.date
 
   # Corrected filtering with parentheses and proper types
   min_SurgeryDate = df['SurgeryDate'].min()
-  max_SurgeryDate = pd.Timestamp.today().normalize()
+  max_SurgeryDate = pd.Timestamp(as_of()).normalize()
   print(max_SurgeryDate)
   SurgeryDate_range = pd.date_range(min_SurgeryDate, max_SurgeryDate, freq='MS')
 
@@ -242,9 +251,10 @@ def filter_last_12_months(df):
         pd.DataFrame: Filtered DataFrame with missing months populated.
     """
     # Ensure ReferenceDate is in datetime format
+    df = df.copy()  # The yearly frame is also written as is
     df["SurgeryDate"] = pd.to_datetime(df["SurgeryDate"])
     # Get today's date normalized to midnight
-    today = pd.Timestamp.today().normalize()
+    today = pd.Timestamp(as_of()).normalize()
 
     # First day of the current month
     max_date = today.replace(day=1)
@@ -261,8 +271,9 @@ def filter_last_12_months(df):
 
 def filter_current_year_data(df):
     # Ensure ReferenceDate is in datetime format
+    df = df.copy()  # The yearly frame is also written as is
     df["SurgeryDate"] = pd.to_datetime(df["SurgeryDate"])
-    current_year=datetime.today().year
+    current_year=as_of().year
 
     # Start date = first day of the month 12 months ago
     start_date = pd.Timestamp(year=current_year, month=1, day=1)
@@ -275,21 +286,45 @@ def filter_current_year_data(df):
     return df.loc[mask]
 
 
+def month_needs(report_year) -> list:
+  """(extractor, months) pairs the report reads, see utils.month_planner"""
+  return [(adult_extraction, report_months(report_year, years=report_years))]
+
+
+def save_yearly(yearly) -> None:
+  #Four years of surgeries, streamed so the workbook is never built in memory
+  stream_to_excel(yearly_path, {'Sheet1': yearly})
+
+
+def update_report_dashboard(adult, yearly) -> None:
+  update_dashboard(dashboard_path, {'Adult': adult, 'Yearly': yearly})
+
+
+def steps(end_year) -> list:
+  """The report as steps for utils.runner"""
+  return [
+    Step("yearly", "sql", partial(parse_combined_df, adult_extraction, end_year)),
+    Step("save_yearly", "excel", save_yearly, needs=("yearly",)),
+    Step("adult", "cpu", filter_current_year_data, needs={"df": "yearly"}),
+    Step("save_adult", "excel", partial(save_frame, path=report_path, header=True, index=False, sheet_name='Adult'),
+         needs={"df": "adult"}),
+    Step("bi_data", "cpu", filter_last_12_months, needs={"df": "yearly"}),
+    Step("save_bi", "excel", partial(save_bi_data, bi_report_path), needs={"sheets": "bi_data"}),
+    Step("dashboard", "excel", update_report_dashboard, needs=("adult", "yearly")),
+  ]
+
+
 def run_sx_wait_time_report(end_year):
   """Function to run all scripts"""
-  yearly=parse_combined_df(adult_extract_function=adult_extraction, start_year=end_year-3, end_year=end_year)
-  yearly.to_excel(yearly_path,index=False)
-  adult_df=filter_current_year_data(yearly)
-  adult_df.to_excel(report_path, header=True, index=False, sheet_name = 'Adult')
-  bi_data=filter_last_12_months(yearly)
-  bi_data.to_excel(bi_report_path,index=False)
-  update_dashboard(dashboard_path)
+  run_steps(steps(end_year))
   return
 
 
 
 bi_report_filename="sx_wait_time_bi_report.xlsx"
 bi_report_path=f"{config.SERVER_PATH}/power_bi/{bi_report_filename}"
+#Calendar years of history the yearly sheet covers, ending with the report month
+report_years=4
 #Path to report on local server
 report_filename="sx_report.xlsx"
 report_path=f"{config.SERVER_PATH}/sx_wait_time/{report_filename}"
@@ -298,3 +333,8 @@ yearly_path=f"{config.SERVER_PATH}/sx_wait_time/{yearly_filename}"
 #dashboard_path
 dashboard_filename="sx_DashBoard.xlsx"
 dashboard_path=f"{config.SERVER_PATH}/sx_wait_time/{dashboard_filename}"
+
+
+def output_paths() -> list:
+    """Files the report writes, listed by main.py --dry-run"""
+    return [yearly_path, report_path, bi_report_path, dashboard_path]
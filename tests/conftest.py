@@ -0,0 +1,6 @@
+import os
+
+#The settings the utils modules read at import, for machines without a .env
+os.environ.setdefault("MS_SQL_DB", "test")
+os.environ.setdefault("SERVER_PATH", os.path.join(os.path.dirname(__file__), "output"))
+os.environ.setdefault("REMOTE_PATH", os.path.join(os.path.dirname(__file__), "output"))
@@ -0,0 +1,43 @@
+"""Census answers and the cohort age groups built from it, on frames made in memory.
+
+Usage: python -m pytest tests
+"""
+import pandas as pd
+from reports.infection_surveillance import age_group
+from utils.census import Census
+
+
+def census() -> Census:
+    visits = pd.DataFrame({"animalid": [1, 2, 3],
+                           "intakedate": pd.to_datetime(["2025-01-05", "2025-01-20", "2025-02-10"]),
+                           "outcomedate": pd.to_datetime(["2025-02-01", None, "2025-02-15"]),
+                           "species": ["Cat", "Dog", "Cat"]})
+    statuses = pd.DataFrame({"animalid": [1, 1, 2],
+                             "name": ["Tom", "Tom", "Rex"],
+                             "dateofbirth": pd.to_datetime(["2024-06-01", "2024-06-01", "2023-01-01"]),
+                             "stagedate": pd.to_datetime(["2025-01-05", "2025-01-10", "2025-01-20"]),
+                             "intakedate": pd.to_datetime(["2025-01-05", "2025-01-05", "2025-01-20"]),
+                             "species": ["Cat", "Cat", "Dog"],
+                             "stage": ["Evaluate", "Medical Treatment", "Stray Holding - Canine"],
+                             "status": ["A", "A", "A"],
+                             "intaketype": ["Stray", "Stray", "OwnerSurrender"]})
+    return Census(visits, statuses)
+
+
+def test_population_counts_visits_up_to_their_outcome():
+    population = census().population(pd.to_datetime(["2025-01-15", "2025-02-01", "2025-02-12"]), by="species")
+    assert population.to_dict("list") == {"Cat": [1, 0, 1], "Dog": [0, 1, 1]}
+
+
+def test_inventory_keeps_the_latest_active_stage():
+    inventory = census().inventory(pd.Timestamp("2025-01-25"))
+    assert inventory[["animalid", "stage"]].values.tolist() == [[1, "Medical Treatment"],
+                                                               [2, "Stray Holding - Canine"]]
+
+
+def test_age_group_counts_sundays_crossed_like_datediff_week():
+    #Born on a Saturday: the Sunday 2025-02-02 is 19 whole weeks later but the 20th Sunday crossed
+    df = pd.DataFrame({"dateofbirth": pd.to_datetime(["2024-09-21", "2024-09-21", "2024-09-21", "2020-01-01"]),
+                       "Referencedate": pd.to_datetime(["2025-02-01", "2025-02-02", "2025-02-02", "2025-02-01"]),
+                       "species": ["Cat", "Cat", "Dog", "Dog"]})
+    assert age_group(df).tolist() == ["Kitten", "Adult", "Adult", "Adult"]
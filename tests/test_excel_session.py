@@ -0,0 +1,96 @@
+"""ExcelSession queueing and restarts, run against FakeExcelDriver.
+
+Usage: python -m pytest tests
+"""
+import pytest
+from utils.excel_session import ExcelDriver, ExcelSession, FakeExcelDriver
+
+
+def session(fail_on: list = None, max_restarts: int = 2) -> tuple:
+    """A session whose drivers all record into one list and share one list of crashes"""
+    calls = []
+    fail_on = list(fail_on or [])
+
+    def driver_factory():
+        driver = FakeExcelDriver(calls)
+        #Shared, so a crash happens once whichever Excel instance hits it
+        driver.fail_on = fail_on
+        return driver
+
+    return ExcelSession(driver_factory, max_restarts=max_restarts), calls
+
+
+def test_queue_merges_operations_per_workbook():
+    excel, calls = session()
+    excel.queue("a.xlsx", "refresh")
+    excel.queue("b.xlsx", "autofit")
+    excel.queue("a.xlsx", "autofit", "refresh")
+    excel.close()
+    assert calls == [("start",),
+                     ("open", "a.xlsx"), ("refresh", "a.xlsx"), ("autofit", "a.xlsx"),
+                     ("save", "a.xlsx"), ("close", "a.xlsx"),
+                     ("open", "b.xlsx"), ("autofit", "b.xlsx"), ("save", "b.xlsx"), ("close", "b.xlsx"),
+                     ("quit",)]
+
+
+def test_queue_rejects_unknown_operations():
+    excel, _ = session()
+    with pytest.raises(ValueError):
+        excel.queue("a.xlsx", "print")
+
+
+def test_flush_without_work_does_not_start_excel():
+    excel, calls = session()
+    excel.close()
+    assert calls == []
+
+
+def test_crash_restarts_excel_and_retries_the_workbook():
+    excel, calls = session(fail_on=[("refresh", "a.xlsx")])
+    excel.queue("a.xlsx", "refresh")
+    excel.queue("b.xlsx", "refresh")
+    excel.close()
+    assert calls == [("start",), ("open", "a.xlsx"), ("refresh", "a.xlsx"), ("quit",),
+                     ("start",), ("open", "a.xlsx"), ("refresh", "a.xlsx"), ("save", "a.xlsx"), ("close", "a.xlsx"),
+                     ("open", "b.xlsx"), ("refresh", "b.xlsx"), ("save", "b.xlsx"), ("close", "b.xlsx"),
+                     ("quit",)]
+    assert excel.restarts == 1
+    assert excel.failed == {}
+
+
+def test_exhausted_restarts_fail_only_that_workbook():
+    excel, calls = session(fail_on=[("open", "a.xlsx")] * 3, max_restarts=2)
+    excel.queue("a.xlsx", "refresh")
+    excel.queue("b.xlsx", "refresh")
+    with pytest.raises(RuntimeError, match="a.xlsx"):
+        excel.close()
+    assert calls.count(("open", "a.xlsx")) == 3
+    assert ("save", "a.xlsx") not in calls
+    #The workbook queued after the bad one still runs
+    assert calls[-5:] == [("open", "b.xlsx"), ("refresh", "b.xlsx"), ("save", "b.xlsx"), ("close", "b.xlsx"),
+                          ("quit",)]
+    assert list(excel.failed) == ["a.xlsx"]
+
+
+def test_restarts_are_counted_per_workbook():
+    excel, calls = session(fail_on=[("open", "a.xlsx"), ("open", "a.xlsx"),
+                                    ("open", "b.xlsx"), ("open", "b.xlsx")], max_restarts=2)
+    excel.queue("a.xlsx", "refresh")
+    excel.queue("b.xlsx", "refresh")
+    excel.close()
+    assert ("save", "a.xlsx") in calls and ("save", "b.xlsx") in calls
+    assert excel.restarts == 4
+    assert excel.failed == {}
+
+
+def test_incomplete_driver_cannot_be_created():
+    class NoQuit(ExcelDriver):
+        def start(self): pass
+        def open(self, path): return path
+        def autofit(self, workbook): pass
+        def refresh(self, workbook): pass
+        def save(self, workbook): pass
+        def close(self, workbook): pass
+
+    with pytest.raises(TypeError):
+        NoQuit()
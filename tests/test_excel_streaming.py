@@ -0,0 +1,36 @@
+"""stream_to_excel keeps memory flat however many rows it writes.
+
+Usage: python -m pytest tests
+"""
+import tracemalloc
+import numpy as np
+import pandas as pd
+from utils.utils import stream_to_excel
+
+CHUNKSIZE = 500
+
+
+def chunks(rows: int):
+    """Frames of CHUNKSIZE rows built on demand, like database.ms_sql_connection.stream_query"""
+    for start in range(0, rows, CHUNKSIZE):
+        size = min(CHUNKSIZE, rows - start)
+        yield pd.DataFrame({"animalid": np.arange(start, start + size),
+                            "name": [f"Pet {i}" for i in range(start, start + size)],
+                            "intakedate": pd.Timestamp("2025-01-01") + pd.to_timedelta(np.arange(size), unit="min"),
+                            "weight": np.linspace(1, 40, size)})
+
+
+def peak_bytes(path, rows: int) -> int:
+    tracemalloc.start()
+    try:
+        assert stream_to_excel(str(path), {"Sheet1": chunks(rows)}) == rows
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_stream_to_excel_peak_does_not_grow_with_rows(tmp_path):
+    small = peak_bytes(tmp_path / "small.xlsx", 2 * CHUNKSIZE)
+    large = peak_bytes(tmp_path / "large.xlsx", 16 * CHUNKSIZE)
+    #8x the rows, the peak stays that of one chunk
+    assert large <= 1.5 * small
@@ -0,0 +1,237 @@
+"""In-memory census of the animals in the shelter's care.
+
+The infection denominators, the LOS non-outcomed inventory and the kitten
+mortality Denom all ask which animals were in care on a date, and in what
+stage, each with its own heavy query per month. Census loads the visit
+intervals (txnVisit intake to outcome) and the stage transitions
+(HistoryStatus) once, keeps their times as sorted int64 arrays and answers
+those questions for any grid of dates (monthly, weekly, daily) in memory:
+
+- population(dates, by): animals in care at each date, optionally per group,
+  from searchsorted over the sorted intake and outcome times of each group;
+- in_care(when): the visits in care at a date, cut from the intake-sorted
+  visits with one searchsorted;
+- stage_at(when) / stages(dates): the latest stage transition of every animal
+  in care at a date, found with one searchsorted over (animal, time) keys, and
+  the number of animals per stage counted with bincount;
+- inventory(when): the inventory snapshot of the infection cohort, see below.
+
+A visit is in care from its intake up to, not including, its outcome, and
+stays in care while it has no outcome.
+
+Usage: census = Census.load(date(2024, 1, 1), date(2025, 12, 31)), then ask it
+for any date in that span without going back to the database.
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from database.ms_sql_connection import reduce_query
+
+#Stages and intake types of the inventory part of the infection cohort query
+INVENTORY_STAGES = ('Released', 'Pre-Euthanasia', 'Foster Program', 'Evaluate', 'Stray Holding - Feline',
+                    'Stray Holding - Canine', 'Pre-Intake', 'Surgery Needed', 'Pending Behavior Assessment',
+                    'Bite Quarantine', 'Medical Observation', 'Foster Needed', 'Medical Treatment',
+                    'Behavior Observation')
+INTAKE_TYPES = ('TransferIn', 'OwnerSurrender', '[Return]', 'Stray')
+
+#Time of a missing outcome or intake, later than any date asked for
+NEVER = np.iinfo(np.int64).max
+
+visits_schema = {"animalid": "int64", "intakedate": "datetime", "outcomedate": "datetime",
+                 "species": "category", "intaketype": "category", "outcometype": "category"}
+statuses_schema = {"animalid": "int64", "dateofbirth": "date", "stagedate": "datetime",
+                   "intakedate": "datetime", "species": "category", "stage": "category",
+                   "status": "category", "intaketype": "category"}
+
+
+def seconds(values) -> np.ndarray:
+    """Datetimes (or dates) as int64 seconds, missing ones as NEVER"""
+    times = pd.to_datetime(pd.Series(values)).to_numpy(dtype="datetime64[s]")
+    out = times.astype(np.int64)
+    out[np.isnat(times)] = NEVER
+    return out
+
+
+def year_before(when) -> pd.Timestamp:
+    """DATEADD(YEAR, -1, when)"""
+    return pd.Timestamp(when) - pd.DateOffset(years=1)
+
+
+class Census:
+    """Visit intervals and stage transitions held in memory, see the module docstring.
+
+    `visits` has one row per visit with animalid, intakedate and outcomedate
+    (NaT while in care) plus any columns to group by. `statuses` has one row
+    per stage transition with animalid, stagedate, stage and status, and the
+    intakedate and intaketype of the visit it belongs to.
+    """
+
+    def __init__(self, visits: pd.DataFrame, statuses: pd.DataFrame):
+        visits = visits[visits["intakedate"].notna()]
+        #An outcome recorded before its intake would count the visit out before it came in
+        visits = visits[~(visits["outcomedate"] < visits["intakedate"])]
+        self.visits = visits.sort_values("intakedate", kind="stable").reset_index(drop=True)
+        self._intake = seconds(self.visits["intakedate"])
+        self._outcome = seconds(self.visits["outcomedate"])
+
+        statuses = statuses[statuses["stagedate"].notna()]
+        self.statuses = statuses.sort_values(["animalid", "stagedate"], kind="stable").reset_index(drop=True)
+        self._animals, self._status_animal = np.unique(self.statuses["animalid"].to_numpy(), return_inverse=True)
+        self._stagedate = seconds(self.statuses["stagedate"])
+        self._status_intake = seconds(self.statuses["intakedate"])
+        self._stage_codes, self.stage_names = pd.factorize(self.statuses["stage"], sort=True)
+        #(animal, time) as one sorted key, so the latest transition of every animal at
+        #a date is a single searchsorted
+        self._origin = int(self._stagedate.min()) if len(self._stagedate) else 0
+        self._span = (int(self._stagedate.max()) - self._origin + 2) if len(self._stagedate) else 2
+        self._status_key = self._status_animal.astype(np.int64) * self._span + (self._stagedate - self._origin)
+
+    @classmethod
+    def load(cls, start: date, end: date) -> "Census":
+        """Census of the cats and dogs for dates from start to end, in two queries. Stage
+        transitions are loaded from a year before start, the inventory look-back."""
+        params = (start.isoformat(), end.isoformat())
+        visits = reduce_query("""DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+    SELECT
+      txnVisit.AnimalID AS animalid,
+      refSpecies.Species AS species,
+      txnVisit.IntakeType AS intaketype,
+      txnVisit.tin_DateCreated AS intakedate,
+      txnVisit.tOut_DateCreated AS outcomedate,
+      txnVisit.OutComeType AS outcometype
+    FROM txnVisit
+    INNER JOIN Animal
+      ON txnVisit.AnimalID = Animal.AnimalID
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND txnVisit.tin_DateCreated < DATEADD(DAY, 1, @EndDate)
+    AND (txnVisit.tOut_DateCreated >= @StartDate
+    OR txnVisit.tOut_DateCreated IS NULL)""", params, schema=visits_schema)
+        statuses = reduce_query("""DECLARE @StartDate DATE = ?;
+    DECLARE @EndDate DATE = ?;
+    SELECT
+      HistoryStatus.AnimalID AS animalid,
+      Animal.Name AS name,
+      refSpecies.Species AS species,
+      AnimalDetails.DateOfBirth AS dateofbirth,
+      refAnimalStage.Stage AS stage,
+      HistoryStatus.LastUpdated AS stagedate,
+      HistoryStatus.Status AS status,
+      txnVisit.IntakeType AS intaketype,
+      txnVisit.tin_DateCreated AS intakedate
+    FROM HistoryStatus
+    INNER JOIN Animal
+      ON HistoryStatus.AnimalID = Animal.AnimalID
+    INNER JOIN refSpecies
+      ON Animal.SpeciesID = refSpecies.SpeciesID
+    INNER JOIN AnimalDetails
+      ON Animal.AnimalID = AnimalDetails.AnimalID
+    LEFT OUTER JOIN txnVisit
+      ON txnVisit.AnimalID = HistoryStatus.AnimalID
+      AND txnVisit.InPrimaryKey = HistoryStatus.OperationPrimaryID
+    LEFT OUTER JOIN refAnimalStage
+      ON HistoryStatus.StageID = refAnimalStage.StageID
+    WHERE (refSpecies.Species IN ('Cat', 'Dog'))
+    AND HistoryStatus.LastUpdated >= DATEADD(YEAR, -1, @StartDate)
+    --Later transitions only matter for the intake they carry
+    AND (HistoryStatus.LastUpdated < DATEADD(DAY, 1, @EndDate)
+    OR txnVisit.tin_DateCreated < DATEADD(DAY, 1, @EndDate))""", params, schema=statuses_schema)
+        return cls(visits, statuses)
+
+    def population(self, dates, by: str = None) -> pd.DataFrame:
+        """Animals in care at each date, one row per date and one column per value of `by`
+        (a visits column such as species), or a single "population" column"""
+        times = seconds(dates)
+        if by is None:
+            codes, labels = np.zeros(len(self.visits), dtype=np.int64), pd.Index(["population"])
+        else:
+            codes, labels = pd.factorize(self.visits[by], sort=True)
+        counts = np.empty((len(times), len(labels)), dtype=np.int64)
+        for code in range(len(labels)):
+            member = codes == code
+            intakes = np.sort(self._intake[member])
+            outcomes = np.sort(self._outcome[member])
+            #Came in by the date, minus left by the date
+            counts[:, code] = (np.searchsorted(intakes, times, side="right")
+                               - np.searchsorted(outcomes, times, side="right"))
+        return pd.DataFrame(counts, index=pd.DatetimeIndex(pd.to_datetime(list(dates)), name="date"),
+                            columns=pd.Index(labels, name=by))
+
+    def in_care(self, when) -> pd.DataFrame:
+        """The visits in care at `when`"""
+        time = seconds([when])[0]
+        came_in = np.searchsorted(self._intake, time, side="right")
+        still_in = self._outcome[:came_in] > time
+        return self.visits.iloc[:came_in][still_in]
+
+    def _in_care_animals(self, time: int) -> np.ndarray:
+        """Whether each animal of statuses has a visit in care at `time`"""
+        came_in = np.searchsorted(self._intake, time, side="right")
+        still_in = self._outcome[:came_in] > time
+        return np.isin(self._animals, self.visits["animalid"].to_numpy()[:came_in][still_in])
+
+    def _latest(self, time: int) -> np.ndarray:
+        """Index into statuses of the latest transition at `time` of every animal in care
+        then, -1 for animals that are not in care or have no transition yet"""
+        offset = np.clip(time - self._origin, -1, self._span - 1)
+        animals = np.arange(len(self._animals), dtype=np.int64)
+        index = np.searchsorted(self._status_key, animals * self._span + offset, side="right") - 1
+        #A search that lands on the previous animal's transitions means this one has none yet
+        found = (index >= 0) & (self._status_animal[np.maximum(index, 0)] == animals)
+        #Animals that have left keep their last transition (e.g. Released), they are not counted
+        return np.where(found & self._in_care_animals(time), index, -1)
+
+    def stage_at(self, when) -> pd.DataFrame:
+        """The latest stage transition of every animal in care at `when`"""
+        index = self._latest(seconds([when])[0])
+        return self.statuses.iloc[index[index >= 0]]
+
+    def stages(self, dates) -> pd.DataFrame:
+        """Animals in care per stage at each date, by their latest transition at that date.
+        Rows sum to population(dates) when every animal in care has one visit in care and
+        a stage transition loaded."""
+        rows = []
+        for time in seconds(dates):
+            index = self._latest(time)
+            codes = self._stage_codes[index[index >= 0]]
+            rows.append(np.bincount(codes[codes >= 0], minlength=len(self.stage_names)))
+        return pd.DataFrame(np.array(rows, dtype=np.int64).reshape(len(rows), len(self.stage_names)),
+                            index=pd.DatetimeIndex(pd.to_datetime(list(dates)), name="date"),
+                            columns=pd.Index(self.stage_names, name="stage"))
+
+    def inventory(self, when, stages: tuple = INVENTORY_STAGES, intake_types: tuple = INTAKE_TYPES) -> pd.DataFrame:
+        """The inventory part of reports.infection_surveillance.infection_cohort at `when`, row for row
+        but without Agegroup: animals whose latest transition in the year up to `when` is
+        active, with their last intake before `when`. Only transitions in `stages`, of visits
+        with one of `intake_types` (or none) and within the year count."""
+        time = seconds([when])[0]
+        year_back = seconds([year_before(when)])[0]
+        no_intake = self._status_intake == NEVER
+        counted = (self.statuses["stage"].isin(stages).to_numpy()
+                   & (self.statuses["intaketype"].isin(intake_types).to_numpy()
+                      | self.statuses["intaketype"].isna().to_numpy())
+                   & (self._stagedate >= year_back)
+                   & ((self._status_intake >= year_back) | no_intake))
+        #Latest stage date in the look-back and last intake before `when`, per animal
+        latest = np.full(len(self._animals), -1, dtype=np.int64)
+        window = counted & (self._stagedate > year_back) & (self._stagedate <= time)
+        np.maximum.at(latest, self._status_animal[window], self._stagedate[window])
+        past_intake = np.full(len(self._animals), -1, dtype=np.int64)
+        before = counted & ~no_intake & (self._status_intake < time)
+        np.maximum.at(past_intake, self._status_animal[before], self._status_intake[before])
+        keep = (counted
+                & (self._stagedate == latest[self._status_animal])
+                & (past_intake[self._status_animal] >= 0)
+                & (self.statuses["status"] == "A").to_numpy()
+                & self.statuses["dateofbirth"].notna().to_numpy())
+        rows = self.statuses[keep].assign(stage=self.statuses.loc[keep, "stage"].astype(str))
+        #Min(stage) picks the first stage when there are 2 stages for the same stagedate
+        df = (rows.groupby("animalid", sort=True)
+              .agg(name=("name", "first"), species=("species", "first"), dateofbirth=("dateofbirth", "first"),
+                   stagedate=("stagedate", "first"), status=("status", "first"), stage=("stage", "min"))
+              .reset_index())
+        df["intakedate"] = pd.to_datetime(past_intake[np.searchsorted(self._animals, df["animalid"].to_numpy())], unit="s")
+        df["Referencedate"] = pd.Timestamp(when).normalize()
+        return df
@@ -0,0 +1,42 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from environment.settings import config
+
+
+def report_worker_cap(now: datetime = None) -> int:
+    """How many months one report may fetch at once, lower during weekday business hours"""
+    now = now or datetime.now()
+    business_hours = now.weekday() < 5 and config.BUSINESS_HOURS_START <= now.hour < config.BUSINESS_HOURS_END
+    return max(config.BUSINESS_HOURS_MAX_WORKERS if business_hours else config.REPORT_MAX_WORKERS, 1)
+
+
+class ReportSlots:
+    """Caps the number of in-flight fetches per report.
+
+    Every report shares one counter however many combined_df calls it has
+    running, so a report fetching its numerator and denominator side by side
+    still stays under the cap. The cap is re-read on each acquire and follows
+    the time of day.
+    """
+
+    def __init__(self, cap_fn=report_worker_cap):
+        self.cap_fn = cap_fn
+        self._active = {}
+        self._changed = threading.Condition()
+
+    @contextmanager
+    def slot(self, report: str):
+        with self._changed:
+            while self._active.get(report, 0) >= self.cap_fn():
+                self._changed.wait()
+            self._active[report] = self._active.get(report, 0) + 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._active[report] -= 1
+                self._changed.notify_all()
+
+
+report_slots = ReportSlots()
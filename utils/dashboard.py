@@ -0,0 +1,114 @@
+"""Dashboard refresh without Excel.
+
+The dashboards used to be refreshed by opening them in Excel over COM and
+calling RefreshAll(). Instead the reports hand their frames (and the
+summaries the dashboard pivots show, see rate_summary) to refresh_dashboard,
+which writes them into the dashboard's data sheets with openpyxl. Cell styles
+of the data rows, Excel tables, charts and pivot tables stay in place: tables
+and pivot sources are resized to the new data and pivot caches are flagged to
+refresh when the workbook is next opened.
+"""
+import os
+from copy import copy
+import pandas as pd
+
+
+def rate_summary(numerator: pd.DataFrame, denominator: pd.DataFrame, by: list,
+                 id_column: str) -> pd.DataFrame:
+    """Cases, population and rate in percent per group, counting distinct `id_column`.
+
+    e.g. rate_summary(df_num, df_denom, ["Referencedate", "species", "Agegroup"], "animalid")
+    gives the infection rate by month, species and age group.
+    """
+    cases = numerator.groupby(by, observed=True)[id_column].nunique().rename("cases")
+    population = denominator.groupby(by, observed=True)[id_column].nunique().rename("population")
+    summary = pd.concat([population, cases], axis=1).fillna(0).astype("int64").reset_index()
+    rate = summary["cases"] / summary["population"].where(summary["population"] > 0)
+    summary["rate_percent"] = (rate * 100).round(2)
+    return summary
+
+
+def _cell_values(df: pd.DataFrame) -> pd.DataFrame:
+    """df as Python objects openpyxl can write, months as their first day and blanks as None"""
+    df = df.copy()
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.PeriodDtype):
+            df[name] = df[name].dt.to_timestamp()
+    return df.astype(object).where(df.notna(), None)
+
+
+def write_frame(ws, df: pd.DataFrame, first_row: int = 1, first_column: int = 1) -> str:
+    """Replaces the data block of a sheet with df (header row included) and returns its range.
+
+    Every new cell takes the style of the first data cell previously in its
+    column, so number formats and fills carry over however many rows there are.
+    """
+    from openpyxl.utils import get_column_letter
+    old_last_row = ws.max_row
+    styles = {}
+    for offset in range(max(df.shape[1], ws.max_column - first_column + 1)):
+        sample = ws.cell(row=first_row + 1, column=first_column + offset)
+        if sample.has_style:
+            styles[offset] = copy(sample._style)
+    if old_last_row > first_row:
+        ws.delete_rows(first_row + 1, old_last_row - first_row)
+
+    for offset, name in enumerate(df.columns):
+        ws.cell(row=first_row, column=first_column + offset, value=str(name))
+    for row, values in enumerate(_cell_values(df).itertuples(index=False, name=None), start=first_row + 1):
+        for offset, value in enumerate(values):
+            cell = ws.cell(row=row, column=first_column + offset, value=value)
+            if offset in styles:
+                cell._style = copy(styles[offset])
+
+    last_row = first_row + max(len(df), 1)
+    last_column = first_column + max(df.shape[1], 1) - 1
+    return (f"{get_column_letter(first_column)}{first_row}:"
+            f"{get_column_letter(last_column)}{last_row}")
+
+
+def _resize_tables(ws, ref: str, columns: list) -> None:
+    """Points an Excel table anchored at the data block to its new range and header"""
+    from openpyxl.worksheet.table import TableColumn
+    anchor = ref.split(":")[0]
+    for table in ws.tables.values():
+        if table.ref.split(":")[0] != anchor:
+            continue
+        table.ref = ref
+        if table.autoFilter is not None:
+            table.autoFilter.ref = ref
+        if [column.name for column in table.tableColumns] != columns:
+            table.tableColumns = [TableColumn(id=position, name=name)
+                                  for position, name in enumerate(columns, start=1)]
+
+
+def _refresh_pivots(wb, ranges: dict) -> None:
+    """Re-points pivot caches built on a rewritten sheet and has Excel refresh them on open"""
+    for ws in wb.worksheets:
+        for pivot in getattr(ws, "_pivots", []):
+            cache = pivot.cache
+            source = cache.cacheSource.worksheetSource if cache.cacheSource is not None else None
+            if source is not None and source.sheet in ranges and source.ref is not None:
+                source.ref = ranges[source.sheet]
+            cache.refreshOnLoad = True
+
+
+def refresh_dashboard(path: str, sheets: dict) -> None:
+    """Writes each sheet name -> DataFrame into the dashboard at path and saves it.
+
+    Missing sheets are added at the end, a missing workbook is created with
+    just the data sheets.
+    """
+    from openpyxl import Workbook, load_workbook
+    if os.path.exists(path):
+        wb = load_workbook(path)
+    else:
+        wb = Workbook()
+        wb.remove(wb.active)
+    ranges = {}
+    for sheet_name, df in sheets.items():
+        ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.create_sheet(sheet_name)
+        ranges[sheet_name] = write_frame(ws, df)
+        _resize_tables(ws, ranges[sheet_name], [str(name) for name in df.columns])
+    _refresh_pivots(wb, ranges)
+    wb.save(path)
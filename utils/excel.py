@@ -0,0 +1,39 @@
+import pandas as pd
+
+#Excel's General format shows at most 11 characters of a number
+_NUMBER_WIDTH = 11
+#pandas writes datetime64 cells as YYYY-MM-DD HH:MM:SS
+_DATETIME_WIDTH = 19
+
+
+def column_widths(df: pd.DataFrame, max_width: int = 60, padding: int = 2) -> list:
+    """Excel column widths for a DataFrame, the longest cell or header of each column plus padding.
+
+    Stands in for Columns.AutoFit(): lengths are taken per column with the
+    vectorized string methods (or from the min and max for numbers and dates)
+    instead of per cell, and capped at `max_width`.
+    """
+    widths = []
+    for name in df.columns:
+        column = df[name]
+        values = column.dropna()
+        if values.empty:
+            longest = 0
+        elif pd.api.types.is_datetime64_any_dtype(column):
+            longest = _DATETIME_WIDTH
+        elif pd.api.types.is_bool_dtype(column):
+            longest = 5
+        elif pd.api.types.is_numeric_dtype(column):
+            longest = min(max(len(str(values.min())), len(str(values.max()))), _NUMBER_WIDTH)
+        else:
+            longest = int(values.astype(str).str.len().max())
+        widths.append(min(max(longest, len(str(name))) + padding, max_width))
+    return widths
+
+
+def write_sheet(writer: pd.ExcelWriter, df: pd.DataFrame, sheet_name: str, startrow: int = 0) -> None:
+    """Writes df to an xlsxwriter sheet with its columns already sized, no Excel round trip needed"""
+    df.to_excel(writer, header=True, index=False, sheet_name=sheet_name, startrow=startrow)
+    worksheet = writer.sheets[sheet_name]
+    for position, width in enumerate(column_widths(df)):
+        worksheet.set_column(position, position, width)
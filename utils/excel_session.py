@@ -0,0 +1,218 @@
+"""One Excel instance per run for the workbook operations that still need Excel.
+
+Column widths and dashboard data no longer go through Excel (see utils.excel
+and utils.dashboard), but Power Query connections inside a dashboard can only
+be refreshed by Excel itself. With EXCEL_REFRESH set (the default) and on
+Windows, update_dashboard queues a refresh here and run_all closes the session
+at the end, so Excel starts once and runs every queued operation instead of
+starting and quitting per file.
+
+The driver is the only part that talks to COM. FakeExcelDriver records the
+calls instead, so the queueing and restart logic can be exercised anywhere.
+"""
+import threading
+from abc import ABC, abstractmethod
+
+
+class ExcelDriver(ABC):
+    """What ExcelSession needs from Excel, one instance per Excel process. A driver
+    missing any of these cannot be created"""
+
+    @abstractmethod
+    def start(self) -> None:
+        ...
+
+    @abstractmethod
+    def open(self, path: str):
+        """Opens a workbook and returns a handle for the calls below"""
+
+    @abstractmethod
+    def autofit(self, workbook) -> None:
+        ...
+
+    @abstractmethod
+    def refresh(self, workbook) -> None:
+        ...
+
+    @abstractmethod
+    def save(self, workbook) -> None:
+        ...
+
+    @abstractmethod
+    def close(self, workbook) -> None:
+        ...
+
+    @abstractmethod
+    def quit(self) -> None:
+        ...
+
+
+class ComExcelDriver(ExcelDriver):
+    """Excel over win32com, Windows with Excel installed only"""
+
+    def __init__(self):
+        self._excel = None
+
+    def start(self) -> None:
+        import pythoncom
+        import win32com.client as win32
+        pythoncom.CoInitialize()
+        self._excel = win32.gencache.EnsureDispatch('Excel.Application')
+        self._excel.DisplayAlerts = False
+
+    def open(self, path: str):
+        return self._excel.Workbooks.Open(path)
+
+    def autofit(self, workbook) -> None:
+        for sheet in workbook.Worksheets:
+            sheet.Columns.AutoFit()
+
+    def refresh(self, workbook) -> None:
+        workbook.RefreshAll()
+        #RefreshAll returns before background queries finish
+        self._excel.CalculateUntilAsyncQueriesDone()
+
+    def save(self, workbook) -> None:
+        workbook.Save()
+
+    def close(self, workbook) -> None:
+        workbook.Close(False)
+
+    def quit(self) -> None:
+        import pythoncom
+        try:
+            self._excel.Application.Quit()
+        finally:
+            self._excel = None
+            pythoncom.CoUninitialize()
+
+
+class FakeExcelDriver(ExcelDriver):
+    """Records every call as a tuple in `calls`. Raises RuntimeError on the
+    operations listed in `fail_on` (e.g. [("refresh", "a.xlsx")]), once each,
+    to stand in for an Excel crash."""
+
+    def __init__(self, calls: list = None, fail_on: list = None):
+        self.calls = [] if calls is None else calls
+        self.fail_on = list(fail_on or [])
+
+    def _record(self, *call) -> None:
+        self.calls.append(call)
+        if call in self.fail_on:
+            self.fail_on.remove(call)
+            raise RuntimeError(f"Excel crashed during {call}")
+
+    def start(self) -> None:
+        self._record("start")
+
+    def open(self, path: str):
+        self._record("open", path)
+        return path
+
+    def autofit(self, workbook) -> None:
+        self._record("autofit", workbook)
+
+    def refresh(self, workbook) -> None:
+        self._record("refresh", workbook)
+
+    def save(self, workbook) -> None:
+        self._record("save", workbook)
+
+    def close(self, workbook) -> None:
+        self._record("close", workbook)
+
+    def quit(self) -> None:
+        self._record("quit")
+
+
+class ExcelSession:
+    """Queue of workbook operations run on one Excel process.
+
+    `queue` can be called from any thread; the operations for a workbook are
+    merged, so a file queued twice is opened once. `flush` (and `close`, which
+    also quits Excel) runs them on the calling thread in the order the
+    workbooks were first queued: open, the operations, save, close. If Excel
+    fails on a workbook it is quit, a new one is started from `driver_factory`
+    and the workbook is retried, up to `max_restarts` times per workbook. A
+    workbook that still fails is recorded in `failed` and the next one runs;
+    flush raises once every workbook has had its turn.
+    """
+
+    OPERATIONS = ("autofit", "refresh")
+
+    def __init__(self, driver_factory=ComExcelDriver, max_restarts: int = 2):
+        self.driver_factory = driver_factory
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.failed = {}
+        self._driver = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def queue(self, path: str, *operations: str) -> None:
+        unknown = set(operations) - set(self.OPERATIONS)
+        if unknown:
+            raise ValueError(f"Unknown Excel operation(s) {sorted(unknown)}, expected {self.OPERATIONS}")
+        with self._lock:
+            pending = self._pending.setdefault(path, [])
+            pending.extend(operation for operation in operations if operation not in pending)
+
+    def _driver_started(self) -> ExcelDriver:
+        if self._driver is None:
+            driver = self.driver_factory()
+            driver.start()
+            self._driver = driver
+        return self._driver
+
+    def _discard_driver(self) -> None:
+        driver, self._driver = self._driver, None
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _run(self, path: str, operations: list) -> None:
+        driver = self._driver_started()
+        workbook = driver.open(path)
+        for operation in operations:
+            getattr(driver, operation)(workbook)
+        driver.save(workbook)
+        driver.close(workbook)
+
+    def flush(self) -> None:
+        """Runs every queued operation, then raises RuntimeError naming the workbooks
+        Excel kept failing on, if any"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        failed = {}
+        for path, operations in pending.items():
+            #Every workbook gets its own restarts, one bad file cannot use them up for the rest
+            restarts = 0
+            while True:
+                try:
+                    self._run(path, operations)
+                    break
+                except Exception as e:
+                    self._discard_driver()
+                    if restarts >= self.max_restarts:
+                        print(f"Excel failed on {path} ({e}), giving up on it")
+                        failed[path] = e
+                        break
+                    restarts += 1
+                    self.restarts += 1
+                    print(f"Excel failed on {path} ({e}), restarting it")
+        self.failed.update(failed)
+        if failed:
+            last_error = list(failed.values())[-1]
+            raise RuntimeError(f"Excel failed on {len(failed)} workbook(s): {', '.join(failed)}") from last_error
+
+    def close(self) -> None:
+        """Flushes the queue and quits Excel if it was started"""
+        try:
+            self.flush()
+        finally:
+            self._discard_driver()
+
+
+excel_session = ExcelSession()
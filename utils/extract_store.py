@@ -0,0 +1,259 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+import pandas as pd
+from database.query_log import query_log
+from environment.settings import config
+from utils.month_planner import is_closed, months_between
+
+
+@lru_cache(maxsize=None)
+def fingerprint(fetch_fn) -> str:
+    """Short hash of an extractor's source, so editing its query invalidates its partitions.
+    The source of its range mode (`fetch_range`) counts too, and an extractor that
+    builds its query from a config table sets it as `query_config`."""
+    try:
+        source = inspect.getsource(fetch_fn).encode()
+    except (OSError, TypeError):
+        code = fetch_fn.__code__
+        source = code.co_code + repr(code.co_consts).encode()
+    if hasattr(fetch_fn, "fetch_range"):
+        source += fingerprint(fetch_fn.fetch_range).encode()
+    if hasattr(fetch_fn, "query_config"):
+        source += repr(fetch_fn.query_config).encode()
+    return hashlib.sha1(source).hexdigest()[:12]
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """Hash of a frame's columns, dtypes and values, None when the values cannot be hashed"""
+    try:
+        values = pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+    except TypeError:
+        return None
+    layout = repr([(name, str(dtype)) for name, dtype in df.dtypes.items()]).encode()
+    return hashlib.sha1(layout + values).hexdigest()
+
+
+class ExtractStore:
+    """Month-partitioned Parquet store of extractor results.
+
+    Every (report, extractor, year, month) frame is one file,
+    {root}/{report}/{extractor}-{fingerprint}/year={year}/month={month}/part.parquet,
+    listed in a manifest.json next to the partitions with its row count,
+    content hash and when SQL last returned it. Closed months are served from
+    the store, open months are refetched, and a refetched partition is only
+    rewritten when its content hash changed. Partitions SQL has not confirmed
+    for `ttl_days` are refetched, and `evict` removes them from disk. With
+    `refresh` set every month is refetched once per run.
+
+    `read` loads a range of stored months, only opening the partitions in the
+    range and pushing column selection and row filters down to the Parquet
+    reader, so later steps reuse the extract instead of going back to SQL.
+    """
+
+    def __init__(self, root: str, ttl_days: int, enabled: bool = True, refresh: bool = False):
+        self.root = root
+        self.ttl_days = ttl_days
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.unchanged = 0
+        self._manifests = {}
+        #Partitions SQL returned during this run, reusable even when open or refreshing
+        self._current = set()
+        self._lock = threading.Lock()
+
+    def folder_for(self, fetch_fn) -> str:
+        report = fetch_fn.__module__.rsplit(".", 1)[-1]
+        return os.path.join(self.root, report, f"{fetch_fn.__name__}-{fingerprint(fetch_fn)}")
+
+    def path_for(self, fetch_fn, year: int, month: int) -> str:
+        return os.path.join(self.folder_for(fetch_fn), f"year={year}", f"month={month:02}", "part.parquet")
+
+    def _manifest(self, folder: str) -> dict:
+        """Partition entries of an extractor folder keyed by "YYYY-MM", loaded once per run"""
+        if folder not in self._manifests:
+            try:
+                with open(os.path.join(folder, "manifest.json")) as f:
+                    self._manifests[folder] = json.load(f)["partitions"]
+            except (OSError, ValueError, KeyError):
+                self._manifests[folder] = {}
+        return self._manifests[folder]
+
+    def _save_manifest(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "manifest.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"partitions": dict(sorted(self._manifests[folder].items()))}, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def _is_fresh(self, entry: dict) -> bool:
+        checked = datetime.fromisoformat(entry["checked"])
+        return datetime.now() - checked <= timedelta(days=self.ttl_days)
+
+    def has(self, fetch_fn, year: int, month: int) -> bool:
+        """Whether the month can be served from the store without going to SQL"""
+        if not self.enabled:
+            return False
+        folder = self.folder_for(fetch_fn)
+        with self._lock:
+            entry = self._manifest(folder).get(f"{year}-{month:02}")
+            if entry is None or not os.path.exists(self.path_for(fetch_fn, year, month)):
+                return False
+            if (folder, year, month) in self._current:
+                return True
+            return is_closed(year, month) and not self.refresh and self._is_fresh(entry)
+
+    def missing(self, fetch_fn, months: list) -> list:
+        """The (year, month) pairs of `months` that still have to come from SQL"""
+        return [(year, month) for year, month in months if not self.has(fetch_fn, year, month)]
+
+    def fetch(self, fetch_fn, year: int, month: int) -> pd.DataFrame:
+        """Returns fetch_fn(year, month), from the store when the month is closed and stored"""
+        if not self.enabled:
+            return fetch_fn(year, month)
+        path = self.path_for(fetch_fn, year, month)
+        if self.has(fetch_fn, year, month):
+            try:
+                df = pd.read_parquet(path)
+                self._count("hits")
+                return df
+            except Exception as e:
+                print(f"Ignoring unreadable partition {path}: {e}")
+        self._count("misses")
+        df = fetch_fn(year, month)
+        self.put(fetch_fn, year, month, df)
+        return df
+
+    def fetch_range(self, fetch_fn, months: list) -> list:
+        """fetch for each of `months`, for an extractor with a range mode: `fetch_fn.fetch_range(start, end)`
+        returns every month from start to end with the month in its Referencedate column.
+        The months that have to come from SQL are fetched in one range query and split
+        into their partitions, the others are served from the store."""
+        todo = sorted(self.missing(fetch_fn, months) if self.enabled else months)
+        frames = {}
+        if todo:
+            with query_log.months(todo[0], todo[-1]):
+                df = fetch_fn.fetch_range(todo[0], todo[-1])
+            reference = pd.to_datetime(df["Referencedate"]) if "Referencedate" in df else None
+            for year, month in months_between(todo[0], todo[-1]):
+                if reference is None:
+                    #Nothing to split on, the month keeps the result's columns and dtypes
+                    part = df.iloc[0:0]
+                else:
+                    part = df[(reference.dt.year == year) & (reference.dt.month == month)].reset_index(drop=True)
+                frames[(year, month)] = part
+                if self.enabled:
+                    self._count("misses")
+                    self.put(fetch_fn, year, month, part)
+        return [frames[month] if month in frames else self.fetch(fetch_fn, *month) for month in months]
+
+    def put(self, fetch_fn, year: int, month: int, df: pd.DataFrame) -> bool:
+        """Stores one month, rewriting the partition only if its content changed"""
+        folder = self.folder_for(fetch_fn)
+        path = self.path_for(fetch_fn, year, month)
+        key = f"{year}-{month:02}"
+        digest = content_hash(df)
+        with self._lock:
+            entry = self._manifest(folder).get(key)
+        unchanged = (digest is not None and entry is not None
+                     and entry["hash"] == digest and os.path.exists(path))
+        if not unchanged and not self._write(df, path):
+            return False
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            written = entry["written"] if unchanged else now
+            self._manifest(folder)[key] = {"rows": len(df), "hash": digest, "written": written, "checked": now}
+            self._save_manifest(folder)
+            self._current.add((folder, year, month))
+            if unchanged:
+                self.unchanged += 1
+            else:
+                self.written += 1
+        return True
+
+    def _write(self, df: pd.DataFrame, path: str) -> bool:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #Write next to the target and rename, so readers never see half a file.
+        #The dot prefix keeps Parquet dataset readers from picking it up
+        tmp_path = os.path.join(os.path.dirname(path), f".part.{threading.get_ident()}.tmp")
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            #Mixed-type object columns cannot be written, the month is simply not stored
+            print(f"Could not store {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def read(self, fetch_fn, months: list, columns: list = None, filters=None) -> pd.DataFrame:
+        """Reads stored months into one DataFrame, in the order given.
+
+        Only the partitions of `months` are opened. `columns` and `filters`
+        (pyarrow filters, e.g. [("species", "==", "Cat")]) are applied by the
+        Parquet reader, so unused columns and row groups are never decoded.
+        Raises KeyError for a month that is not stored.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        folder = self.folder_for(fetch_fn)
+        tables = []
+        for year, month in months:
+            with self._lock:
+                if f"{year}-{month:02}" not in self._manifest(folder):
+                    raise KeyError(f"{fetch_fn.__name__} {year}-{month:02} is not in the extract store")
+            tables.append(pq.read_table(self.path_for(fetch_fn, year, month), columns=columns,
+                                        filters=filters, partitioning=None))
+        if not tables:
+            return pd.DataFrame(columns=columns)
+        #Empty months are stored without types, let the typed partitions decide
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def reset(self) -> None:
+        """Zeroes the counters summary() reports, at the start of every run of a process.
+        Partitions fetched from SQL earlier in the process stay reusable"""
+        with self._lock:
+            self.hits = self.misses = self.written = self.unchanged = 0
+
+    def evict(self) -> int:
+        """Deletes partitions SQL has not confirmed within the TTL and returns how many were removed"""
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for folder, _, files in os.walk(self.root):
+            if "manifest.json" not in files:
+                continue
+            with self._lock:
+                partitions = self._manifest(folder)
+                stale = [key for key, entry in partitions.items() if not self._is_fresh(entry)]
+                for key in stale:
+                    year, month = key.split("-")
+                    path = os.path.join(folder, f"year={year}", f"month={month}", "part.parquet")
+                    if os.path.exists(path):
+                        os.remove(path)
+                    del partitions[key]
+                    removed += 1
+                if stale:
+                    self._save_manifest(folder)
+        return removed
+
+    def summary(self) -> str:
+        return (f"Extract store: {self.hits} hits, {self.misses} fetched from SQL "
+                f"({self.written} partitions written, {self.unchanged} unchanged)")
+
+
+store = ExtractStore(root=f"{config.SERVER_PATH}/extracts", ttl_days=config.CACHE_TTL_DAYS,
+                     enabled=config.CACHE_ENABLED)
@@ -0,0 +1,119 @@
+"""Which reporting months a run fetches.
+
+A month is closed once the calendar has moved past it. A report for
+`report_year` covers the months up to its end month: December for past
+years, otherwise the current (still open) month, except in January, when the
+current year has nothing closed yet and the report covers the year just
+ended. A report reading `years` years starts in January of the year
+`years - 1` before its end month's year.
+
+"Current" is as_of(): today, or the RUN_DATE main.py sets to re-run a past
+period. Whether a month is closed, which decides what the extract store may
+keep, always follows the real calendar.
+
+Every report declares what it reads with `month_needs(report_year)`, a list of
+(extractor, months) pairs. MonthPlan merges the needs of the reports in a run
+into one schedule with each (extractor, year, month) once, which
+utils.utils.run_plan fetches into the extract store ahead of the reports.
+"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from environment.settings import config
+
+
+def as_of() -> datetime:
+    """The date the reports are run as of, RUN_DATE when set and otherwise now"""
+    if config.RUN_DATE is not None:
+        return datetime.combine(config.RUN_DATE, datetime.min.time())
+    return datetime.today()
+
+
+def set_run_date(run_date: date = None) -> None:
+    """Runs the reports as of run_date (None for today), in this process and in
+    the worker processes the runner starts after this call"""
+    config.RUN_DATE = run_date
+    if run_date is None:
+        os.environ.pop("RUN_DATE", None)
+    else:
+        os.environ["RUN_DATE"] = run_date.isoformat()
+
+
+def is_closed(year: int, month: int, today: datetime = None) -> bool:
+    """A reporting month is closed once the calendar has moved past it"""
+    today = today or datetime.today()
+    return (year, month) < (today.year, today.month)
+
+
+def months_between(start: tuple, end: tuple) -> list:
+    """(year, month) pairs from start to end inclusive, e.g. months_between((2024, 11), (2025, 2))"""
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(index // 12, index % 12 + 1) for index in range(first, last + 1)]
+
+
+def report_end(report_year: int, today: datetime = None) -> tuple:
+    """Last (year, month) a report for report_year covers"""
+    today = today or as_of()
+    if report_year < today.year:
+        return report_year, 12
+    if today.month == 1:
+        return today.year - 1, 12
+    return today.year, today.month
+
+
+def report_months(report_year: int, years: int = 1, today: datetime = None) -> list:
+    """(year, month) pairs of a report reading `years` calendar years up to its end month"""
+    end = report_end(report_year, today)
+    return months_between((end[0] - years + 1, 1), end)
+
+
+def last_closed_months(count: int, today: datetime = None) -> tuple:
+    """(start, end) of the `count` closed months before the current one"""
+    today = today or as_of()
+    end = today.year * 12 + today.month - 2
+    start = end - count + 1
+    return (start // 12, start % 12 + 1), (end // 12, end % 12 + 1)
+
+
+@dataclass(frozen=True)
+class MonthTask:
+    """One extractor month of a run's schedule"""
+    fetch_fn: object
+    year: int
+    month: int
+    closed: bool
+
+
+class MonthPlan:
+    """De-duplicated (extractor, year, month) schedule for the reports of a run"""
+
+    def __init__(self, today: datetime = None):
+        self.today = today or datetime.today()
+        self.requested = 0
+        #Extractor -> set of (year, month), extractors kept in the order they were added
+        self._months = {}
+
+    def add(self, fetch_fn, months: list) -> None:
+        self.requested += len(months)
+        self._months.setdefault(fetch_fn, set()).update(months)
+
+    def add_report(self, report, report_year: int) -> None:
+        """Adds the needs a report module declares with month_needs(report_year)"""
+        for fetch_fn, months in report.month_needs(report_year):
+            self.add(fetch_fn, months)
+
+    def by_extractor(self) -> list:
+        """(extractor, months) pairs, months in calendar order"""
+        return [(fetch_fn, sorted(months)) for fetch_fn, months in self._months.items()]
+
+    @property
+    def tasks(self) -> list:
+        return [MonthTask(fetch_fn, year, month, is_closed(year, month, self.today))
+                for fetch_fn, months in self.by_extractor() for year, month in months]
+
+    def summary(self) -> str:
+        tasks = self.tasks
+        closed = sum(task.closed for task in tasks)
+        return (f"Month plan: {len(tasks)} extractor months for {len(self._months)} extractors "
+                f"({closed} closed, {len(tasks) - closed} open), {self.requested} requested by the reports")
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+from environment.settings import config
+from utils.extract_store import content_hash
+
+
+def frames_hash(frames) -> str:
+    """Hash of a DataFrame or a dict of sheet name -> DataFrame, None if any frame cannot be hashed"""
+    if isinstance(frames, pd.DataFrame):
+        frames = {"": frames}
+    parts = []
+    for name, df in frames.items():
+        digest = content_hash(df)
+        if digest is None:
+            return None
+        parts.append(f"{name}:{digest}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+class OutputManifest:
+    """Content hashes of the frames behind every file a run writes.
+
+    `write_if_changed` hashes the frames (values and dtypes) before writing and
+    skips the write when the file exists and was last written from the same
+    content, so unchanged reports are neither rewritten nor refreshed. Hashes
+    are kept in a JSON manifest between runs, per file and, for a dict of
+    sheets, per set of sheet names, so reports writing their own sheets into
+    one workbook are tracked apart. With `force` set every file is written.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, force: bool = False):
+        self.path = path
+        self.enabled = enabled
+        self.force = force
+        self.written = []
+        self.skipped = []
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def write_if_changed(self, path: str, frames, write, also: list = ()) -> bool:
+        """Calls write() unless `path` already holds `frames`, returns whether it wrote.
+        `also` lists other files write() produces, all of which must exist to skip"""
+        digest = frames_hash(frames) if self.enabled else None
+        key = os.path.abspath(path)
+        if isinstance(frames, dict):
+            #Reports sharing a workbook each write their own sheets, every set keeps its own hash
+            key = f"{key}|{','.join(map(str, frames))}"
+        with self._lock:
+            entry = self._load().get(key)
+        if (digest is not None and not self.force and entry is not None
+                and entry["hash"] == digest and all(map(os.path.exists, [path, *also]))):
+            with self._lock:
+                self.skipped.append(path)
+            return False
+        write()
+        with self._lock:
+            self.written.append(path)
+            if digest is not None:
+                self._load()[key] = {"hash": digest, "written": datetime.now().isoformat(timespec="seconds")}
+                self._save()
+        return True
+
+    def reset(self) -> None:
+        """Forgets the files written and skipped, at the start of every run of a process"""
+        with self._lock:
+            self.written = []
+            self.skipped = []
+
+    def summary(self) -> str:
+        lines = [f"Outputs: {len(self.written)} written, {len(self.skipped)} unchanged and skipped"]
+        lines.extend(f"  skipped {path}" for path in self.skipped)
+        return "\n".join(lines)
+
+
+outputs = OutputManifest(f"{config.SERVER_PATH}/logs/output_manifest.json",
+                         enabled=config.OUTPUT_SKIP_UNCHANGED)
@@ -0,0 +1,208 @@
+"""Runs the reports as one graph of steps instead of one report after another.
+
+Each report module declares `steps(report_year)`, a list of Step: a function,
+the lane it runs in and the steps it depends on. DagRunner starts every step
+as soon as its dependencies are done, so independent reports overlap:
+
+- "sql" steps (extracts) run on a thread pool, they mostly wait on the server
+  or read the extract store;
+- "cpu" steps (pandas transforms) run on a process pool, so they are not held
+  back by the GIL. Their functions and inputs are pickled, so they must be
+  module-level (or functools.partial of one) and must not write files;
+- "excel" steps (every xlsx/parquet write and dashboard refresh) run one at a
+  time on a single thread, in the order they become ready.
+
+The results of the steps listed in `needs` are passed as keyword arguments,
+named after the step or mapped with a dict ({"df": "yearly"}). `after` only
+orders: the step waits for those to finish, whatever their outcome, which is
+how steps that mutate a shared frame or write the same file are kept apart.
+`after` may name a step of another report as "report.step" and is ignored if
+that report is not part of the run.
+
+A failed step skips the steps that need its result, the other reports carry
+on. summary() gives the wall time of every report and the time spent per lane.
+"""
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from time import perf_counter
+from environment.settings import config
+
+LANES = ("sql", "cpu", "excel")
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    lane: str
+    fn: object
+    needs: object = ()
+    after: tuple = ()
+
+    def __post_init__(self):
+        if self.lane not in LANES:
+            raise ValueError(f"Step {self.name} has lane {self.lane!r}, expected one of {LANES}")
+        #Keyword -> step name, whether needs was given as names or as a mapping
+        needs = self.needs if isinstance(self.needs, dict) else {name: name for name in self.needs}
+        object.__setattr__(self, "needs", needs)
+
+
+@dataclass
+class StepRun:
+    report: str
+    step: Step
+    status: str = "pending"
+    submitted: float = None
+    finished: float = None
+    seconds: float = 0.0
+    error: str = None
+    result: object = field(default=None, repr=False)
+
+
+def _timed_call(fn, kwargs):
+    """Runs in the lane's worker, so the time excludes the wait for a free worker"""
+    start = perf_counter()
+    result = fn(**kwargs)
+    return result, perf_counter() - start
+
+
+def run_steps(steps: list) -> dict:
+    """Runs one report's steps in the calling thread, in the order given, and returns their results.
+    Errors are raised as they are, like the reports did before they had steps."""
+    results = {}
+    for step in steps:
+        missing = [name for name in step.needs.values() if name not in results]
+        if missing:
+            raise ValueError(f"Step {step.name} needs {missing}, which must be listed before it")
+        results[step.name] = step.fn(**{key: results[name] for key, name in step.needs.items()})
+    return results
+
+
+class DagRunner:
+    """Runs the steps of several reports concurrently, one lane per kind of work"""
+
+    def __init__(self, sql_workers: int = None, cpu_workers: int = None):
+        self.sql_workers = sql_workers or config.RUNNER_SQL_WORKERS
+        #0 runs the cpu steps on threads, e.g. where starting processes costs more than it saves
+        self.cpu_workers = config.RUNNER_CPU_WORKERS if cpu_workers is None else cpu_workers
+        self.runs = {}
+        self.wall = 0.0
+
+    def add(self, report: str, steps: list) -> None:
+        names = {step.name for step in steps}
+        for step in steps:
+            unknown = set(step.needs.values()) - names
+            if unknown:
+                raise ValueError(f"{report}.{step.name} needs unknown step(s) {sorted(unknown)}")
+            self.runs[(report, step.name)] = StepRun(report, step)
+
+    def _after_keys(self, run: StepRun) -> list:
+        keys = []
+        for name in run.step.after:
+            report, _, step = name.rpartition(".")
+            key = (report or run.report, step)
+            if key in self.runs:
+                keys.append(key)
+        return keys
+
+    def _pools(self) -> dict:
+        uses_cpu = any(run.step.lane == "cpu" for run in self.runs.values())
+        if uses_cpu and self.cpu_workers > 0:
+            #spawn everywhere, as on Windows, rather than forking a process that holds connections
+            cpu_pool = ProcessPoolExecutor(self.cpu_workers, mp_context=get_context("spawn"))
+        else:
+            cpu_pool = ThreadPoolExecutor(max(self.cpu_workers, 1), thread_name_prefix="cpu")
+        return {"sql": ThreadPoolExecutor(self.sql_workers, thread_name_prefix="sql"),
+                "cpu": cpu_pool,
+                "excel": ThreadPoolExecutor(1, thread_name_prefix="excel")}
+
+    def run(self) -> list:
+        """Runs every step added and returns the runs that failed"""
+        start = perf_counter()
+        consumers = {key: 0 for key in self.runs}
+        for run in self.runs.values():
+            for name in run.step.needs.values():
+                consumers[(run.report, name)] += 1
+        pending = list(self.runs)
+        running = {}
+        pools = self._pools()
+
+        def release(run: StepRun) -> None:
+            #Frames are dropped once every step that needs them has finished
+            for name in run.step.needs.values():
+                key = (run.report, name)
+                consumers[key] -= 1
+                if consumers[key] == 0:
+                    self.runs[key].result = None
+
+        try:
+            while pending or running:
+                skipped = False
+                for key in list(pending):
+                    run = self.runs[key]
+                    needs = [self.runs[(run.report, name)] for name in run.step.needs.values()]
+                    if any(need.status in ("failed", "skipped") for need in needs):
+                        run.status = "skipped"
+                        run.error = "needs " + ", ".join(need.step.name for need in needs
+                                                         if need.status in ("failed", "skipped"))
+                        pending.remove(key)
+                        release(run)
+                        skipped = True
+                        continue
+                    if (any(need.status != "done" for need in needs)
+                            or any(self.runs[after].status in ("pending", "running")
+                                   for after in self._after_keys(run))):
+                        continue
+                    kwargs = {keyword: self.runs[(run.report, name)].result
+                              for keyword, name in run.step.needs.items()}
+                    run.status = "running"
+                    run.submitted = perf_counter() - start
+                    running[pools[run.step.lane].submit(_timed_call, run.step.fn, kwargs)] = key
+                    pending.remove(key)
+                if not running:
+                    if skipped:
+                        continue
+                    if pending:
+                        raise ValueError(f"Steps wait on each other and can never start: {pending}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    run = self.runs[running.pop(future)]
+                    run.finished = perf_counter() - start
+                    try:
+                        run.result, run.seconds = future.result()
+                        run.status = "done"
+                    except Exception as e:
+                        run.status = "failed"
+                        run.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                        print(f"{run.report}.{run.step.name} failed: {run.error}")
+                    release(run)
+                    if consumers[(run.report, run.step.name)] == 0:
+                        run.result = None
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+        self.wall = perf_counter() - start
+        return [run for run in self.runs.values() if run.status == "failed"]
+
+    def summary(self) -> str:
+        reports = {}
+        for run in self.runs.values():
+            reports.setdefault(run.report, []).append(run)
+        lines = [f"{'Report':<24}{'wall':>8}{'sql':>8}{'cpu':>8}{'excel':>8}  status"]
+        walls = {}
+        for report, runs in reports.items():
+            ran = [run for run in runs if run.finished is not None]
+            walls[report] = (max(run.finished for run in ran) - min(run.submitted for run in ran)) if ran else 0.0
+            lanes = {lane: sum(run.seconds for run in runs if run.step.lane == lane) for lane in LANES}
+            failed = [run for run in runs if run.status == "failed"]
+            skipped = [run for run in runs if run.status == "skipped"]
+            status = "ok" if not failed and not skipped else f"{len(failed)} failed, {len(skipped)} skipped"
+            lines.append(f"{report:<24}{walls[report]:>7.1f}s" + "".join(f"{lanes[lane]:>7.1f}s" for lane in LANES) + f"  {status}")
+            lines.extend(f"  {run.step.name} {run.status}: {run.error}" for run in failed + skipped)
+        step_time = sum(run.seconds for run in self.runs.values())
+        slowest = max(walls, key=walls.get, default=None)
+        lines.append(f"Run took {self.wall:.1f}s for {step_time:.1f}s of steps"
+                     + (f", slowest report {slowest} {walls[slowest]:.1f}s" if slowest else ""))
+        return "\n".join(lines)
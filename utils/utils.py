@@ -1,69 +1,278 @@
-import win32com.client as win32
+import numbers
+import os
+import sys
 import pandas as pd
-from datetime import datetime
-
-def update_dashboard(dashboard_path:str):
-    """Updates dashboard, adds Numerator and Denominator data to Dashboard Sheet"""
-    excel=win32.gencache.EnsureDispatch('Excel.Application')
-    wb = excel.Workbooks.Open(dashboard_path)
-    #Refresh Dashboard with new data
-    wb.RefreshAll()
-    wb.Save()
-    excel.Application.Quit()
+from concurrent.futures import ThreadPoolExecutor
+from database.query_log import query_log
+from utils.extract_store import store
+from utils.month_planner import months_between
+from datetime import date, datetime
+from environment.settings import config
+from utils.excel import column_widths
+from utils.dashboard import refresh_dashboard
+from utils.excel_session import excel_session
+from utils.output_manifest import outputs
+from utils.concurrency import report_slots, report_worker_cap
+
+def update_dashboard(dashboard_path:str, sheets: dict):
+    """Updates dashboard, writes the report's frames (sheet name -> DataFrame) into its data
+    sheets with openpyxl, see utils.dashboard. Pivots on those sheets refresh when it is opened,
+    Excel refreshes its Power Query connections at the end of the run (EXCEL_REFRESH)"""
+    #Same data as the last run, the dashboard already shows it
+    if not outputs.write_if_changed(dashboard_path, sheets, lambda: refresh_dashboard(dashboard_path, sheets)):
+        print(f"Dashboard unchanged, skipped {dashboard_path}")
+        return
+    #Pivots fed by Power Query or workbook connections only see new data once Excel refreshes
+    #them, and Excel is only there on Windows. Elsewhere (the stand-in) only the data sheets change
+    if config.EXCEL_REFRESH and sys.platform == "win32":
+        #Runs with the other queued workbooks when run_all closes the Excel session
+        excel_session.queue(dashboard_path, "refresh")
+    print(f"Dashboard updated at {dashboard_path}")
     return
 
 def save_to_excel(numerator, denominator, path: str) -> None :
-    '''Saves dataframe to Server and autofits columns'''
-    #Saves Sheets to Excel
-    writer = pd.ExcelWriter(path, engine = 'xlsxwriter')
-    denominator.to_excel(writer, header=True, index=False, sheet_name = 'Denominator')
-    numerator.to_excel(writer, header=True, index=False, sheet_name = 'Numerator')
-    writer.close()  
-    #Autofit Column width
-    excel = win32.gencache.EnsureDispatch('Excel.Application')
-    wb = excel.Workbooks.Open(path)
-    denom = wb.Worksheets("Denominator")
-    num= wb.Worksheets("Numerator")
-    denom.Columns.AutoFit()
-    num.Columns.AutoFit()
-    wb.Save()
-    excel.Application.Quit()
+    '''Saves dataframe to Server with the columns fitted to their contents'''
+    #Streams the sheets row by row, column widths are set during the write
+    stream_to_excel(path, {'Denominator': denominator, 'Numerator': numerator})
     print("Report file saved to server.")
     return
 
-def combined_df(fetch_fn, start_year: int, end_year: int) -> pd.DataFrame:
+def _bi_column(column: pd.Series):
+    """Arrow array of one Power BI column with a type that only depends on the column's kind"""
+    import pyarrow as pa
+    if isinstance(column.dtype, pd.PeriodDtype):
+        #Months as their first day, Power BI has no period type
+        column = column.dt.to_timestamp()
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(object)
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pa.array(column.dt.tz_localize(None) if column.dt.tz else column, type=pa.timestamp("ms"))
+    if pd.api.types.is_bool_dtype(column):
+        return pa.array(column, type=pa.bool_(), from_pandas=True)
+    if pd.api.types.is_integer_dtype(column):
+        return pa.array(column, type=pa.int64(), from_pandas=True)
+    if pd.api.types.is_numeric_dtype(column):
+        #Integers that NaN padding rows turned into floats stay integers, like in object columns
+        if (column.dropna() % 1 == 0).all():
+            return pa.array(column.astype("Int64"), type=pa.int64(), from_pandas=True)
+        return pa.array(column, type=pa.float64(), from_pandas=True)
+    values = column.dropna()
+    first = values.iloc[0] if len(values) else None
+    if isinstance(first, datetime):
+        return _bi_column(pd.to_datetime(column))
+    if isinstance(first, numbers.Number) and not isinstance(first, bool):
+        #Numbers left in an object column by padding rows, integers stay integers
+        numeric = pd.to_numeric(column, errors="coerce")
+        if numeric.notna().sum() == len(values):
+            integral = (numeric.dropna() % 1 == 0).all()
+            return _bi_column(numeric.astype("Int64") if integral else numeric)
+    if isinstance(first, date):
+        return pa.array(column, type=pa.date32(), from_pandas=True)
+    return pa.array(column.where(column.isna(), column.astype(str)), type=pa.string(), from_pandas=True)
+
+def save_bi_data(path: str, sheets) -> None:
+    """
+    Writes a Power BI feed: the xlsx workbook at path for people, and with BI_PARQUET
+    a typed Parquet file per sheet next to it (name.parquet, or name_<sheet>.parquet
+    when there are several sheets) for the dashboards.
+
+    The Parquet column types follow the kind of data, not the run: integers are int64,
+    also when missing values made them float or object, other numbers float64, dates date32, datetimes and Period months timestamp[ms]
+    (month start) and everything else string, so Power BI never re-guesses types.
     """
-    Build a combined DataFrame for all available months and years using a data-fetching function.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if isinstance(sheets, pd.DataFrame):
+        sheets = {'Sheet1': sheets}
+    stem = os.path.splitext(path)[0]
+    parquet_paths = {}
+    if config.BI_PARQUET:
+        parquet_paths = {sheet_name: f"{stem}.parquet" if len(sheets) == 1 else f"{stem}_{sheet_name}.parquet"
+                         for sheet_name in sheets}
+
+    def write():
+        with pd.ExcelWriter(path) as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        for sheet_name, parquet_path in parquet_paths.items():
+            df = sheets[sheet_name]
+            pq.write_table(pa.table({str(name): _bi_column(df[name]) for name in df.columns}), parquet_path)
+
+    outputs.write_if_changed(path, sheets, write, also=list(parquet_paths.values()))
+
+def save_frame(df: pd.DataFrame, path: str, **kwargs) -> None:
+    """df.to_excel(path, **kwargs), skipped when the file already holds the same data"""
+    outputs.write_if_changed(path, df, lambda: df.to_excel(path, **kwargs))
+
+def _frame_chunks(frames, chunksize: int):
+    """Yields a DataFrame in slices of chunksize rows, or passes an iterable of frames through"""
+    if isinstance(frames, pd.DataFrame):
+        for start in range(0, max(len(frames), 1), chunksize):
+            yield frames.iloc[start:start + chunksize]
+    else:
+        yield from frames
+
+def _column_cells(column: pd.Series, formats: dict) -> tuple:
+    """Python values of one chunk column for xlsxwriter, missing values as None, and the cell format"""
+    cells = column.astype(object).where(column.notna(), None).tolist()
+    if pd.api.types.is_datetime64_any_dtype(column):
+        #Days kept as datetime64 (no time of day anywhere) are shown as dates
+        days = column.dropna()
+        return cells, formats["date"] if len(days) and (days == days.dt.normalize()).all() else formats["datetime"]
+    first = next((value for value in cells if value is not None), None)
+    if isinstance(first, datetime):
+        return cells, formats["datetime"]
+    if isinstance(first, date):
+        return cells, formats["date"]
+    return cells, None
+
+def stream_to_excel(path: str, sheets: dict, chunksize: int = None) -> int:
+    """
+    Writes sheets to an xlsx file with xlsxwriter's constant_memory mode, which flushes
+    every row to disk once the next one starts, so memory stays flat however many rows
+    are written. Returns the number of data rows written, 0 when every sheet is a
+    DataFrame and the file already holds the same data (see utils.output_manifest).
+
+    Args:
+        path (str): Workbook to create.
+        sheets (dict): Sheet name -> DataFrame, or any iterable of DataFrames with the same
+            columns (e.g. database.ms_sql_connection.stream_query) written one after another.
+        chunksize (int): Rows converted at a time when a sheet is a single DataFrame,
+            FETCH_CHUNK_SIZE by default.
+
+    Column widths are fitted to the first chunk of each sheet, dates and datetimes get
+    the formats pandas' to_excel uses.
+    """
+    if all(isinstance(frames, pd.DataFrame) for frames in sheets.values()):
+        written = []
+        outputs.write_if_changed(path, sheets, lambda: written.append(_stream_workbook(path, sheets, chunksize)))
+        return sum(written)
+    #Generators can only be read once, they are always written
+    return _stream_workbook(path, sheets, chunksize)
+
+def _stream_workbook(path: str, sheets: dict, chunksize: int = None) -> int:
+    import xlsxwriter
+    chunksize = chunksize or config.FETCH_CHUNK_SIZE
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    formats = {"datetime": workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+               "date": workbook.add_format({"num_format": "yyyy-mm-dd"})}
+    #Same header style as DataFrame.to_excel
+    header = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    total = 0
+    try:
+        for sheet_name, frames in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            row = 0
+            for chunk in _frame_chunks(frames, chunksize):
+                if row == 0:
+                    for position, width in enumerate(column_widths(chunk)):
+                        worksheet.set_column(position, position, width)
+                    worksheet.write_row(0, 0, [str(name) for name in chunk.columns], header)
+                    row = 1
+                columns = [_column_cells(chunk.iloc[:, position], formats) for position in range(chunk.shape[1])]
+                cell_formats = [cell_format for _, cell_format in columns]
+                #constant_memory only keeps the current row, so rows go out strictly in order
+                for values in zip(*(cells for cells, _ in columns)):
+                    for position, value in enumerate(values):
+                        worksheet.write(row, position, value, cell_formats[position])
+                    row += 1
+                total += len(chunk)
+        return total
+    finally:
+        workbook.close()
+
+def fetch_months(fetch_fn, months: list, max_workers: int = None) -> list:
+    """Fetches each (year, month) through the extract store and returns the frames in order.
+    See combined_df for max_workers."""
+    report = fetch_fn.__module__
+
+    def fetch_month(year_month):
+        year, month = year_month
+        print(year, month)
+        #Counts against the report's cap even when the cap is lowered mid-run
+        with report_slots.slot(report), query_log.months(year_month, year_month):
+            df = store.fetch(fetch_fn, year, month)
+        print(f"Data extracted for year: {year}, month: {month}")
+        return df
+
+    if hasattr(fetch_fn, "fetch_range") and len(months) > 1:
+        #One query for every month the store lacks, see ExtractStore.fetch_range
+        with report_slots.slot(report):
+            frames = store.fetch_range(fetch_fn, months)
+        print(f"Data extracted for {months[0][0]}-{months[0][1]:02} to {months[-1][0]}-{months[-1][1]:02}")
+        return frames
+
+    workers = min(max_workers or report_worker_cap(), report_worker_cap(), max(len(months), 1))
+    if workers == 1:
+        return [fetch_month(year_month) for year_month in months]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="month") as pool:
+        #map yields in submission order, so the result matches the sequential path
+        return list(pool.map(fetch_month, months))
+
+def combined_df(fetch_fn, months: list, max_workers: int = None) -> pd.DataFrame:
+    """
+    Build a combined DataFrame for a list of months using a data-fetching function.
+    Closed months are served from the extract store, only open months hit SQL.
+    When fetch_fn has a range mode (a `fetch_range(start, end)` attribute) the months
+    that go to SQL are fetched in one query instead of one query per month.
 
     Args:
         fetch_fn (callable): Function that takes (year, month) and returns a pandas DataFrame.
-        start_year (int): First year (inclusive).
-        end_year (int): Last year (inclusive).
+        months (list): (year, month) pairs, normally utils.month_planner.report_months(...).
+        max_workers (int): Months fetched at once, each on its own pooled connection.
+            Never more than the report's cap (REPORT_MAX_WORKERS, BUSINESS_HOURS_MAX_WORKERS
+            during business hours), which is also the default. 1 fetches one month at a time.
 
     Returns:
-        pd.DataFrame: Combined DataFrame for all valid (year, month) combinations.
+        pd.DataFrame: Combined DataFrame for all the months, in the order given.
+    """
+    return pd.concat(fetch_months(fetch_fn, months, max_workers), ignore_index=True)
+
+def run_plan(plan, max_workers: int = None) -> None:
+    """
+    Fetches every extractor month of a utils.month_planner.MonthPlan into the extract
+    store, so the reports' own combined_df and read_months calls are served from it
+    and no extractor month goes to SQL twice in a run.
+    """
+    print(plan.summary())
+    if not store.enabled:
+        #Nothing would be kept for the reports, they fetch their own months
+        print("Extract store disabled, skipping the month plan")
+        return
+    def fetch_extractor(fetch_fn, months):
+        try:
+            fetch_months(fetch_fn, months, max_workers)
+        except Exception as e:
+            #The reports that need this extractor refetch it in their own steps and fail
+            #there, inside the runner, so the other reports still run
+            print(f"Month plan: {fetch_fn.__module__}.{fetch_fn.__name__} failed: {e}")
+
+    extractors = plan.by_extractor()
+    #Extractors side by side, no more than the connection pool holds; each one's months
+    #still count against its report's slots inside fetch_months
+    workers = min(max_workers or config.DB_POOL_SIZE, config.DB_POOL_SIZE, max(len(extractors), 1))
+    if workers == 1:
+        for fetch_fn, months in extractors:
+            fetch_extractor(fetch_fn, months)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan") as pool:
+        for future in [pool.submit(fetch_extractor, fetch_fn, months) for fetch_fn, months in extractors]:
+            future.result()
+
+def read_months(fetch_fn, start: tuple, end: tuple, columns: list = None) -> pd.DataFrame:
+    """
+    Reads the months start..end of an extractor from the extract store, e.g. the
+    Power BI window after combined_df has pulled the current year. Only months the
+    store lacks go to SQL, and only the partitions in the range are opened, with
+    `columns` pushed down to the Parquet reader (see ExtractStore.read).
     """
-    frames = []
-    current_year = datetime.today().year
-    current_month = datetime.today().month
-
-    for year in range(start_year, end_year + 1):
-        if year>current_year:
-            break
-        for month in range(1, 13):
-            print(year, month)
-            # Skip future months of the current year
-            if year == current_year and month > current_month:
-                break
-
-            # Handle December report (when current_month == January)
-            if current_month == 1 and year == current_year:
-                for prev_month in range(1, 13):
-                    frames.append(fetch_fn(year - 1, prev_month))
-                break  # after filling December data, stop for this year
-
-            # Normal case
-            frames.append(fetch_fn(year, month))
-            print(f"Data extracted for year: {year}, month: {month}")
-
-    return pd.concat(frames, ignore_index=True)
\ No newline at end of file
+    months = months_between(start, end)
+    missing = store.missing(fetch_fn, months)
+    fetched = dict(zip(missing, fetch_months(fetch_fn, missing)))
+    if not store.missing(fetch_fn, months):
+        return store.read(fetch_fn, months, columns)
+    #Store disabled or a month could not be written: the months just fetched are used as
+    #they are, the others come from their partitions
+    frames = [fetched[month] if month in fetched else store.fetch(fetch_fn, *month) for month in months]
+    df = pd.concat(frames, ignore_index=True)
+    return df if columns is None else df[columns]